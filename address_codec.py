@@ -0,0 +1,106 @@
+from functools import lru_cache
+import hashlib
+
+# Bytes-in/bytes-out address encoding:
+#   hash160(data)                 RIPEMD160(SHA256(data)) over raw bytes
+#   b58encode / b58decode         Base58 that keeps leading zero bytes as '1's
+#   b58check_encode / _decode     version byte + payload + 4-byte double-SHA256 checksum
+#   encode_address / decode_address  P2PKH addresses from a 20-byte pubkey hash
+# Encoding converts the whole value to one int and peels off ten base-58 digits per
+# divmod, instead of a digit at a time.
+
+ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+DECODE_MAP = {char: i for i, char in enumerate(ALPHABET)}
+P2PKH_VERSION = 0x00
+
+_CHUNK_DIGITS = 10
+_CHUNK = 58 ** _CHUNK_DIGITS
+# Two-digit strings for 0..58*58-1, so a chunk expands two digits per divmod
+_PAIRS = [a + b for a in ALPHABET for b in ALPHABET]
+
+def hash160(data):
+    return hashlib.new('ripemd160', hashlib.sha256(data).digest()).digest()
+
+@lru_cache(maxsize=65536)
+def hash160_hex(hex_string):
+    # hash160 of the bytes a hex string encodes (e.g. a public key), as hex. Cached,
+    # since the same keys are hashed for every output they own and input they sign.
+    return hash160(bytes.fromhex(hex_string)).hex()
+
+def _encode_chunk(value, width):
+    # `width` base-58 digits of value (< 58**width), most significant first.
+    digits = []
+    for _ in range(width // 2):
+        value, pair = divmod(value, 58 * 58)
+        digits.append(_PAIRS[pair])
+    if width % 2:
+        digits.append(ALPHABET[value % 58])
+    return "".join(reversed(digits))
+
+def b58encode(data):
+    stripped = data.lstrip(b"\0")
+    zeros = len(data) - len(stripped)
+    value = int.from_bytes(stripped, "big")
+    chunks = []
+    while value >= _CHUNK:
+        value, chunk = divmod(value, _CHUNK)
+        chunks.append(_encode_chunk(chunk, _CHUNK_DIGITS))
+    head = _encode_chunk(value, _CHUNK_DIGITS).lstrip("1") if value else ""
+    return "1" * zeros + head + "".join(reversed(chunks))
+
+def b58decode(text):
+    stripped = text.lstrip("1")
+    zeros = len(text) - len(stripped)
+    value = 0
+    try:
+        for i in range(0, len(stripped), _CHUNK_DIGITS):
+            part = stripped[i:i + _CHUNK_DIGITS]
+            chunk = 0
+            for char in part:
+                chunk = chunk * 58 + DECODE_MAP[char]
+            value = value * 58 ** len(part) + chunk
+    except KeyError as error:
+        raise ValueError(f"Invalid Base58 character {error.args[0]!r}")
+    body = value.to_bytes((value.bit_length() + 7) // 8, "big") if value else b""
+    return b"\0" * zeros + body
+
+def checksum(data):
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()[:4]
+
+def b58check_encode(payload, version=P2PKH_VERSION):
+    data = bytes([version]) + payload
+    return b58encode(data + checksum(data))
+
+def b58check_decode(text):
+    # Returns (version, payload); raises ValueError on a bad checksum or length.
+    data = b58decode(text)
+    if len(data) < 5:
+        raise ValueError("Base58Check string too short")
+    body, check = data[:-4], data[-4:]
+    if checksum(body) != check:
+        raise ValueError("Base58Check checksum mismatch")
+    return body[0], body[1:]
+
+@lru_cache(maxsize=65536)
+def encode_address(pub_key_hash, version=P2PKH_VERSION):
+    # Address for a pubkey hash given as 20 bytes or 40 hex characters.
+    if isinstance(pub_key_hash, str):
+        pub_key_hash = bytes.fromhex(pub_key_hash)
+    return b58check_encode(pub_key_hash, version)
+
+@lru_cache(maxsize=65536)
+def decode_address(address):
+    # Returns (version, pubkey hash bytes).
+    version, payload = b58check_decode(address)
+    if len(payload) != 20:
+        raise ValueError(f"Address payload is {len(payload)} bytes, expected 20")
+    return version, payload
+
+def encode_addresses(pub_key_hashes, version=P2PKH_VERSION):
+    return [encode_address(h, version) for h in pub_key_hashes]
+
+def decode_addresses(addresses):
+    return [decode_address(a) for a in addresses]
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,384 @@
+import os
+
+from harness import benchmark
+
+import helpers
+import address_codec
+import transaction_data
+import block_data
+from utxo_set import UtxoSet
+from script_engine import ScriptEngine
+import script_engine
+from consensus import ConsensusMechanism
+from pow_mechanism import ProofOfWork
+import miner_node
+from metrics import Histogram
+from node_mailbox import Mailbox
+from seen_filter import SeenCache
+
+UTXO_SIZES = (1000, 10000, 100000, ('full', 1000000))
+BATCH = 1000
+
+_KEYS = None
+
+def get_keys():
+    # Key generation is slow, so all benchmarks share one key pair.
+    global _KEYS
+    if _KEYS is None:
+        _KEYS = helpers.generate_key_pair()
+    return _KEYS
+
+def random_hash():
+    return os.urandom(32).hex()
+
+class FakeTxn:
+    # Minimal stand-in exposing what UtxoSet reads from a transaction.
+    def __init__(self, num_outputs=2):
+        self.transaction_id = random_hash()
+        self.outputs = [None] * num_outputs
+
+def sample_txn(num_inputs=2, num_outputs=2):
+    keys = get_keys()
+    inputs = []
+    for i in range(num_inputs):
+        txid = random_hash()
+        signature_script = helpers.generate_signature_script(keys, txid)
+        inputs.append(transaction_data.TxnInput(txid, i, signature_script))
+    locking_script = helpers.generate_pub_key_script(keys['public'])
+    outputs = [transaction_data.TxnOutput(10 + i, locking_script) for i in range(num_outputs)]
+    return transaction_data.Txn(inputs, outputs)
+
+@benchmark("double_sha256", ops=BATCH)
+def bench_double_sha256(param, repeat):
+    header = random_hash() * 2 + "03" + "0000a1b2"
+    def run():
+        for _ in range(BATCH):
+            helpers.compute_double_sha256(header)
+    return run
+
+@benchmark("txn_serialize", ops=BATCH)
+def bench_txn_serialize(param, repeat):
+    txn = sample_txn()
+    def run():
+        for _ in range(BATCH):
+            txn.serialize()
+    return run
+
+@benchmark("txn_calculate_id", ops=BATCH)
+def bench_txn_calculate_id(param, repeat):
+    txn = sample_txn()
+    def run():
+        for _ in range(BATCH):
+            txn.calculate_id()
+    return run
+
+@benchmark("merkle_root", params=(2, 3, 4, 8, 16), ops=100)
+def bench_merkle_root(arity, repeat):
+    hashes = [random_hash() for _ in range(256)]
+    def run():
+        for _ in range(100):
+            # compute_merkle_root pads the list in place
+            helpers.compute_merkle_root(list(hashes), arity)
+    return run
+
+@benchmark("script_p2pkh", ops=20)
+def bench_script_p2pkh(param, repeat):
+    keys = get_keys()
+    message = random_hash()
+    signature_script = helpers.generate_signature_script(keys, message)
+    locking_script = helpers.generate_pub_key_script(keys['public'])
+    def run():
+        for _ in range(20):
+            ScriptEngine.execute_p2pkh(signature_script, locking_script, message)
+    return run
+
+@benchmark("script_verify", params=('p2pkh', 'multisig', 'multisig_interpreted', 'compile'), ops=20)
+def bench_script_verify(case, repeat):
+    # Script checks through ScriptEngine.verify: a full P2PKH script and a 2-of-3
+    # multisig on their fast paths, the same multisig forced through the general
+    # interpreter, and ('compile') parsing of uncached locking scripts alone.
+    keys = [get_keys()] + [helpers.generate_key_pair() for _ in range(2)]
+    message = random_hash()
+    if case == 'p2pkh':
+        locking_script = script_engine.p2pkh_script(helpers.generate_pub_key_script(keys[0]['public']))
+        unlocking = bytes.fromhex(helpers.generate_push_signature_script(keys[0], message))
+    else:
+        locking_script = script_engine.multisig_script(2, [k['public'] for k in keys])
+        unlocking = bytes.fromhex(helpers.generate_multisig_signature_script(keys[1:], message))
+    locking_ops = script_engine.compile_script(locking_script).ops
+    def run():
+        for _ in range(20):
+            if case == 'multisig_interpreted':
+                ScriptEngine.interpret(script_engine.parse_script(unlocking), locking_ops, message.encode())
+            elif case == 'compile':
+                script_engine.compile_script.cache_clear()
+                script_engine.compile_script(locking_script)
+            else:
+                ScriptEngine.verify(unlocking, locking_script, message)
+    return run
+
+@benchmark("hash160_pubkey", params=('cold', 'cached'), ops=BATCH)
+def bench_hash160_pubkey(case, repeat):
+    public_keys = [os.urandom(64).hex() for _ in range(BATCH)]
+    if case == 'cached':
+        # Warm the cache here, since the harness has no warm-up pass
+        for public_key in public_keys:
+            helpers.compute_hash160(public_key)
+    def run():
+        if case == 'cold':
+            address_codec.hash160_hex.cache_clear()
+        for public_key in public_keys:
+            helpers.compute_hash160(public_key)
+    return run
+
+@benchmark("address_encode", ops=BATCH)
+def bench_address_encode(param, repeat):
+    batches = iter([[os.urandom(20) for _ in range(BATCH)] for _ in range(repeat)])
+    def run():
+        for pub_key_hash in next(batches):
+            address_codec.b58check_encode(pub_key_hash)
+    return run
+
+@benchmark("address_decode", ops=BATCH)
+def bench_address_decode(param, repeat):
+    addresses = [address_codec.b58check_encode(os.urandom(20)) for _ in range(BATCH)]
+    def run():
+        for address in addresses:
+            address_codec.b58check_decode(address)
+    return run
+
+@benchmark("histogram_observe", ops=BATCH)
+def bench_histogram_observe(param, repeat):
+    histogram = Histogram("bench_seconds")
+    values = [i * 1.7e-5 for i in range(BATCH)]
+    def run():
+        for value in values:
+            histogram.observe(value)
+    return run
+
+def filled_utxo_set(size):
+    utxo_set = UtxoSet()
+    txns = [FakeTxn() for _ in range(size)]
+    for txn in txns:
+        utxo_set.add_transaction(txn)
+    return utxo_set, txns
+
+@benchmark("utxo_add", params=UTXO_SIZES, ops=BATCH)
+def bench_utxo_add(size, repeat):
+    utxo_set, _ = filled_utxo_set(size)
+    batches = iter([[FakeTxn() for _ in range(BATCH)] for _ in range(repeat)])
+    def run():
+        for txn in next(batches):
+            utxo_set.add_transaction(txn)
+    return run
+
+@benchmark("utxo_has", params=UTXO_SIZES, ops=BATCH)
+def bench_utxo_has(size, repeat):
+    utxo_set, txns = filled_utxo_set(size)
+    probes = [txns[i * (size // BATCH)].transaction_id for i in range(BATCH)]
+    def run():
+        for txid in probes:
+            utxo_set.has_output(txid, 1)
+    return run
+
+@benchmark("utxo_remove", params=UTXO_SIZES, ops=BATCH)
+def bench_utxo_remove(size, repeat):
+    utxo_set, txns = filled_utxo_set(size + BATCH * repeat)
+    batches = iter([txns[i * BATCH:(i + 1) * BATCH] for i in range(repeat)])
+    def run():
+        for txn in next(batches):
+            utxo_set.remove_output(txn.transaction_id, 0)
+            utxo_set.remove_transaction(txn)
+    return run
+
+MAILBOXES = 8
+
+@benchmark("mailbox_fanout", params=('single', 'batch'), ops=BATCH)
+def bench_mailbox_fanout(mode, repeat):
+    # BATCH messages broadcast to MAILBOXES mailboxes, one put per message ('single') or
+    # put_many per ten ('batch'), then each mailbox drained by its consumer.
+    messages = [("txn", i) for i in range(BATCH)]
+    def run():
+        mailboxes = [Mailbox() for _ in range(MAILBOXES)]
+        if mode == 'single':
+            for message in messages:
+                for mailbox in mailboxes:
+                    mailbox.put(message)
+        else:
+            for i in range(0, BATCH, 10):
+                for mailbox in mailboxes:
+                    mailbox.put_many(messages[i:i + 10])
+        for mailbox in mailboxes:
+            mailbox.drain()
+    return run
+
+@benchmark("seen_cache", params=('add', 'hit_recent', 'hit_filter', 'miss'), ops=BATCH)
+def bench_seen_cache(case, repeat):
+    # BATCH adds, or lookups of hashes in the exact recent set, only in the Bloom
+    # filter, or never added.
+    hashes = [random_hash() for _ in range(BATCH)]
+    cache = SeenCache()
+    if case != 'miss':
+        cache.add_many(hashes)
+    if case == 'hit_filter':
+        cache.recent.clear()
+    def run():
+        if case == 'add':
+            for h in hashes:
+                cache.filter.add(h)
+        else:
+            for h in hashes:
+                cache.seen(h)
+    return run
+
+DUPLICATE_COPIES = 10
+
+@benchmark("relay_duplicates", params=('fresh', 'duplicate'), ops=BATCH)
+def bench_relay_duplicates(case, repeat):
+    # A node taking BATCH transaction messages off its queue: all distinct ('fresh'),
+    # or BATCH / DUPLICATE_COPIES transactions each delivered DUPLICATE_COPIES times.
+    distinct = BATCH if case == 'fresh' else BATCH // DUPLICATE_COPIES
+    txns = [sample_txn() for _ in range(distinct)]
+    messages = [("txn", txns[i % distinct]) for i in range(BATCH)]
+    def run():
+        node = miner_node.Miner(keys=get_keys())
+        for msg_type, msg in messages:
+            node.handle_message(msg_type, msg)
+    return run
+
+def make_header_block(previous_hash):
+    block = block_data.MinedBlock([], previous_hash)
+    block.block_hash = random_hash()
+    return block
+
+@benchmark("consensus_add_block", params=(100, 400, 800), ops=1)
+def bench_consensus_add_block(length, repeat):
+    consensus = ConsensusMechanism(orphan_threshold=3)
+    tip = make_header_block("0" * 64)
+    consensus.add_block(tip)
+    for _ in range(length):
+        tip = make_header_block(tip.block_hash)
+        consensus.add_block(tip)
+
+    pending = []
+    for _ in range(repeat):
+        tip = make_header_block(tip.block_hash)
+        pending.append(tip)
+    pending = iter(pending)
+
+    def run():
+        consensus.add_block(next(pending))
+    return run
+
+@benchmark("consensus_collect_garbage", params=(0, 10, 50), ops=1)
+def bench_consensus_collect_garbage(forks, repeat):
+    # A 1000-block chain with `forks` stale two-block side branches spread along it; each
+    # repeat collects a fresh copy, so the timed pass always has every branch to free.
+    trees = []
+    for _ in range(repeat):
+        consensus = ConsensusMechanism(orphan_threshold=3)
+        tip = make_header_block("0" * 64)
+        consensus.add_block(tip)
+        for height in range(1, 1001):
+            if forks and height % (1000 // forks) == 0:
+                side = make_header_block(tip.block_hash)
+                consensus.add_block(side)
+                consensus.add_block(make_header_block(side.block_hash))
+            tip = make_header_block(tip.block_hash)
+            consensus.add_block(tip)
+        trees.append(consensus)
+    trees = iter(trees)
+
+    def run():
+        next(trees).collect_garbage()
+    return run
+
+def chain_of(previous_hash, coinbases):
+    blocks = []
+    for coinbase in coinbases:
+        block = block_data.MinedBlock([coinbase], previous_hash)
+        block.block_hash = random_hash()
+        blocks.append(block)
+        previous_hash = block.block_hash
+    return blocks
+
+@benchmark("reorg", params=(1, 2, 4, 8), ops=1)
+def bench_reorg(depth, repeat):
+    # Each repeat gets its own ledger whose main chain is `depth` blocks past a fork point
+    # above genesis and a side branch that overtakes it with the final (timed) block.
+    keys = get_keys()
+    ledgers = []
+    for _ in range(repeat):
+        ledger = miner_node.Miner().ledger
+        genesis = block_data.MinedBlock.generate_genesis(transaction_data.Txn.create_coinbase_txn(keys))
+        genesis.block_hash = random_hash()
+        ledger.append_block(genesis, is_genesis=True)
+
+        coinbases = [transaction_data.Txn.create_coinbase_txn(keys) for _ in range(2 * depth + 2)]
+        fork_point = chain_of(genesis.block_hash, coinbases[:1])[0]
+        ledger.integrate_block(fork_point)
+        for block in chain_of(fork_point.block_hash, coinbases[1:depth + 1]):
+            ledger.integrate_block(block)
+        side = chain_of(fork_point.block_hash, coinbases[depth + 1:])
+        for block in side[:-1]:
+            ledger.integrate_block(block)
+        ledgers.append((ledger, side[-1]))
+    ledgers = iter(ledgers)
+
+    def run():
+        ledger, block = next(ledgers)
+        ledger.integrate_block(block)
+    return run
+
+VALIDATION_TXNS = 20
+
+def mined_block(transactions, previous_hash):
+    block = block_data.MinedBlock(transactions, previous_hash)
+    worker = ProofOfWork(block)
+    nonce = 0
+    result = worker.mine(nonce)
+    while isinstance(result, int):
+        nonce = result
+        result = worker.mine(nonce)
+    block.nonce = result.nonce
+    block.block_hash = result.block_hash
+    return block
+
+@benchmark("validate_block", params=('valid', 'mempool_verified', 'bad_coinbase', 'double_spend'), ops=1)
+def bench_validate_block(case, repeat):
+    # check_block on a block spending VALIDATION_TXNS outputs; the invalid cases should
+    # be rejected in the structure stage, before any signature is checked.
+    keys = get_keys()
+    locking_script = helpers.generate_pub_key_script(keys['public'])
+    ledger = miner_node.Miner().ledger
+    funding = transaction_data.Txn(
+        [transaction_data.TxnInput("0" * 64, -1, "")],
+        [transaction_data.TxnOutput(10, locking_script) for _ in range(VALIDATION_TXNS)])
+    genesis = block_data.MinedBlock.generate_genesis(transaction_data.Txn.create_coinbase_txn(keys))
+    genesis.update_block_info("0" * 64, genesis.transactions + [funding], 0)
+    genesis.block_hash = random_hash()
+    ledger.append_block(genesis, is_genesis=True)
+
+    signature_script = helpers.generate_signature_script(keys, funding.transaction_id)
+    spends = []
+    for i in range(VALIDATION_TXNS):
+        spent = i if case != 'double_spend' or i < VALIDATION_TXNS - 1 else 0
+        spends.append(transaction_data.Txn(
+            [transaction_data.TxnInput(funding.transaction_id, spent, signature_script)],
+            [transaction_data.TxnOutput(10, locking_script)]))
+    coinbase = transaction_data.Txn.create_coinbase_txn(keys)
+    if case == 'bad_coinbase':
+        coinbase.outputs.append(transaction_data.TxnOutput(1, locking_script))
+        coinbase.transaction_id = coinbase.calculate_id()
+    block = mined_block([coinbase] + spends, genesis.block_hash)
+
+    def run():
+        if case == 'mempool_verified':
+            for txn in spends:
+                ledger.remember_verified(txn)
+        if ledger.check_block(block) != (case in ('valid', 'mempool_verified')):
+            raise RuntimeError(f"Unexpected validation result for {case}")
+    return run
+
+if __name__ == '__main__':
+    pass
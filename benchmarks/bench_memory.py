@@ -0,0 +1,152 @@
+import os
+import random
+import tracemalloc
+
+from harness import benchmark
+
+import codec
+import block_data
+from transaction_data import Txn
+from txn_input import TxnInput
+from txn_output import TxnOutput
+from utxo_set import UtxoSet
+from consensus import ConsensusMechanism
+from persistent_utxo import SHARED_VERSIONS
+from p2p_network import PeerNetwork
+import settings
+import simulation
+import helpers
+import transaction_data
+import miner_node
+import chain_sync
+from spv_client import LightClient
+
+COUNT = 2000
+BLOCK_TXNS = 10
+ADDRESSES = 100
+NODES = 8
+BLOCKS = 50
+CHAIN = 20
+
+def random_hex(num_bytes):
+    return os.urandom(num_bytes).hex()
+
+def encoded_txns(count):
+    # 2-in/2-out payments between ADDRESSES wallets, encoded the way the block store and
+    # snapshots hold them. Scripts have real sizes (signature + pubkey, pubkey hash).
+    rng = random.Random(7)
+    scripts = [random_hex(20) for _ in range(ADDRESSES)]
+    encoded = []
+    for _ in range(count):
+        inputs = [TxnInput(random_hex(32), i, random_hex(128)) for i in range(2)]
+        outputs = [TxnOutput(rng.randint(1, 100), rng.choice(scripts)) for _ in range(2)]
+        encoded.append(codec.encode_txn(Txn(inputs, outputs)))
+    return encoded
+
+def traced(build):
+    # Bytes still allocated after build() returns, with its result kept alive.
+    tracemalloc.start()
+    try:
+        result = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return size, result
+
+def make_blocks(txns):
+    blocks = []
+    previous_hash = "0" * 64
+    for i in range(0, len(txns), BLOCK_TXNS):
+        block = block_data.MinedBlock(txns[i:i + BLOCK_TXNS], previous_hash)
+        block.block_hash = random_hex(32)
+        blocks.append(codec.encode_block(block))
+        previous_hash = block.block_hash
+    return blocks
+
+@benchmark("memory_footprint", memory=True)
+def bench_memory_footprint(param, repeat):
+    # Resident bytes per decoded transaction, per unspent output held in a UtxoSet (on
+    # top of the transactions themselves) and per block connected into the block tree.
+    encoded = encoded_txns(COUNT)
+    encoded_blocks = make_blocks([codec.decode_txn(data) for data in encoded])
+
+    def run():
+        txn_size, txns = traced(lambda: [codec.decode_txn(data) for data in encoded])
+
+        def fill():
+            utxo_set = UtxoSet()
+            for txn in txns:
+                utxo_set.add_transaction(txn)
+            return utxo_set
+        utxo_size, utxo_set = traced(fill)
+
+        def connect():
+            consensus = ConsensusMechanism(orphan_threshold=3)
+            for data in encoded_blocks:
+                consensus.add_block(codec.decode_block(data))
+            return consensus
+        block_size, consensus = traced(connect)
+        return {
+            'txn_bytes': txn_size / len(txns),
+            'utxo_output_bytes': utxo_size / utxo_set.size,
+            'block_bytes': block_size / len(encoded_blocks),
+        }
+    return run
+
+@benchmark("memory_utxo_nodes", params=('trie', 'persistent'), memory=True)
+def bench_memory_utxo_nodes(backend, repeat):
+    # UTXO state held by NODES nodes that each connect the same BLOCKS blocks (their own
+    # clones, as when received from peers), per node. With the persistent backend every
+    # node after the first reuses the shared versions.
+    simulation.setup_network(NODES, params=settings.ChainParams(UTXO_BACKEND=backend))
+    txns = [codec.decode_txn(data) for data in encoded_txns(COUNT)]
+    blocks = []
+    previous_hash = PeerNetwork.nodes[0].ledger.last_block_hash
+    for i in range(0, COUNT, COUNT // BLOCKS):
+        block = block_data.MinedBlock(txns[i:i + COUNT // BLOCKS], previous_hash)
+        block.block_hash = random_hex(32)
+        blocks.append(block)
+        previous_hash = block.block_hash
+
+    def run():
+        SHARED_VERSIONS.clear()
+        def connect():
+            for block in blocks:
+                for miner in PeerNetwork.nodes:
+                    # Only the UTXO update differs between backends; validation is skipped
+                    miner.ledger.apply_block_utxo(block.clone())
+        size, _ = traced(connect)
+        return {'utxo_node_bytes': size / NODES}
+    return run
+
+@benchmark("memory_wallet_node", params=('full', 'light'), memory=True)
+def bench_memory_wallet_node(kind, repeat):
+    # Bytes per wallet-holding node after joining a CHAIN-block network: a full Miner
+    # synced with chain_sync, or a LightClient following the same full node.
+    simulation.setup_network(1)
+    source = PeerNetwork.nodes[0]
+    for _ in range(CHAIN):
+        coinbase = transaction_data.Txn.create_coinbase_txn(source.keys)
+        source.current_block = block_data.MinedBlock([coinbase], source.ledger.last_block_hash)
+        source.perform_proof_of_work()
+    count = 5 if kind == 'full' else 200
+    keys = [helpers.generate_key_pair() for _ in range(count)]
+
+    def run():
+        def join():
+            nodes = []
+            for node_keys in keys:
+                if kind == 'full':
+                    node = miner_node.Miner(keys=node_keys)
+                    chain_sync.join_network(node, PeerNetwork)
+                else:
+                    node = LightClient(node_keys)
+                    node.connect(source)
+                nodes.append(node)
+            return nodes
+        size, _ = traced(join)
+        return {'node_bytes': size / count}
+    return run
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import threading
+import time
+
+from harness import benchmark
+
+from p2p_network import PeerNetwork, Network
+import helpers
+import settings
+import simulation
+import transaction_data
+import miner_node
+import sim_snapshot
+
+NETWORK_SIZES = (2, 4, 8)
+SNAPSHOT_NODES = 4
+SNAPSHOT_BLOCKS = 40
+PAYMENTS = 50
+# Overridden from the command line by run_benchmarks.py
+DURATION = 30
+PAYMENT_INTERVAL = 0.5
+
+def main_chain_stats(miner):
+    # Returns (blocks, transactions) on the node's current main chain, excluding genesis.
+    blocks = 0
+    txns = 0
+    current = miner.ledger.consensus.longest_chain_head
+    while current is not None and current.parent is not None:
+        blocks += 1
+        txns += len(current.block.transactions) - 1
+        current = current.parent
+    return blocks, txns
+
+@benchmark("network_setup", params=(100, 1000, ('full', 5000)), ops=1)
+def bench_network_setup(num_nodes, repeat):
+    # Stands up num_nodes nodes with seeded keys from a warm keystore cache.
+    keystore_path = os.path.join(tempfile.mkdtemp(), "keystore.json")
+    simulation.setup_network(num_nodes, key_seed="bench", keystore_path=keystore_path)
+    def run():
+        simulation.setup_network(num_nodes, key_seed="bench", keystore_path=keystore_path)
+    return run
+
+@benchmark("network_throughput", params=NETWORK_SIZES, macro=True)
+def bench_network_throughput(num_nodes, repeat):
+    # Runs a full threaded network and measures what node 0 ends up with on its main chain,
+    # plus the time nodes spent mining on an outdated tip per block found.
+    def run():
+        simulation.setup_network(num_nodes)
+        nodes = PeerNetwork.nodes
+        threads = simulation.start_miners(nodes)
+
+        start = time.perf_counter()
+        receiver = 1
+        while time.perf_counter() - start < DURATION:
+            nodes[0].send_message(("new_txn", (nodes[receiver].pub_key_hash, 1)))
+            receiver = receiver % (num_nodes - 1) + 1
+            time.sleep(PAYMENT_INTERVAL)
+        elapsed = time.perf_counter() - start
+
+        simulation.stop_miners(nodes, threads, timeout=10)
+        blocks, txns = main_chain_stats(nodes[0])
+        found = sum(miner.blocks_mined.value for miner in nodes)
+        stale = sum(miner.stale_work.value for miner in nodes)
+        return {'blocks_per_sec': blocks / elapsed, 'txns_per_sec': txns / elapsed,
+                'stale_per_block_seconds': stale / max(1, found)}
+    return run
+
+def build_chain(network, num_nodes, num_blocks, params):
+    # Sets up `network` with nodes that connected num_blocks blocks, each carrying one payment.
+    simulation.setup_network(num_nodes, key_seed="bench", network=network, params=params)
+    nodes = network.nodes
+    for i in range(num_blocks):
+        miner = nodes[i % num_nodes]
+        miner.process_message_queue()
+        miner.create_transaction(nodes[(i + 1) % num_nodes].pub_key_hash, 1)
+        coinbase = transaction_data.Txn.create_coinbase_txn(miner.keys, params.MINING_REWARD)
+        miner.current_block = miner.build_block_template(coinbase)
+        miner.perform_proof_of_work()
+    for miner in nodes:
+        miner.process_message_queue()
+    return nodes
+
+@benchmark("snapshot_restore", params=('restore', 'replay'), ops=1)
+def bench_snapshot_restore(mode, repeat):
+    # Brings SNAPSHOT_NODES nodes back to a SNAPSHOT_BLOCKS-block chain, either by loading
+    # a whole-network snapshot or by replaying (validating) every block into fresh nodes.
+    params = settings.ChainParams(BITS=1)
+    network = Network(params)
+    nodes = build_chain(network, SNAPSHOT_NODES, SNAPSHOT_BLOCKS, params)
+    main_chain = []
+    current = nodes[0].ledger.consensus.longest_chain_head
+    while current is not None:
+        main_chain.append(current.block)
+        current = current.parent
+    main_chain.reverse()
+    path = os.path.join(tempfile.mkdtemp(), "network.snap")
+    sim_snapshot.save(path, network)
+    keys = [miner.keys for miner in nodes]
+
+    def run():
+        if mode == 'restore':
+            sim_snapshot.load(path, Network())
+            return
+        for node_keys in keys:
+            miner = miner_node.Miner(keys=node_keys, network=Network(params))
+            miner.store_genesis_block(main_chain[0].clone())
+            for block in main_chain[1:]:
+                miner.ledger.append_block(block.clone())
+    return run
+
+@benchmark("create_payments", params=('each', 'batch_txns', 'batch_outputs'), ops=PAYMENTS)
+def bench_create_payments(mode, repeat):
+    # PAYMENTS payments from one funded node: create_transaction per payment ('each'), one
+    # create_transactions batch ('batch_txns') or one many-output transaction ('batch_outputs').
+    params = settings.ChainParams(MINING_REWARD=10 * PAYMENTS)
+    keys = helpers.generate_key_pair()
+    payees = [os.urandom(20).hex() for _ in range(PAYMENTS)]
+    payments = [(payee, 1) for payee in payees]
+    miners = []
+    for _ in range(repeat):
+        miner = miner_node.Miner(keys=keys, network=Network(params))
+        genesis = miner_node.Miner.generate_genesis_block(keys, params)
+        miner.store_genesis_block(genesis)
+        miner.receive_transaction_id((genesis.transactions[0].transaction_id, 0))
+        miners.append(miner)
+    miners = iter(miners)
+
+    def run():
+        miner = next(miners)
+        if mode == 'each':
+            for payee, amount in payments:
+                miner.create_transaction(payee, amount)
+        elif mode == 'batch_txns':
+            miner.create_transactions(payments)
+        else:
+            miner.create_batch_payment(payments)
+    return run
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,134 @@
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Benchmarks run from the repository checkout, where the simulator modules are top-level.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+BENCHMARKS = []
+
+class Benchmark:
+    # A named benchmark run once per parameter value.
+    # factory(param, repeat) performs all setup and returns a run() callable that is timed.
+    # Micro benchmarks execute `ops` operations per run() and are reported as ops/sec.
+    # Macro benchmarks return a dict of rate metrics from run() instead.
+    # Memory benchmarks return a dict of `*_bytes` footprints from run() and run once.
+    def __init__(self, name, factory, params, ops=1, macro=False, memory=False):
+        self.name = name
+        self.factory = factory
+        self.params = params
+        self.ops = ops
+        self.macro = macro
+        self.memory = memory
+
+    def result_key(self, param):
+        return self.name if param is None else f"{self.name}[{param}]"
+
+def benchmark(name, params=(None,), ops=1, macro=False, memory=False):
+    # Decorator registering a benchmark factory.
+    def register(factory):
+        BENCHMARKS.append(Benchmark(name, factory, list(params), ops, macro, memory))
+        return factory
+    return register
+
+def run_benchmark(bench, param, repeat):
+    # Runs one benchmark/parameter pair and returns its result record.
+    with contextlib.redirect_stdout(io.StringIO()):
+        run = bench.factory(param, repeat)
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            value = run()
+            elapsed = time.perf_counter() - start
+            samples.append(value if bench.macro or bench.memory else elapsed)
+
+    if bench.memory:
+        return {'kind': 'memory', 'metrics': samples[0]}
+    if bench.macro:
+        metrics = {}
+        for key in samples[0]:
+            metrics[key] = statistics.median(s[key] for s in samples)
+        return {'kind': 'macro', 'metrics': metrics}
+
+    best = min(samples)
+    median = statistics.median(samples)
+    return {
+        'kind': 'micro',
+        'ops': bench.ops,
+        'best_s': best,
+        'median_s': median,
+        'metrics': {'ops_per_sec': bench.ops / median if median > 0 else float('inf')},
+    }
+
+def run_all(name_filter=None, repeat=5, include_macro=False, full=False):
+    # Runs every registered benchmark matching the filter.
+    results = {}
+    for bench in BENCHMARKS:
+        if bench.macro and not include_macro:
+            continue
+        if name_filter and name_filter not in bench.name:
+            continue
+        for param in bench.params:
+            if isinstance(param, tuple) and param[0] == 'full':
+                if not full:
+                    continue
+                param = param[1]
+            key = bench.result_key(param)
+            print(f"[*] {key} ...", end=" ", flush=True)
+            results[key] = run_benchmark(bench, param, 1 if bench.macro or bench.memory else repeat)
+            print(format_metrics(results[key]['metrics']))
+    return results
+
+def format_metrics(metrics):
+    return ", ".join(f"{k}={v:,.2f}" for k, v in metrics.items())
+
+def save_results(results, path):
+    # Writes results together with enough metadata to judge comparability.
+    document = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)['results']
+
+def compare_results(results, baseline, threshold):
+    # Flags every metric that got worse by more than `threshold` (a fraction) against the
+    # baseline. Rates are better higher; `*_bytes` footprints and `*_seconds` times are
+    # better lower.
+    regressions = []
+    for key, record in sorted(results.items()):
+        if key not in baseline:
+            print(f"[+] {key}: new benchmark (no baseline)")
+            continue
+        for metric, value in record['metrics'].items():
+            old = baseline[key]['metrics'].get(metric)
+            if not old:
+                continue
+            change = (value - old) / old
+            gain = -change if metric.endswith(("_bytes", "_seconds")) else change
+            status = "OK"
+            if gain < -threshold:
+                status = "REGRESSION"
+                regressions.append((key, metric, old, value, change))
+            elif gain > threshold:
+                status = "IMPROVED"
+            print(f"[{status}] {key} {metric}: {old:,.2f} -> {value:,.2f} ({change:+.1%})")
+    return regressions
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,38 @@
+import argparse
+import sys
+
+import harness
+import bench_core
+import bench_network
+import bench_memory
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the simulator benchmark suite.")
+    parser.add_argument("-o", "--output", help="write results as JSON to this path")
+    parser.add_argument("-c", "--compare", help="baseline JSON file to compare against")
+    parser.add_argument("-t", "--threshold", type=float, default=0.10,
+                        help="fractional slowdown flagged as a regression (default 0.10)")
+    parser.add_argument("-k", "--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("--macro", action="store_true", help="also run end-to-end network benchmarks")
+    parser.add_argument("--duration", type=float, default=bench_network.DURATION,
+                        help="seconds per end-to-end network run")
+    parser.add_argument("--full", action="store_true", help="include the largest (10^6) UTXO sizes")
+    args = parser.parse_args()
+
+    bench_network.DURATION = args.duration
+    results = harness.run_all(args.filter, args.repeat, args.macro, args.full)
+
+    if args.output:
+        harness.save_results(results, args.output)
+        print(f"[#] Results written to {args.output}")
+
+    if args.compare:
+        regressions = harness.compare_results(results, harness.load_results(args.compare), args.threshold)
+        if regressions:
+            print(f"[?] {len(regressions)} regression(s) beyond {args.threshold:.0%}")
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,75 @@
-from helpers import invert_bytes, compute_merkle_root
+from helpers import invert_bytes, compute_merkle_root, compute_double_sha256
 import pow_mechanism as proof_system
 import settings
 
+def header_prefix(previous_hash, merkle_tree_root, difficulty_bits):
+    # Serialized header fields ahead of the nonce; fixed for a given block template.
+    serialized = invert_bytes(previous_hash)
+    serialized += invert_bytes(merkle_tree_root)
+
+    # Handle bits hex string
+    bits_hex = hex(difficulty_bits)[2:]
+    if len(bits_hex) % 2 != 0:
+        bits_hex = '0' + bits_hex
+    return serialized + invert_bytes(bits_hex)
+
+def serialize_nonce(nonce):
+    # Handle nonce hex string
+    nonce_hex = hex(nonce)[2:]
+    if len(nonce_hex) % 2 != 0:
+        nonce_hex = '0' + nonce_hex
+    return invert_bytes(nonce_hex)
+
+def serialize_header(previous_hash, merkle_tree_root, nonce, difficulty_bits):
+    # Serializes a block header for hashing.
+    return header_prefix(previous_hash, merkle_tree_root, difficulty_bits) + serialize_nonce(nonce)
+
+class BlockHeader:
+    # The part of a block its hash commits to. Headers are what nodes exchange first
+    # during initial sync, so the chain's linkage and work can be checked before any bodies.
+    __slots__ = ('previous_hash', 'merkle_tree_root', 'nonce', 'block_hash', 'difficulty_bits')
+
+    def __init__(self, previous_hash, merkle_tree_root, nonce, block_hash, difficulty_bits=None):
+        self.previous_hash = previous_hash
+        self.merkle_tree_root = merkle_tree_root
+        self.nonce = nonce
+        self.block_hash = block_hash
+        self.difficulty_bits = settings.BITS if difficulty_bits is None else difficulty_bits
+
+    def check_proof_of_work(self):
+        # True if the hash matches the header fields and meets the difficulty target.
+        serialized = serialize_header(self.previous_hash, self.merkle_tree_root, self.nonce, self.difficulty_bits)
+        if compute_double_sha256(serialized) != self.block_hash:
+            return False
+        return self.block_hash < proof_system.get_target(self.difficulty_bits)
+
+    def to_block(self):
+        # A body-less block standing in for this header (e.g. below a UTXO snapshot).
+        block = MinedBlock([], self.previous_hash, self.merkle_tree_root)
+        block.nonce = self.nonce
+        block.block_hash = self.block_hash
+        block.difficulty_bits = self.difficulty_bits
+        return block
+
 class MinedBlock:
     # Represents a block in the blockchain, containing transactions and metadata.
-    def __init__(self, transactions=None, previous_hash="0"*64):
+    # params: the settings.ChainParams of the network the block belongs to (None: the
+    # module settings), for its difficulty and merkle tree arity.
+    __slots__ = ('transactions', 'nonce', 'block_hash', 'previous_hash', 'difficulty_bits', 'merkle_tree_root',
+                 'params')
+
+    def __init__(self, transactions=None, previous_hash="0"*64, merkle_tree_root=None, params=None):
         if transactions is None:
             transactions = []
         self.transactions = transactions
         self.nonce = 0
         self.block_hash = ""
         self.previous_hash = previous_hash
-        self.difficulty_bits = settings.BITS
-        self.merkle_tree_root = self.calculate_merkle_root()
+        self.params = params
+        self.difficulty_bits = (settings if params is None else params).BITS
+        if merkle_tree_root is None:
+            merkle_tree_root = self.calculate_merkle_root()
+        self.merkle_tree_root = merkle_tree_root
 
     def __str__(self):
         return (f"hash: {self.block_hash}\n"
@@ -42,32 +99,24 @@ class MinedBlock:
 
     def serialize_header(self, nonce):
         # Serializes the block header for hashing.
-        serialized = invert_bytes(self.previous_hash)
-        serialized += invert_bytes(self.merkle_tree_root)
-        
-        # Handle bits hex string
-        bits_hex = hex(settings.BITS)[2:]
-        if len(bits_hex) % 2 != 0:
-            bits_hex = '0' + bits_hex
-        serialized += invert_bytes(bits_hex)
-        
-        # Handle nonce hex string
-        nonce_hex = hex(nonce)[2:]
-        if len(nonce_hex) % 2 != 0:
-            nonce_hex = '0' + nonce_hex
-        serialized += invert_bytes(nonce_hex)
-        
-        return serialized
-
-    def calculate_merkle_root(self):
-        # Calculates the Merkle root of the transactions in the block.
+        return serialize_header(self.previous_hash, self.merkle_tree_root, nonce, self.difficulty_bits)
+
+    def header(self):
+        return BlockHeader(self.previous_hash, self.merkle_tree_root, self.nonce,
+                           self.block_hash, self.difficulty_bits)
+
+    def calculate_merkle_root(self, arity=None):
+        # Calculates the Merkle root of the transactions in the block (with the block's
+        # own arity unless another is given).
+        if arity is None:
+            arity = (settings if self.params is None else self.params).MERKLE_TREE_ARITY
         txn_hashes = [txn.transaction_id for txn in self.transactions]
-        return compute_merkle_root(txn_hashes, settings.MERKLE_TREE_ARITY)
+        return compute_merkle_root(txn_hashes, arity)
 
     def clone(self):
         # Creates a deep copy of the block.
         txn_clones = [txn.clone() for txn in self.transactions]
-        new_block = MinedBlock(txn_clones, self.previous_hash)
+        new_block = MinedBlock(txn_clones, self.previous_hash, self.merkle_tree_root, self.params)
         new_block.nonce = self.nonce
         new_block.block_hash = self.block_hash
         new_block.difficulty_bits = self.difficulty_bits
@@ -75,8 +124,8 @@ class MinedBlock:
         return new_block
 
     @staticmethod
-    def generate_genesis(coinbase_txn):
+    def generate_genesis(coinbase_txn, params=None):
         # Generates the genesis block.
-        block = MinedBlock()
+        block = MinedBlock(params=params)
         block.update_block_info("0"*64, [coinbase_txn], 0)
         return block
@@ -0,0 +1,175 @@
+import mmap
+import os
+import struct
+
+import codec
+
+# On-disk layout of a store directory:
+#   blk00000.dat, blk00001.dat, ...  append-only files of [u32 length][encoded block] records
+#   index.dat                         append-only [32-byte hash][u32 file][u64 offset][u32 length]
+#   checkpoint.dat                    latest UTXO set + tip, replaced atomically
+# Block data is always written before its index entry, so after a crash any index entry
+# pointing past the end of a file is simply ignored.
+
+_LENGTH = struct.Struct("<I")
+_INDEX_ENTRY = struct.Struct("<32sIQI")
+_CHECKPOINT_HEAD = struct.Struct("<8s32sQ")
+_CHECKPOINT_MAGIC = b"UTXOCKP1"
+
+class BlockStore:
+    # Append-only block files with a hash -> (file, offset) index, read through mmap.
+    def __init__(self, directory, max_file_size=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_file_size = max_file_size
+        os.makedirs(directory, exist_ok=True)
+
+        self.index = {}
+        self.order = []
+        self.maps = {}
+        self.current_file = 0
+        self.append_handle = None
+        self.index_handle = None
+        self._load_index()
+
+    def _block_path(self, file_number):
+        return os.path.join(self.directory, f"blk{file_number:05d}.dat")
+
+    def _index_path(self):
+        return os.path.join(self.directory, "index.dat")
+
+    def _checkpoint_path(self):
+        return os.path.join(self.directory, "checkpoint.dat")
+
+    def _load_index(self):
+        path = self._index_path()
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % _INDEX_ENTRY.size
+            sizes = {}
+            for raw_hash, file_number, offset, length in _INDEX_ENTRY.iter_unpack(data[:usable]):
+                if file_number not in sizes:
+                    block_path = self._block_path(file_number)
+                    sizes[file_number] = os.path.getsize(block_path) if os.path.exists(block_path) else 0
+                if offset + length > sizes[file_number]:
+                    continue
+                block_hash = raw_hash.hex()
+                if block_hash not in self.index:
+                    self.order.append(block_hash)
+                self.index[block_hash] = (file_number, offset, length)
+                self.current_file = max(self.current_file, file_number)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, block_hash):
+        return block_hash in self.index
+
+    def _open_for_append(self):
+        if self.append_handle is None:
+            self.append_handle = open(self._block_path(self.current_file), "ab")
+            self.index_handle = open(self._index_path(), "ab")
+        if self.append_handle.tell() >= self.max_file_size:
+            self.append_handle.close()
+            self.current_file += 1
+            self.append_handle = open(self._block_path(self.current_file), "ab")
+
+    def put_block(self, block):
+        # Appends a block unless it is already stored. Returns True if it was written.
+        if block.block_hash in self.index:
+            return False
+        self._open_for_append()
+        payload = codec.encode_block(block)
+        offset = self.append_handle.tell() + _LENGTH.size
+        self.append_handle.write(_LENGTH.pack(len(payload)) + payload)
+        self.append_handle.flush()
+
+        entry = (self.current_file, offset, len(payload))
+        self.index_handle.write(_INDEX_ENTRY.pack(bytes.fromhex(block.block_hash), *entry))
+        self.index_handle.flush()
+        self.index[block.block_hash] = entry
+        self.order.append(block.block_hash)
+        return True
+
+    def _map(self, file_number, needed):
+        # Returns an mmap covering at least `needed` bytes of the file, remapping as it grows.
+        current = self.maps.get(file_number)
+        if current is None or len(current) < needed:
+            if current is not None:
+                current.close()
+            with open(self._block_path(file_number), "rb") as f:
+                current = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[file_number] = current
+        return current
+
+    def get_block(self, block_hash, verify=False):
+        # Reads a block back from disk, or returns None if it is not stored.
+        entry = self.index.get(block_hash)
+        if entry is None:
+            return None
+        file_number, offset, length = entry
+        mapped = self._map(file_number, offset + length)
+        return codec.decode_block(mapped[offset:offset + length], verify)
+
+    def iter_blocks(self, verify=False):
+        # Yields stored blocks in the order they were appended (parents before children).
+        for block_hash in self.order:
+            yield self.get_block(block_hash, verify)
+
+    def write_checkpoint(self, tip_hash, utxo_entries):
+        # Atomically replaces the checkpoint with the UTXO set as of `tip_hash`.
+        # utxo_entries: iterable of (txn, [unspent vouts]).
+        parts = []
+        count = 0
+        for txn, vouts in utxo_entries:
+            codec.encode_txn_parts(parts, txn)
+            codec.write_varint(parts, len(vouts))
+            for vout in vouts:
+                codec.write_varint(parts, vout)
+            count += 1
+
+        tmp_path = self._checkpoint_path() + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_CHECKPOINT_HEAD.pack(_CHECKPOINT_MAGIC, bytes.fromhex(tip_hash), count))
+            f.write(b"".join(parts))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._checkpoint_path())
+
+    def load_checkpoint(self):
+        # Returns (tip_hash, [(txn, [vouts]), ...]) or None if there is no valid checkpoint.
+        path = self._checkpoint_path()
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < _CHECKPOINT_HEAD.size:
+            return None
+        magic, tip, count = _CHECKPOINT_HEAD.unpack_from(data, 0)
+        if magic != _CHECKPOINT_MAGIC:
+            return None
+
+        offset = _CHECKPOINT_HEAD.size
+        entries = []
+        for _ in range(count):
+            txn, offset = codec.decode_txn_at(data, offset)
+            num_vouts, offset = codec.read_varint(data, offset)
+            vouts = []
+            for _ in range(num_vouts):
+                vout, offset = codec.read_varint(data, offset)
+                vouts.append(vout)
+            entries.append((txn, vouts))
+        return tip.hex(), entries
+
+    def close(self):
+        for handle in (self.append_handle, self.index_handle):
+            if handle is not None:
+                handle.close()
+        self.append_handle = None
+        self.index_handle = None
+        for mapped in self.maps.values():
+            mapped.close()
+        self.maps = {}
+
+if __name__ == '__main__':
+    pass
@@ -1,19 +1,81 @@
 import hashlib
 import threading
+import time
 
 from script_engine import ScriptEngine
 from consensus import ConsensusMechanism
+from utxo_view import UtxoView
+from persistent_utxo import PersistentUtxoSet, UtxoVersion, SHARED_VERSIONS
+import spv_client
 from helpers import compute_double_sha256
+import helpers
+from pow_mechanism import get_target
 import settings
+import event_log
 
 class Ledger:
     # Manages the blockchain ledger, including the UTXO set and block validation.
-    def __init__(self, utxo_set, miner_node):
+
+    # Block validation stages, cheapest first. A block is rejected at the first stage it
+    # fails, so malformed or spam blocks never reach the UTXO lookups or signature checks.
+    VALIDATION_STAGES = ('header', 'structure', 'merkle', 'inputs', 'scripts')
+
+    def __init__(self, utxo_set, miner_node, block_store=None, checkpoint_interval=100, params=None):
         self.utxo_set = utxo_set
+        # settings.ChainParams the chain is validated against
+        self.params = settings.ChainParams() if params is None else params
+        # Confirmed set plus the node's unconfirmed pool, so transactions can spend
+        # outputs of transactions that are not mined yet
+        self.mempool_view = UtxoView(utxo_set)
         self.miner_node = miner_node
+        # Optional on-disk persistence: every accepted block is appended to the store and
+        # the UTXO set is checkpointed every `checkpoint_interval` main-chain blocks.
+        self.block_store = block_store
+        self.checkpoint_interval = checkpoint_interval
+        self.blocks_since_checkpoint = 0
 
         self.last_block_hash = "0"*64
         self.consensus = ConsensusMechanism(orphan_threshold=3)
+        # Serialises chain updates against peers reading headers, blocks or snapshots
+        self.lock = threading.RLock()
+
+        metrics = miner_node.metrics
+        self.block_validation_time = metrics.histogram(
+            "block_validation_seconds", "Time spent validating a block")
+        self.script_verification_time = metrics.histogram(
+            "script_verification_seconds", "Time spent verifying one input script")
+        self.reorg_count = metrics.counter("reorgs_total", "Chain reorganizations")
+        self.reorg_depth = metrics.histogram(
+            "reorg_depth_blocks", "Blocks disconnected per reorganization", scale=1)
+        self.reinjected_txns = metrics.counter(
+            "reorg_txns_reinjected_total", "Transactions of disconnected blocks returned to the pool")
+        self.dropped_txns = metrics.counter(
+            "reorg_txns_dropped_total", "Pool transactions dropped for conflicting with a new branch")
+        self.utxo_size = metrics.gauge("utxo_set_size", "Unspent outputs in the UTXO set")
+        self.chain_height = metrics.gauge("chain_height", "Height of the main chain tip")
+        self.stage_time = {}
+        self.stage_rejections = {}
+        for stage in Ledger.VALIDATION_STAGES:
+            self.stage_time[stage] = metrics.histogram(
+                f"block_stage_{stage}_seconds", f"Time spent in the {stage} stage of block validation")
+            self.stage_rejections[stage] = metrics.counter(
+                f"blocks_rejected_{stage}_total", f"Blocks rejected at the {stage} stage")
+
+        # txid -> True for transactions whose scripts already passed on entering the mempool.
+        # A txid commits to the unlocking scripts, so the result holds when the txn is mined.
+        self.verified_txns = {}
+        self.verified_txns_limit = 50000
+
+        # block hash -> [(txn, vout), ...] outputs the block spent, for reverting it.
+        # Needed because fully spent transactions are dropped from the UTXO set.
+        # With a PersistentUtxoSet it is instead the UtxoVersion from before the block.
+        self.undo_data = {}
+        # Pruning mode (PRUNE_DEPTH): main-chain blocks deeper than this keep only
+        # their header; reorgs are only possible within this window
+        self.prune_depth = self.params.PRUNE_DEPTH
+        self.pruned_blocks = metrics.counter("blocks_pruned_total", "Block bodies dropped by pruning")
+        self.collected_blocks = metrics.counter(
+            "blocks_collected_total", "Abandoned side-branch blocks dropped from the block tree")
 
     def __str__(self):
         return self.consensus.print_tree(self.consensus.root)
@@ -21,8 +83,16 @@ class Ledger:
     def display(self, padding=""):
         print(padding, self.utxo_set.display())
 
-    def append_block(self, block, is_genesis=False):
-        # Adds a block to the ledger.
+    def append_block(self, block, is_genesis=False, check_header=True):
+        # Adds a block to the ledger. check_header=False skips re-hashing a header whose
+        # proof of work was already verified (headers-first sync).
+        with self.lock:
+            return self._append_block(block, is_genesis, check_header)
+
+    def _append_block(self, block, is_genesis, check_header):
+        if self.consensus.has_block(block.block_hash):
+            # Already connected (e.g. announced again while we were syncing)
+            return True
         if is_genesis:
             self.last_block_hash = block.block_hash
             reorg_actions = self.consensus.add_block(block)
@@ -30,33 +100,298 @@ class Ledger:
                 print("[?] Error: No reorganization expected in genesis")
             
             # Genesis block special handling: remove inputs (none) and add outputs
-            # Actually genesis has no inputs to remove usually, but following logic:
-            for txn in block.transactions[1:]:
-                for inp in txn.inputs:
-                    self.utxo_set.remove_output(inp.transaction_id, inp.output_index)
-            for txn in block.transactions:
-                self.utxo_set.add_transaction(txn)
+            self.apply_block_utxo(block)
 
             self.refresh_transaction_pool(block.transactions[1:])
+            self.update_chain_gauges()
         else:
-            if not self.validate_block(block):
+            if not self.validate_block(block, check_header):
                 return False
             self.integrate_block(block)
+        self.persist_block(block)
         return True
 
-    def validate_transaction(self, txn):
-        # Verifies a transaction against the current UTXO set.
+    def apply_block_utxo(self, block):
+        # Spends the block's inputs and adds its outputs to the UTXO set, transaction by
+        # transaction so that a later transaction may spend an earlier one's outputs.
+        # Records the spent outputs as the block's undo data.
+        if isinstance(self.utxo_set, PersistentUtxoSet):
+            self.apply_block_version(block)
+            return
+        undo = []
+        for txn in block.transactions[1:]:
+            self.utxo_set.add_transaction(txn)
+            for inp in txn.inputs:
+                spent_txn = self.utxo_set.remove_output(inp.transaction_id, inp.output_index)
+                if spent_txn is not None:
+                    undo.append((spent_txn, inp.output_index))
+        self.utxo_set.add_transaction(block.transactions[0])
+        self.undo_data[block.block_hash] = undo
+
+    def apply_block_version(self, block):
+        # Persistent backend: reuses the version another node already computed for this
+        # block on top of the same version, if any; otherwise applies the block and shares
+        # the result. The version from before the block is its undo data.
+        parent = self.utxo_set.version()
+        result = SHARED_VERSIONS.get(parent.root, block)
+        if result is not None:
+            self.utxo_set.checkout(result)
+        else:
+            for txn in block.transactions[1:]:
+                self.utxo_set.add_transaction(txn)
+                for inp in txn.inputs:
+                    self.utxo_set.remove_output(inp.transaction_id, inp.output_index)
+            self.utxo_set.add_transaction(block.transactions[0])
+            result = self.utxo_set.version()
+            SHARED_VERSIONS.put(parent.root, block, result)
+        self.undo_data[block.block_hash] = parent
+
+    def revert_block_utxo(self, block, utxo_set=None):
+        # Undoes apply_block_utxo: drops the block's outputs and restores what it spent.
+        # Returns False, changing nothing, if the block cannot be reverted (see undo_for).
+        undo = self.undo_for(block)
+        if undo is None:
+            return False
+        if utxo_set is None:
+            utxo_set = self.utxo_set
+            self.undo_data.pop(block.block_hash, None)
+        if isinstance(undo, UtxoVersion):
+            # Persistent backend: switch back to the version from before the block
+            utxo_set.checkout(undo)
+            return True
+        utxo_set.remove_transaction(block.transactions[0])
+        for txn in reversed(block.transactions[1:]):
+            utxo_set.remove_transaction(txn)
+        block_txids = {txn.transaction_id for txn in block.transactions}
+        for spent_txn, vout in undo:
+            # Outputs of the block's own transactions went with them
+            if spent_txn.transaction_id not in block_txids:
+                utxo_set.add_output(spent_txn.transaction_id, vout, spent_txn)
+        return True
+
+    def undo_for(self, block):
+        # The block's undo data, or None if it cannot be reverted: its body was pruned,
+        # or it was connected before a restart and the transactions it spent are gone.
+        # Undo data missing after a restart is rebuilt (and kept) from the block store.
+        undo = self.undo_data.get(block.block_hash)
+        if undo is not None:
+            return undo
+        if not block.transactions:
+            return None
+        undo = self.rebuild_undo(block)
+        if undo is not None:
+            self.undo_data[block.block_hash] = undo
+        return undo
+
+    def rebuild_undo(self, block):
+        # [(txn, vout), ...] a main-chain block spent, in apply_block_utxo's order. Spent
+        # transactions come from the block itself, the UTXO set (if some of their outputs
+        # are still unspent) or older main-chain blocks, newest first.
+        spent = [(inp.transaction_id, inp.output_index)
+                 for txn in block.transactions[1:] for inp in txn.inputs]
+        found = {txn.transaction_id: txn for txn in block.transactions}
+        missing = set()
+        for txid, _ in spent:
+            if txid not in found:
+                txn = self.utxo_set.get_transaction(txid)
+                if txn:
+                    found[txid] = txn
+                else:
+                    missing.add(txid)
+        node = self.consensus.get_node(block.block_hash)
+        node = None if node is None else node.parent
+        while missing and node is not None:
+            body = self.get_block(node.block.block_hash)
+            if body is None:
+                return None
+            for txn in body.transactions:
+                if txn.transaction_id in missing:
+                    found[txn.transaction_id] = txn
+                    missing.discard(txn.transaction_id)
+            node = node.parent
+        if missing:
+            return None
+        return [(found[txid], vout) for txid, vout in spent]
+
+    def maintain_chain(self):
+        # Pruning mode: drops bodies and undo data of main-chain blocks deeper than
+        # prune_depth, then abandoned side branches. Runs after every connected block.
+        if self.prune_depth is None:
+            return
+        tip = self.main_chain_tip()
+        node = tip
+        while node is not None and node.height > tip.height - self.prune_depth:
+            node = node.parent
+        # Walk down until the first block pruned by an earlier pass. Genesis keeps its
+        # body: it is what late joiners start their chain from.
+        while node is not None and node.parent is not None and node.block.transactions:
+            self.prune_block(node)
+            node = node.parent
+
+        for block in self.consensus.collect_garbage():
+            self.undo_data.pop(block.block_hash, None)
+            self.collected_blocks.inc()
+
+    def prune_block(self, node):
+        # Replaces the node's block with its header; the store still has the full block.
+        # The MinedBlock object itself is left alone, as peers may still hold it.
+        self.undo_data.pop(node.block.block_hash, None)
+        node.block = node.block.header().to_block()
+        self.pruned_blocks.inc()
+
+    def persist_block(self, block):
+        # Appends an accepted block to the block store, checkpointing periodically.
+        if self.block_store is None or not self.consensus.has_block(block.block_hash):
+            return
+        self.block_store.put_block(block)
+        self.blocks_since_checkpoint += 1
+        if self.blocks_since_checkpoint >= self.checkpoint_interval:
+            self.write_checkpoint()
+
+    def main_chain_tip(self):
+        # BlockNode at the tip of the main chain.
+        if self.consensus.longest_chain_head is not None:
+            return self.consensus.longest_chain_head
+        return self.consensus.root
+
+    def main_chain_nodes(self, start_height=0):
+        # BlockNodes of the main chain from start_height up to the tip.
+        nodes = []
+        current = self.main_chain_tip()
+        while current is not None and current.height >= start_height:
+            nodes.append(current)
+            current = current.parent
+        nodes.reverse()
+        return nodes
+
+    def get_headers(self, start_height=0):
+        # Serves main-chain headers from start_height to the tip to a syncing peer.
+        with self.lock:
+            return [node.block.header() for node in self.main_chain_nodes(start_height)]
+
+    def get_block(self, block_hash):
+        # Serves a full block to a syncing peer, or None if this node has no body for it.
+        node = self.consensus.get_node(block_hash)
+        if node is not None and node.block.transactions:
+            return node.block
+        if self.block_store is not None:
+            block = self.block_store.get_block(block_hash)
+            if block is not None and block.transactions:
+                return block
+        return None
+
+    def get_merkle_proof(self, block_hash, transaction_id):
+        # MerkleProof that the transaction is in the block, for light clients, or None
+        # if the block is not on this node's tree, its body is gone or it lacks the txn.
+        node = self.consensus.get_node(block_hash)
+        block = self.get_block(block_hash)
+        if node is None or block is None:
+            return None
+        txids = [txn.transaction_id for txn in block.transactions]
+        if transaction_id not in txids:
+            return None
+        index = txids.index(transaction_id)
+        branch = helpers.compute_merkle_branch(txids, index, self.params.MERKLE_TREE_ARITY)
+        return spv_client.MerkleProof(block_hash, node.height, block.transactions[index], branch)
+
+    def find_proofs(self, locking_script, start_height=0):
+        # MerkleProofs, in chain order, for main-chain transactions from start_height on
+        # that pay or spend from locking_script (a light client's history).
+        with self.lock:
+            nodes = self.main_chain_nodes(start_height)
+        proofs = []
+        for node in nodes:
+            block = self.get_block(node.block.block_hash)
+            if block is not None:
+                found = spv_client.block_proofs(block, node.height, {locking_script}, self.params.MERKLE_TREE_ARITY)
+                proofs.extend(found.get(locking_script, []))
+        return proofs
+
+    def utxo_snapshot(self, height=None):
+        # Returns (block hash, [(txn, vouts), ...]) for the UTXO set as of the main-chain
+        # block at `height` (default: the tip), undoing newer blocks on a copy of the set.
+        with self.lock:
+            nodes = self.main_chain_nodes(0 if height is None else height)
+            if not nodes or (height is not None and nodes[0].height != height):
+                return None
+            snapshot = self.utxo_set.copy()
+            for node in reversed(nodes[1:]):
+                if not self.revert_block_utxo(node.block, snapshot):
+                    return None
+            return nodes[0].block.block_hash, list(snapshot.entries())
+
+    def load_snapshot(self, headers, entries):
+        # Starts the chain from a trusted UTXO snapshot taken at headers[-1].
+        # Blocks up to the snapshot are kept as headers only; headers[0] is genesis.
+        with self.lock:
+            for header in headers:
+                block = header.to_block()
+                self.consensus.add_block(block)
+                if self.block_store is not None:
+                    self.block_store.put_block(block)
+            self.utxo_set.load_entries(entries)
+            self.last_block_hash = headers[-1].block_hash
+            self.update_chain_gauges()
+            self.write_checkpoint()
+
+    def state_commitment(self):
+        # (tip hash, height, UTXO set digest): equal tuples mean equal chain state.
+        with self.lock:
+            tip = self.main_chain_tip()
+            if tip is None:
+                return None, 0, self.utxo_set.digest()
+            return tip.block.block_hash, tip.height, self.utxo_set.digest()
+
+    def write_checkpoint(self):
+        # Saves the UTXO set together with the tip it corresponds to.
+        tip = self.main_chain_tip()
+        if self.block_store is None or tip is None:
+            return
+        self.block_store.write_checkpoint(tip.block.block_hash, self.utxo_set.entries())
+        self.blocks_since_checkpoint = 0
+
+    def restore_from_store(self):
+        # Rebuilds the block tree from the store and the UTXO set from the latest checkpoint,
+        # replaying (without re-validating) only main-chain blocks newer than the checkpoint.
+        # Returns False if there is nothing stored.
+        if self.block_store is None or not len(self.block_store):
+            return False
+
+        for block in self.block_store.iter_blocks():
+            self.consensus.add_block(block)
+        tip = self.main_chain_tip()
+        self.last_block_hash = tip.block.block_hash
+
+        main_chain = self.main_chain_nodes()
+
+        start = 0
+        checkpoint = self.block_store.load_checkpoint()
+        if checkpoint is not None:
+            checkpoint_tip, entries = checkpoint
+            node = self.consensus.get_node(checkpoint_tip)
+            # A checkpoint taken on a branch that later lost a reorg is unusable
+            if node is not None and main_chain[node.height] is node:
+                self.utxo_set.load_entries(entries)
+                start = node.height + 1
+
+        for node in main_chain[start:]:
+            self.apply_block_utxo(node.block)
+        self.update_chain_gauges()
+        self.maintain_chain()
+        return True
+
+    def validate_transaction(self, txn, view=None):
+        # Verifies a transaction against a UTXO view (default: confirmed set + mempool).
+        if view is None:
+            view = self.mempool_view
+        scripts_verified = txn.transaction_id in self.verified_txns
         total_input_amount = 0
         for inp in txn.inputs:
-            if not self.utxo_set.has_output(inp.transaction_id, inp.output_index):
+            output_txn = view.get_output(inp.transaction_id, inp.output_index)
+            if output_txn is None:
                 return False
-    
-            output_txn = self.utxo_set.get_transaction(inp.transaction_id).outputs[inp.output_index]
-            if not ScriptEngine.execute_p2pkh(
-                inp.unlocking_script,
-                output_txn.locking_script,
-                inp.transaction_id
-                ):
+
+            if not scripts_verified and not self.verify_input_script(inp, output_txn):
                 return False
 
             total_input_amount += output_txn.amount 
@@ -68,35 +403,109 @@ class Ledger:
         if total_output_amount > total_input_amount:
             return False
 
+        self.remember_verified(txn)
         return True
 
-    def validate_block(self, block):
-        # Validates a block's hash, merkle root, and transactions.
-        serialized_header = block.serialize_header(block.nonce)
-        
-        # Verify block hash
-        calculated_hash = compute_double_sha256(serialized_header)
-        if not (calculated_hash == block.block_hash and 
-            block.merkle_tree_root == block.calculate_merkle_root()):
+    def remember_verified(self, txn):
+        # Caches a passed script check, evicting the oldest entry when full.
+        if len(self.verified_txns) >= self.verified_txns_limit:
+            self.verified_txns.pop(next(iter(self.verified_txns)))
+        self.verified_txns[txn.transaction_id] = True
+
+    def verify_input_script(self, inp, output_txn):
+        # Runs the input's unlocking script against the spent output's locking script.
+        start = time.perf_counter()
+        result = ScriptEngine.verify(inp.script, output_txn.locking_script, inp.transaction_id)
+        self.script_verification_time.observe(time.perf_counter() - start)
+        return result
+
+    def validate_block(self, block, check_header=True):
+        # Validates a block, recording how long validation took.
+        start = time.perf_counter()
+        result = self.check_block(block, check_header)
+        self.block_validation_time.observe(time.perf_counter() - start)
+        return result
+
+    def run_stage(self, stage, check, *args):
+        # Runs one validation stage, timing it and counting rejections.
+        start = time.perf_counter()
+        result = check(*args)
+        self.stage_time[stage].observe(time.perf_counter() - start)
+        if not result:
+            self.stage_rejections[stage].inc()
+        return result
+
+    def check_block(self, block, check_header=True):
+        # Validates a block stage by stage, in increasing order of cost.
+        if check_header and not self.run_stage('header', self.check_block_header, block):
+            return False
+        if not self.run_stage('structure', self.check_block_structure, block):
+            return False
+        if not self.run_stage('merkle', self.check_block_merkle, block):
+            return False
+        spent_outputs = []
+        if not self.run_stage('inputs', self.check_block_inputs, block, spent_outputs):
+            return False
+        return self.run_stage('scripts', self.check_block_scripts, block, spent_outputs)
+
+    def check_block_header(self, block):
+        # Verify block hash and proof of work, at no less than the network's difficulty
+        if block.difficulty_bits < self.params.BITS:
+            return False
+        calculated_hash = compute_double_sha256(block.serialize_header(block.nonce))
+        return calculated_hash == block.block_hash and calculated_hash < get_target(block.difficulty_bits)
+
+    def check_block_structure(self, block):
+        # Context-free checks: coinbase shape, duplicate transactions or inputs, amounts.
+        if not block.transactions:
             return False
 
-        # Verify transactions
         # block.transactions[0] is coinbase [ASSUMPTION]
+        coinbase = block.transactions[0]
+        # Coinbase should have 1 input with dummy values and 1 output
+        if not ((len(coinbase.inputs) == 1) and (int(coinbase.inputs[0].transaction_id, 16) == 0)
+                        and (int(coinbase.inputs[0].output_index) == -1)
+                        and (len(coinbase.outputs) == 1)):
+            return False
+
+        txids = set()
+        spent = set()
+        for txn in block.transactions:
+            if txn.transaction_id in txids:
+                return False
+            txids.add(txn.transaction_id)
+            for out in txn.outputs:
+                if out.amount < 0:
+                    return False
+            if txn is coinbase:
+                continue
+            if not txn.inputs:
+                return False
+            for inp in txn.inputs:
+                # The same output spent twice within the block
+                outpoint = (inp.transaction_id, int(inp.output_index))
+                if outpoint in spent:
+                    return False
+                spent.add(outpoint)
+        return True
+
+    def check_block_merkle(self, block):
+        return block.merkle_tree_root == block.calculate_merkle_root(self.params.MERKLE_TREE_ARITY)
+
+    def check_block_inputs(self, block, spent_outputs):
+        # Looks up every spent output and checks amounts, collecting
+        # (txn, input, spent output) for the script stage. Transactions may spend
+        # outputs of earlier transactions in the same block.
+        view = UtxoView(self.utxo_set)
         coinbase_fees = 0.0
         for txn in block.transactions[1:]:
             input_amount = 0.0
             for inp in txn.inputs:
-                if not self.utxo_set.has_output(inp.transaction_id, inp.output_index):
-                    return False
-
-                output_txn = self.utxo_set.get_transaction(inp.transaction_id).outputs[inp.output_index]
-                if not ScriptEngine.execute_p2pkh(
-                    inp.unlocking_script,
-                    output_txn.locking_script,
-                    inp.transaction_id
-                    ):
+                output_txn = view.get_output(inp.transaction_id, inp.output_index)
+                if output_txn is None:
                     return False
 
+                spent_outputs.append((txn, inp, output_txn))
                 input_amount += output_txn.amount 
 
             output_amount = 0.0
@@ -106,18 +515,23 @@ class Ledger:
             if output_amount > input_amount:
                 return False
             coinbase_fees += (input_amount - output_amount)
+            view.add_transaction(txn)
 
-        # Verify coinbase transaction
         coinbase = block.transactions[0]
-        # Coinbase should have 1 input with dummy values and 1 output
-        if not ((len(coinbase.inputs) == 1) and (int(coinbase.inputs[0].transaction_id, 16) == 0)
-                        and (int(coinbase.inputs[0].output_index) == -1)
-                        and (len(coinbase.outputs) == 1)):
-            return False
-        
-        if coinbase.outputs[0].amount > coinbase_fees + settings.MINING_REWARD:
+        if coinbase.outputs[0].amount > coinbase_fees + self.params.MINING_REWARD:
             return False
+        return True
+
+    def check_block_scripts(self, block, spent_outputs):
+        # Verifies input scripts, skipping transactions already verified in the mempool.
+        for txn, inp, output_txn in spent_outputs:
+            if txn.transaction_id in self.verified_txns:
+                continue
+            if not self.verify_input_script(inp, output_txn):
+                return False
 
+        for txn in block.transactions[1:]:
+            self.verified_txns.pop(txn.transaction_id, None)
         return True
 
     def refresh_transaction_pool(self, confirmed_txns):
@@ -130,6 +544,8 @@ class Ledger:
                 new_pool.append(txn)
 
         self.miner_node.waiting_txn_pool = new_pool
+        self.miner_node.mempool_size.set(len(new_pool))
+        self.mempool_view.rebuild(new_pool)
 
     def integrate_block(self, block):
         # Adds the block to the chain and handles any reorgs.
@@ -140,71 +556,119 @@ class Ledger:
             if reorg_actions:
                 print("[?] Error: Chain can't be reorganized when new block adds in longest chain")
             
-            for txn in block.transactions[1:]:
-                for inp in txn.inputs:
-                    self.utxo_set.remove_output(inp.transaction_id, inp.output_index)
-            for txn in block.transactions:
-                self.utxo_set.add_transaction(txn)
+            self.apply_block_utxo(block)
 
             self.refresh_transaction_pool(block.transactions[1:])
+            self.miner_node.record_confirmations(block)
+            self.update_chain_gauges()
+            self.emit_connected(block, self.consensus.longest_chain_height)
+            self.miner_node.serve_light_clients(block, self.consensus.longest_chain_height)
         else:
             # Fork detected
+            second_longest = self.consensus.second_longest_head_height
             reorg_actions = self.consensus.add_block(block)
             if reorg_actions:
-                self.handle_reorg(reorg_actions)
+                blocks_to_remove = reorg_actions['blocks_to_remove']
+                if all(self.undo_for(node.block) is not None for node in blocks_to_remove):
+                    self.handle_reorg(reorg_actions)
+                    self.update_chain_gauges()
+                else:
+                    # Deeper than the blocks this node can revert (e.g. the pruning
+                    # window): stay on the current chain
+                    self.consensus.reset_head(blocks_to_remove[0], second_longest)
+                    self.miner_node.events.emit(event_log.WARNING, self.miner_node.node_id, 'reorg_refused',
+                                                len(blocks_to_remove), block.block_hash)
             else:
                 # Block added to side chain, no UTXO update needed yet
                 pass
+        self.maintain_chain()
+
+    def emit_connected(self, block, height):
+        self.miner_node.events.emit(event_log.INFO, self.miner_node.node_id, 'block_connected',
+                                    block.block_hash, height, len(block.transactions))
+
+    def update_chain_gauges(self):
+        self.utxo_size.set(self.utxo_set.size)
+        self.chain_height.set(self.consensus.longest_chain_height)
 
     def handle_reorg(self, reorg_actions):
-        # Handles blockchain reorganization.
+        # Handles blockchain reorganization. Both lists run from their tip down to the fork
+        # point: old blocks are reverted in that order, new ones connected in reverse.
+        self.reorg_count.inc()
+        self.reorg_depth.observe(len(reorg_actions['blocks_to_remove']))
+        self.miner_node.events.emit(event_log.INFO, self.miner_node.node_id, 'reorg',
+                                    len(reorg_actions['blocks_to_remove']), reorg_actions['blocks_to_add'][0].block.block_hash)
+
         # Removing blocks from the old main chain
+        disconnected = []
         for block_node in reorg_actions['blocks_to_remove']:
-            block = block_node.block
-            for txn in block.transactions:
-                self.utxo_set.remove_transaction(txn)
-
-            for txn in block.transactions[1:]:
-                for inp in txn.inputs:
-                    self.utxo_set.add_output(inp.transaction_id, inp.output_index)
+            self.revert_block_utxo(block_node.block)
+            disconnected.append(block_node.block)
+        disconnected.reverse()
+        self.miner_node.record_disconnections(disconnected)
 
         # Adding blocks from the new main chain
-        for block_node in reorg_actions['blocks_to_add']:
+        connected = []
+        for block_node in reversed(reorg_actions['blocks_to_add']):
             block = block_node.block
-            for txn in block.transactions[1:]:
-                for inp in txn.inputs:
-                    self.utxo_set.remove_output(inp.transaction_id, inp.output_index)
-            
-            for txn in block.transactions:
-                self.utxo_set.add_transaction(txn)
-
-    def redistribute_orphan_transactions(self):
-        # Redistributes transactions from orphaned blocks.
-        orphan_blocks = self.consensus.identify_orphans()
-        if orphan_blocks:
-            for block in orphan_blocks:
-                for txn in block.transactions:
-                    # Check if inputs are still valid
-                    valid_inputs = True
-                    for inp in txn.inputs:
-                        if not self.utxo_set.has_output(inp.transaction_id, inp.output_index):
-                            valid_inputs = False
-                            break
-                    
-                    if valid_inputs:
-                        # Redistribute to the network
-                        self.miner_node.network.broadcast_transaction(txn, self.miner_node)
-
-    def get_available_inputs(self, amount_needed):
-        # Finds available inputs to satisfy a required amount.
-        amount_found = 0
-        input_txn_ids = []
-
-        for (txnid, vout) in self.miner_node.received_transaction_ids:
-            if self.utxo_set.has_output(txnid, vout):
-                if amount_found >= amount_needed:
-                    break
-                amount_found += self.utxo_set.get_transaction(txnid).outputs[vout].amount
-                input_txn_ids.append((txnid, vout))
-
-        return input_txn_ids, amount_found
+            self.apply_block_utxo(block)
+            self.miner_node.record_confirmations(block)
+            self.emit_connected(block, block_node.height)
+            self.miner_node.serve_light_clients(block, block_node.height)
+            connected.append(block)
+        self.last_block_hash = reorg_actions['blocks_to_add'][0].block.block_hash
+
+        reinjected = self.reinject_transactions(disconnected, connected)
+        self.miner_node.relay_reinjected(reinjected)
+
+    def reinject_transactions(self, disconnected, connected):
+        # Rebuilds the pool after a reorg, in one pass: transactions of the disconnected
+        # blocks (in chain order) go back in ahead of the waiting ones, which may spend
+        # them; whatever the new blocks confirmed leaves. Scripts are not checked again
+        # (a txid commits to them and they already passed); only transactions touching
+        # outputs the reorg changed are looked up, and dropped if those are gone or spent.
+        # Returns the disconnected transactions that made it back into the pool.
+        confirmed = {txn.transaction_id for block in connected for txn in block.transactions}
+        # Outputs the new branch spent, and transactions whose outputs left the UTXO set
+        spent = {(inp.transaction_id, int(inp.output_index))
+                 for block in connected for txn in block.transactions[1:] for inp in txn.inputs}
+        removed = {txn.transaction_id for block in disconnected for txn in block.transactions} - confirmed
+        returned = [txn for block in disconnected for txn in block.transactions[1:]
+                    if txn.transaction_id not in confirmed]
+        returned_ids = {txn.transaction_id for txn in returned}
+        # Pool transactions the old view accepted; the rest stay out of the view, as before
+        valid = set(self.mempool_view.created)
+
+        view = self.mempool_view
+        view.clear()
+        pool = []
+        reinjected = []
+        dropped = set()
+        for txn in returned + self.miner_node.waiting_txn_pool:
+            txid = txn.transaction_id
+            if txid in confirmed or view.contains(txid):
+                # Confirmed by the new branch, or a copy already placed
+                continue
+            affected = txid in returned_ids or any(
+                (inp.transaction_id, int(inp.output_index)) in spent
+                or inp.transaction_id in removed or inp.transaction_id in dropped
+                for inp in txn.inputs)
+            if not affected:
+                if txid in valid:
+                    view.add_transaction(txn)
+                pool.append(txn)
+                continue
+            if not all(view.has_output(inp.transaction_id, inp.output_index) for inp in txn.inputs):
+                # Conflicts with the new branch (or depends on something that does)
+                dropped.add(txid)
+                continue
+            view.add_transaction(txn)
+            pool.append(txn)
+            if txid in returned_ids:
+                reinjected.append(txn)
+
+        self.miner_node.waiting_txn_pool = pool
+        self.miner_node.mempool_size.set(len(pool))
+        self.reinjected_txns.inc(len(reinjected))
+        self.dropped_txns.inc(len(dropped))
+        return reinjected
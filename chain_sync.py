@@ -0,0 +1,171 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import codec
+import event_log
+
+# Headers-first catch-up for a node joining a running network:
+#   1. fetch the best peer's main-chain headers and check linkage + proof of work (cheap),
+#   2. optionally load a trusted UTXO snapshot at some height instead of replaying history,
+#   3. download the remaining bodies from several peers in parallel while connecting them
+#      in order as they arrive, without re-hashing headers that were already checked.
+# The joiner is registered with the network before syncing, so blocks and transactions
+# broadcast meanwhile wait in its message queue; blocks it already synced are ignored.
+
+class ChainSync:
+    # Brings `miner` up to the tip of its peers' chain.
+    def __init__(self, miner, peers, workers=4, window=64):
+        self.miner = miner
+        self.ledger = miner.ledger
+        self.peers = [peer for peer in peers if peer is not miner and peer.ledger.consensus.root is not None]
+        self.workers = workers
+        # Maximum number of bodies requested ahead of the block being connected
+        self.window = window
+        self.stats = {'headers': 0, 'blocks': 0, 'header_time': 0.0, 'download_time': 0.0,
+                      'connect_time': 0.0, 'snapshot_height': None}
+
+    def best_peer(self):
+        return max(self.peers, key=lambda peer: peer.ledger.consensus.longest_chain_height)
+
+    def fetch_headers(self, peer, start_height):
+        # Returns verified headers from start_height, or None if the peer's chain is bad.
+        start = time.perf_counter()
+        headers = peer.ledger.get_headers(start_height)
+        valid = self.verify_headers(headers)
+        self.stats['header_time'] += time.perf_counter() - start
+        if not valid:
+            print(f"[?] Rejected header chain from node {peer.node_id}")
+            return None
+        self.stats['headers'] += len(headers)
+        return headers
+
+    def verify_headers(self, headers):
+        # Checks that each header links to the previous one and carries valid proof of work.
+        # Genesis (previous hash all zeros) is trusted, since its hash is fixed by the simulation.
+        previous = None
+        for header in headers:
+            if previous is not None and header.previous_hash != previous.block_hash:
+                return False
+            if header.previous_hash != "0"*64 and not header.check_proof_of_work():
+                return False
+            previous = header
+        return True
+
+    def fetch_block(self, header, first_peer):
+        # Downloads one body, trying the other peers if the first cannot serve it.
+        order = self.peers[first_peer:] + self.peers[:first_peer]
+        for peer in order:
+            block = peer.ledger.get_block(header.block_hash)
+            if block is not None:
+                # Same copy-on-receive rule as process_message_queue
+                return block.clone()
+        return None
+
+    def download_blocks(self, headers):
+        # Yields (header, block) in chain order while later bodies are still downloading.
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            for i, header in enumerate(headers):
+                pending.append((header, pool.submit(self.fetch_block, header, i % len(self.peers))))
+                if len(pending) >= self.window:
+                    header, future = pending.popleft()
+                    yield header, future.result()
+            while pending:
+                header, future = pending.popleft()
+                yield header, future.result()
+
+    def matches_header(self, header, block):
+        return (block.block_hash == header.block_hash and block.previous_hash == header.previous_hash
+                and block.nonce == header.nonce and block.merkle_tree_root == header.merkle_tree_root)
+
+    def connect_blocks(self, headers):
+        # Returns the number of blocks connected; stops at the first bad or missing body.
+        connected = 0
+        connect_time = 0.0
+        start = time.perf_counter()
+        for header, block in self.download_blocks(headers):
+            if self.ledger.consensus.has_block(header.block_hash):
+                continue
+            if block is None or not self.matches_header(header, block):
+                print(f"[?] No valid body for block {header.block_hash}")
+                break
+            connect_start = time.perf_counter()
+            if not self.ledger.append_block(block, check_header=False):
+                print(f"[?] Block {header.block_hash} failed validation")
+                break
+            connect_time += time.perf_counter() - connect_start
+            connected += 1
+        self.stats['connect_time'] += connect_time
+        self.stats['download_time'] += time.perf_counter() - start - connect_time
+        self.stats['blocks'] += connected
+        return connected
+
+    def load_snapshot(self, peer, headers, height):
+        # Starts from `peer`'s UTXO set at `height`; returns False if it does not match the headers.
+        snapshot = peer.ledger.utxo_snapshot(height)
+        if snapshot is None or height >= len(headers) or snapshot[0] != headers[height].block_hash:
+            print(f"[?] Node {peer.node_id} has no usable snapshot at height {height}")
+            return False
+        # Transfer through the wire encoding so the joiner holds its own copies
+        entries = [(codec.decode_txn(codec.encode_txn(txn)), vouts) for txn, vouts in snapshot[1]]
+        self.ledger.load_snapshot(headers[:height + 1], entries)
+        self.stats['snapshot_height'] = height
+        return True
+
+    def start_chain(self, peer, headers, snapshot_height):
+        # Connects genesis (or a snapshot) so that bodies can be applied on top.
+        if snapshot_height is not None and snapshot_height > 0:
+            if self.load_snapshot(peer, headers, snapshot_height):
+                return snapshot_height + 1
+        genesis = peer.ledger.consensus.root.block.clone()
+        self.miner.store_genesis_block(genesis)
+        return 1
+
+    def run(self, snapshot_height=None, max_rounds=5):
+        # Syncs until our tip matches the best peer's or max_rounds passes are done.
+        if not self.peers:
+            print("[?] No peers to sync from")
+            return self.stats
+        start = time.perf_counter()
+        for _ in range(max_rounds):
+            peer = self.best_peer()
+            height = self.ledger.consensus.longest_chain_height
+            if self.ledger.consensus.root is None:
+                headers = self.fetch_headers(peer, 0)
+                if not headers:
+                    break
+                first = self.start_chain(peer, headers, snapshot_height)
+                headers = headers[first:]
+            else:
+                headers = self.fetch_headers(peer, height + 1)
+                if headers and not self.ledger.consensus.has_block(headers[0].previous_hash):
+                    # The peer reorganized below our tip: take its whole chain, skipping known blocks
+                    headers = self.fetch_headers(peer, 1)
+                if headers is None:
+                    break
+            if not headers:
+                break
+            self.connect_blocks(headers)
+            if self.ledger.main_chain_tip().block.block_hash == peer.ledger.main_chain_tip().block.block_hash:
+                break
+
+        self.miner.wallet.reset(self.ledger.utxo_set.find_outputs(self.miner.pub_key_hash))
+        self.stats['height'] = self.ledger.consensus.longest_chain_height
+        self.stats['elapsed'] = time.perf_counter() - start
+        self.miner.events.emit(event_log.INFO, self.miner.node_id, 'sync_complete', self.stats['height'],
+                               self.stats['blocks'], self.stats['elapsed'])
+        return self.stats
+
+def join_network(miner, network=None, snapshot_height=None, workers=4):
+    # Registers a late-joining node and syncs it from the nodes already in the network
+    # (default: the miner's own). Start its mining thread afterwards (e.g.
+    # simulation.start_miners([miner])).
+    if network is None:
+        network = miner.network
+    peers = list(network.nodes)
+    network.add_node(miner)
+    return ChainSync(miner, peers, workers).run(snapshot_height)
+
+if __name__ == '__main__':
+    pass
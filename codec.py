@@ -0,0 +1,129 @@
+import struct
+
+from txn_input import TxnInput
+from txn_output import TxnOutput
+from transaction_data import Txn
+from block_data import MinedBlock
+
+# Compact binary encoding of transactions and blocks for storage and snapshots.
+# Hashes are stored as their 32 raw bytes and scripts as raw bytes; integers are
+# little-endian. Decoding trusts the stored ids instead of re-hashing everything.
+
+_INPUT_HEAD = struct.Struct("<32si")
+_AMOUNT = struct.Struct("<q")
+_BLOCK_HEAD = struct.Struct("<32s32s32sBBQ")
+
+NULL_HASH = bytes(32)
+
+def write_varint(parts, value):
+    # Unsigned LEB128.
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            break
+    parts.append(bytes(out))
+
+def read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+def _write_bytes(parts, raw):
+    write_varint(parts, len(raw))
+    parts.append(raw)
+
+def _read_bytes(data, offset):
+    length, offset = read_varint(data, offset)
+    return bytes(data[offset:offset + length]), offset + length
+
+def encode_txn_parts(parts, txn):
+    parts.append(bytes.fromhex(txn.transaction_id))
+    write_varint(parts, len(txn.inputs))
+    for inp in txn.inputs:
+        parts.append(_INPUT_HEAD.pack(bytes.fromhex(inp.transaction_id), int(inp.output_index)))
+        _write_bytes(parts, inp.script)
+    write_varint(parts, len(txn.outputs))
+    for out in txn.outputs:
+        parts.append(_AMOUNT.pack(out.amount))
+        _write_bytes(parts, bytes.fromhex(out.locking_script))
+
+def decode_txn_at(data, offset, verify=False):
+    txid = bytes(data[offset:offset + 32]).hex()
+    offset += 32
+    count, offset = read_varint(data, offset)
+    inputs = []
+    for _ in range(count):
+        prev_txid, vout = _INPUT_HEAD.unpack_from(data, offset)
+        offset += _INPUT_HEAD.size
+        script, offset = _read_bytes(data, offset)
+        inputs.append(TxnInput(prev_txid.hex(), vout, script))
+    count, offset = read_varint(data, offset)
+    outputs = []
+    for _ in range(count):
+        (amount, ) = _AMOUNT.unpack_from(data, offset)
+        offset += _AMOUNT.size
+        script, offset = _read_bytes(data, offset)
+        outputs.append(TxnOutput(amount, script.hex()))
+
+    txn = Txn(inputs, outputs, transaction_id=None if verify else txid)
+    if verify and txn.transaction_id != txid:
+        raise ValueError(f"Transaction id mismatch: stored {txid}, computed {txn.transaction_id}")
+    return txn, offset
+
+def encode_txn(txn):
+    parts = []
+    encode_txn_parts(parts, txn)
+    return b"".join(parts)
+
+def decode_txn(data, verify=False):
+    return decode_txn_at(data, 0, verify)[0]
+
+def encode_block(block):
+    parts = []
+    merkle = NULL_HASH if block.merkle_tree_root is None else bytes.fromhex(block.merkle_tree_root)
+    parts.append(_BLOCK_HEAD.pack(
+        bytes.fromhex(block.previous_hash),
+        bytes.fromhex(block.block_hash) if block.block_hash else NULL_HASH,
+        merkle,
+        block.merkle_tree_root is not None,
+        block.difficulty_bits,
+        block.nonce,
+    ))
+    write_varint(parts, len(block.transactions))
+    for txn in block.transactions:
+        encode_txn_parts(parts, txn)
+    return b"".join(parts)
+
+def decode_block(data, verify=False, params=None):
+    # Rebuilds a MinedBlock; with verify=True every txid and the merkle root are recomputed.
+    # params: the settings.ChainParams the block belongs to (None: the module settings).
+    previous_hash, block_hash, merkle, has_merkle, bits, nonce = _BLOCK_HEAD.unpack_from(data, 0)
+    offset = _BLOCK_HEAD.size
+    count, offset = read_varint(data, offset)
+    transactions = []
+    for _ in range(count):
+        txn, offset = decode_txn_at(data, offset, verify)
+        transactions.append(txn)
+
+    merkle_root = merkle.hex() if has_merkle else None
+    block = MinedBlock(transactions, previous_hash.hex(), None if verify else merkle_root, params)
+    if verify and block.merkle_tree_root != merkle_root:
+        raise ValueError("Merkle root mismatch")
+    block.block_hash = block_hash.hex() if block_hash != NULL_HASH else ""
+    block.difficulty_bits = bits
+    block.nonce = nonce
+    return block
+
+if __name__ == '__main__':
+    pass
@@ -2,6 +2,8 @@ from block_data import MinedBlock
 
 class BlockNode:
     # Represents a node in the block tree (for consensus/fork resolution).
+    __slots__ = ('children', 'parent', 'height', 'block')
+
     def __init__(self, children=None, parent=None, height=0, block=None):
         if children is None:
             children = []
@@ -29,46 +31,59 @@ class ConsensusMechanism:
         self.longest_chain_height = 0
         self.second_longest_head_height = 0
         self.longest_chain_head = None
+        # block hash -> BlockNode for every block in the tree
+        self.block_index = {}
+        # Hashes of nodes with more than one child, i.e. where side branches start
+        self.fork_points = set()
+
+    def has_block(self, block_hash):
+        return block_hash in self.block_index
+
+    def get_node(self, block_hash):
+        return self.block_index.get(block_hash)
 
     def add_block(self, block):
         # Adds a block to the tree and checks for reorgs.
+        if block.block_hash in self.block_index:
+            # Already known
+            return []
         if block.previous_hash == "0"*64:
             self.root = BlockNode([], None, 0, block)
-        else:
-            return self._recursive_add(self.root, block)
-        return []
+            self.block_index[block.block_hash] = self.root
+            return []
 
-    def _recursive_add(self, current_node, block):
+        parent = self.block_index.get(block.previous_hash)
+        if parent is None:
+            # Parent unknown: nothing to attach to
+            return []
+        return self._attach(parent, block)
+
+    def _attach(self, current_node, block):
         reorg_actions = []
-        if current_node.block.block_hash == block.previous_hash:
-            new_node = BlockNode([], current_node, current_node.height + 1, block)
-            current_node.children.append(new_node)
-
-            if current_node.height + 1 > self.longest_chain_height:
-                self.longest_chain_height = current_node.height + 1
-
-                if self.longest_chain_head is not None:
-                    if self.longest_chain_head.block.block_hash != current_node.block.block_hash:
-                        # Reorganization detected
-                        common_ancestor = self.find_common_ancestor(new_node, self.longest_chain_head)
-                        blocks_to_remove = self.get_path_nodes(common_ancestor, self.longest_chain_head)
-                        blocks_to_add = self.get_path_nodes(common_ancestor, new_node)
-                        
-                        reorg_actions = {
-                            'blocks_to_remove': blocks_to_remove,
-                            'blocks_to_add': blocks_to_add
-                        }
-                        print("REORGANIZE DETECTED")
-                        self.second_longest_head_height = self.longest_chain_head.height
-
-                self.longest_chain_head = new_node
-            
-            return reorg_actions
-
-        for child in current_node.children:
-            result = self._recursive_add(child, block) 
-            if result: # If reorg actions returned
-                return result
+        new_node = BlockNode([], current_node, current_node.height + 1, block)
+        current_node.children.append(new_node)
+        self.block_index[block.block_hash] = new_node
+        if len(current_node.children) > 1:
+            self.fork_points.add(current_node.block.block_hash)
+
+        if current_node.height + 1 > self.longest_chain_height:
+            self.longest_chain_height = current_node.height + 1
+
+            if self.longest_chain_head is not None:
+                if self.longest_chain_head.block.block_hash != current_node.block.block_hash:
+                    # Reorganization detected
+                    common_ancestor = self.find_common_ancestor(new_node, self.longest_chain_head)
+                    blocks_to_remove = self.get_path_nodes(common_ancestor, self.longest_chain_head)
+                    blocks_to_add = self.get_path_nodes(common_ancestor, new_node)
+                    
+                    reorg_actions = {
+                        'blocks_to_remove': blocks_to_remove,
+                        'blocks_to_add': blocks_to_add
+                    }
+                    self.second_longest_head_height = self.longest_chain_head.height
+
+            self.longest_chain_head = new_node
+
         return reorg_actions
 
     def get_path_nodes(self, start_node, end_node):
@@ -93,10 +108,15 @@ class ConsensusMechanism:
                         if child.block.block_hash != current.block.block_hash:
                             orphan_chains.append(child)
                     # Prune the orphans from the tree
-                    current.parent.children = [end_block]
+                    current.parent.children = [current]
                 current = current.parent
 
-        return self.flatten_chains(orphan_chains)
+        orphan_nodes = []
+        for chain_head in orphan_chains:
+            orphan_nodes.extend(self._collect_nodes(chain_head))
+        for node in orphan_nodes:
+            self.block_index.pop(node.block.block_hash, None)
+        return [n.block for n in orphan_nodes]
 
     def flatten_chains(self, chains):
         # Flattens a list of chain heads into a list of blocks.
@@ -106,41 +126,111 @@ class ConsensusMechanism:
         return [n.block for n in nodes]
 
     def _collect_nodes(self, start_node):
-        nodes = [start_node]
-        for child in start_node.children:
-            nodes.extend(self._collect_nodes(child))
+        # Every node in the subtree under start_node (iteratively: branches can be long).
+        nodes = []
+        stack = [start_node]
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            stack.extend(node.children)
         return nodes
 
+    def collect_garbage(self):
+        # Detaches abandoned side branches anywhere in the tree: those whose best block is
+        # more than orphan_threshold behind the tip. Only fork points are visited, so a
+        # pass costs nothing while the tree is a single chain. Returns the removed blocks.
+        removed = []
+        head = self.longest_chain_head
+        if head is None or not self.fork_points:
+            return removed
+
+        fork_heights = [self.block_index[h].height for h in self.fork_points if h in self.block_index]
+        lowest = min(fork_heights, default=head.height)
+        # Main-chain node at each height above the lowest fork point
+        main_chain = {}
+        current = head
+        while current is not None and current.height > lowest:
+            main_chain[current.height] = current
+            current = current.parent
+
+        for fork_hash in list(self.fork_points):
+            fork = self.block_index.get(fork_hash)
+            if fork is None:
+                # Inside a branch removed earlier in this pass
+                self.fork_points.discard(fork_hash)
+                continue
+            kept = []
+            for child in fork.children:
+                if main_chain.get(child.height) is child:
+                    kept.append(child)
+                    continue
+                branch = self._collect_nodes(child)
+                best_height = max(node.height for node in branch)
+                if self.longest_chain_height - best_height <= self.orphan_threshold:
+                    kept.append(child)
+                    continue
+                for node in branch:
+                    # Unlinking the parent breaks the reference cycle, freeing it at once
+                    self.block_index.pop(node.block.block_hash, None)
+                    node.parent = None
+                removed.extend(node.block for node in branch)
+            fork.children = kept
+            if len(kept) < 2:
+                self.fork_points.discard(fork_hash)
+        return removed
+
+    def tree_blocks(self):
+        # Every block in the tree, parents before children.
+        if self.root is None:
+            return []
+        return [node.block for node in self._collect_nodes(self.root)]
+
+    def load_tree(self, blocks, head_hash, second_longest_head_height=0):
+        # Rebuilds the tree from blocks listed parents first (see tree_blocks), with
+        # head_hash as the main-chain head. Reorg detection does not run: the head is
+        # taken as given, so a tie between branches resolves as it did when saved.
+        for block in blocks:
+            parent = self.block_index.get(block.previous_hash)
+            if parent is None:
+                self.root = BlockNode([], None, 0, block)
+                self.block_index[block.block_hash] = self.root
+                continue
+            node = BlockNode([], parent, parent.height + 1, block)
+            parent.children.append(node)
+            self.block_index[block.block_hash] = node
+            if len(parent.children) > 1:
+                self.fork_points.add(parent.block.block_hash)
+        self.longest_chain_head = self.block_index.get(head_hash)
+        if self.longest_chain_head is not None:
+            self.longest_chain_height = self.longest_chain_head.height
+        self.second_longest_head_height = second_longest_head_height
+
+    def reset_head(self, head, second_longest_head_height):
+        # Makes head the main-chain head again, undoing the switch add_block made for a
+        # reorg the ledger could not carry out. The other branch stays in the tree.
+        self.longest_chain_head = head
+        self.longest_chain_height = head.height
+        self.second_longest_head_height = second_longest_head_height
+
     def find_common_ancestor(self, branch_a, branch_b):
         # Finds the common ancestor of two branches.
-        branch_a_ids = []
-        branch_b_ids = []
-
         ptr_a = branch_a
         ptr_b = branch_b
-        
-        while ptr_a.height > 0:
-            if ptr_a.block.block_hash in branch_b_ids:
-                return ptr_a
-            elif ptr_b.block.block_hash in branch_a_ids:
-                return ptr_b
-            
-            branch_a_ids.append(ptr_a.block.block_hash)
-            branch_b_ids.append(ptr_b.block.block_hash)
 
+        # Bring both pointers to the same height, then walk up together
+        while ptr_a.height > ptr_b.height:
             ptr_a = ptr_a.parent
+        while ptr_b.height > ptr_a.height:
             ptr_b = ptr_b.parent
 
-        # Fallback if one reached root
-        if ptr_a.height == 0:
-            while ptr_b.height > 0:
-                if ptr_b.block.block_hash in branch_a_ids:
-                    return ptr_b
-                ptr_b = ptr_b.parent
-
-        # Should not happen if they share a genesis
-        print("[?] Pointers reached root without common ancestor (should be genesis)")
-        return self.root
+        while ptr_a is not ptr_b:
+            if ptr_a.parent is None or ptr_b.parent is None:
+                # Should not happen if they share a genesis
+                print("[?] Pointers reached root without common ancestor (should be genesis)")
+                return self.root
+            ptr_a = ptr_a.parent
+            ptr_b = ptr_b.parent
+        return ptr_a
 
     def print_tree(self, start_node):
         print(start_node)
@@ -0,0 +1,122 @@
+import gzip
+import json
+import threading
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING"}
+
+# Field names for each event, in the order they are passed to emit().
+# Records stay as tuples in the hot path; names are only attached when written out.
+EVENT_FIELDS = {
+    'txn_created': ('txid', 'amount'),
+    'txn_received': ('txid', ),
+    'txn_invalid': ('txid', ),
+    'txn_confirmed': ('txid', 'latency'),
+    'block_mined': ('hash', 'prev_hash', 'nonce', 'txns'),
+    'block_received': ('hash', 'prev_hash'),
+    'block_rejected': ('hash', ),
+    'block_connected': ('hash', 'height', 'txns'),
+    'reorg': ('depth', 'tip'),
+    'reorg_refused': ('depth', 'tip'),
+    'message': ('kind', ),
+    'sync_complete': ('height', 'blocks', 'seconds'),
+    'proof_rejected': ('txid', ),
+    'headers_rejected': ('peer', ),
+}
+
+class EventLog:
+    # Lock-free ring buffer of (timestamp, level, node, event, fields) tuples.
+    # deque.append is atomic, so any thread may emit; when the buffer is full the oldest
+    # events are overwritten. A TraceWriter drains the buffer in the background.
+    def __init__(self, level=INFO, capacity=1 << 16):
+        self.level = level
+        self.buffer = deque(maxlen=capacity)
+        self.emitted = 0
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def emit(self, level, node, event, *fields):
+        if level >= self.level:
+            self.buffer.append((time.time(), level, node, event, fields))
+            self.emitted += 1
+
+    def drain(self):
+        # Removes and returns everything currently buffered.
+        records = []
+        pop = self.buffer.popleft
+        try:
+            while True:
+                records.append(pop())
+        except IndexError:
+            pass
+        return records
+
+# Process-wide log used by the simulator modules
+EVENTS = EventLog()
+
+def to_dict(record):
+    timestamp, level, node, event, fields = record
+    names = EVENT_FIELDS.get(event, ())
+    data = {'t': timestamp, 'level': LEVEL_NAMES.get(level, level), 'node': node, 'event': event}
+    for i, value in enumerate(fields):
+        data[names[i] if i < len(names) else f"f{i}"] = value
+    return data
+
+def format_record(record):
+    # Human-readable one-liner, in the style of the simulator's console output.
+    data = to_dict(record)
+    details = " ".join(f"{k}={v}" for k, v in data.items() if k not in ('t', 'level', 'node', 'event'))
+    return f"T: {data['node']} [{data['event'].upper()}] {details}"
+
+class TraceWriter:
+    # Background thread draining an EventLog into a JSONL trace (gzip when path ends in .gz)
+    # and/or echoing formatted events to stdout.
+    def __init__(self, log=EVENTS, path=None, echo=False, interval=0.1):
+        self.log = log
+        self.path = path
+        self.echo = echo
+        self.interval = interval
+        self.written = 0
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.file = None
+
+    def start(self):
+        if self.path is not None:
+            opener = gzip.open if self.path.endswith(".gz") else open
+            self.file = opener(self.path, "at")
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def flush(self):
+        records = self.log.drain()
+        if not records:
+            return
+        if self.file is not None:
+            self.file.write("".join(json.dumps(to_dict(r), separators=(',', ':')) + "\n" for r in records))
+            self.file.flush()
+        if self.echo:
+            print("\n".join(format_record(r) for r in records))
+        self.written += len(records)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.flush()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+if __name__ == '__main__':
+    pass
@@ -1,7 +1,8 @@
 # Using secp256k1 curve for Elliptic Curve Cryptography
 from ecdsa import SigningKey, SECP256k1
 import hashlib
-from script_engine import ScriptEngine
+from script_engine import ScriptEngine, build_script, OP_0
+import address_codec
 
 def generate_key_pair():
     # Generates an ECDSA key pair.
@@ -19,43 +20,26 @@ def invert_bytes(hex_string):
     byte_array.reverse()
     return (''.join(format(x, '02x') for x in byte_array)).upper()
 
-def compute_hash160(data_string):
-    # Computes RIPEMD160(SHA256(data)).
-    sha256_hash = hashlib.sha256(str.encode(data_string)).digest()
-    ripemd160_hash = hashlib.new('ripemd160', sha256_hash).hexdigest()
-    return ripemd160_hash
+def compute_hash160(hex_string):
+    # Computes RIPEMD160(SHA256(data)) over the bytes of a hex string (e.g. a public key).
+    return address_codec.hash160_hex(hex_string)
 
-ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+ALPHABET = address_codec.ALPHABET
 
 class Base58Encoder:
-    ENCODE_MAP = {i: ALPHABET[i] for i in range(58)}
-    DECODE_MAP = {ALPHABET[i]: i for i in range(58)}
+    # Hex-string wrapper around address_codec's Base58 (leading zero bytes are kept).
 
     @staticmethod
     def encode(hex_string):
         # Encodes a hex string to Base58.
-        number = int(hex_string, 16)
-        
-        output = ""
-        while True:
-            quotient = number // 58
-            remainder = number % 58
-
-            if quotient == number:
-                break
-    
-            output = Base58Encoder.ENCODE_MAP[remainder] + output
-            number = quotient
-        return output
+        if len(hex_string) % 2:
+            hex_string = '0' + hex_string
+        return address_codec.b58encode(bytes.fromhex(hex_string))
 
     @staticmethod    
     def decode(base58_string):
         # Decodes a Base58 string to hex.
-        size = len(base58_string)
-        value = 0
-        for i, char in enumerate(base58_string):
-            value += Base58Encoder.DECODE_MAP[base58_string[size-i-1]] * (58**i)
-        return hex(value)[2:]
+        return address_codec.b58decode(base58_string).hex()
 
 def compute_double_sha256(text):
     # Computes SHA256(SHA256(text)).
@@ -70,7 +54,8 @@ def compute_merkle_root(hashes, arity=2):
     if len(hashes) == 1:
         return compute_double_sha256(hashes[0] + hashes[0])
     
-    remaining = (len(hashes) % arity)
+    # Pad up to a multiple of the arity so every level shrinks
+    remaining = (-len(hashes)) % arity
     for _ in range(remaining):
         hashes.append(hashes[-1])
 
@@ -81,6 +66,39 @@ def compute_merkle_root(hashes, arity=2):
 
     return compute_merkle_root(new_hashes, arity)
 
+def merkle_levels(hashes, arity=2):
+    # Every level of the tree compute_merkle_root builds, leaves first, each padded to a
+    # multiple of the arity; the last level holds the single top hash.
+    levels = []
+    level = list(hashes)
+    while len(level) > 1:
+        level.extend([level[-1]] * ((-len(level)) % arity))
+        levels.append(level)
+        level = [compute_double_sha256("".join(level[i:i+arity])) for i in range(0, len(level), arity)]
+    levels.append(level)
+    return levels
+
+def merkle_branch(levels, index, arity=2):
+    # Branch proving leaf `index`: per level, (position in its group, the group's other hashes).
+    branch = []
+    for level in levels[:-1]:
+        start = index - index % arity
+        position = index - start
+        group = level[start:start+arity]
+        branch.append((position, group[:position] + group[position+1:]))
+        index //= arity
+    return branch
+
+def compute_merkle_branch(hashes, index, arity=2):
+    return merkle_branch(merkle_levels(hashes, arity), index, arity)
+
+def verify_merkle_branch(leaf, branch, merkle_root):
+    # True if `branch` links `leaf` to `merkle_root`. The arity is implied by the groups.
+    current = leaf
+    for position, siblings in branch:
+        current = compute_double_sha256("".join(siblings[:position]) + current + "".join(siblings[position:]))
+    return compute_double_sha256(current + current) == merkle_root
+
 def generate_pub_key_script(public_key):
     # Creates a P2PKH script public key.
     return compute_hash160(public_key)
@@ -90,5 +108,17 @@ def generate_signature_script(keys, serialized_txn):
     digital_signature = ScriptEngine.create_digital_signature(serialized_txn, keys['private'])
     return digital_signature + keys['public']
 
+def generate_push_signature_script(keys, serialized_txn):
+    # <signature> <public key> as pushes, for script_engine.p2pkh_script outputs.
+    digital_signature = ScriptEngine.create_digital_signature(serialized_txn, keys['private'])
+    return build_script([bytes.fromhex(digital_signature), bytes.fromhex(keys['public'])])
+
+def generate_multisig_signature_script(key_pairs, serialized_txn):
+    # Unlocks script_engine.multisig_script outputs; key_pairs must be in the same order
+    # as the script's public keys.
+    signatures = [bytes.fromhex(ScriptEngine.create_digital_signature(serialized_txn, keys['private']))
+                  for keys in key_pairs]
+    return build_script([OP_0] + signatures)
+
 if __name__ == '__main__':
     pass
\ No newline at end of file
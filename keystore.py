@@ -0,0 +1,90 @@
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import os
+
+from ecdsa import SigningKey, SECP256k1
+
+# Deterministic key provisioning: node i's key pair is derived from (seed, i), so a run
+# with the same seed gets the same addresses. Deriving a public key is an EC point
+# multiplication, the expensive part of standing up a node, so large batches are spread
+# over worker processes and the results are cached in a JSON keystore file.
+
+KEYSTORE_VERSION = 1
+# Below this many missing keys, deriving in-process beats starting a process pool
+PARALLEL_THRESHOLD = 256
+
+def derive_key_pair(seed, index):
+    # Key pair in the same format as helpers.generate_key_pair().
+    digest = hashlib.sha256(f"{seed}:{index}".encode()).digest()
+    secret = int.from_bytes(digest, "big") % (SECP256k1.order - 1) + 1
+    private_key = SigningKey.from_secret_exponent(secret, curve=SECP256k1)
+    return {
+            'private': private_key.to_string().hex(),
+            'public': private_key.verifying_key.to_string().hex()
+            }
+
+def derive_range(seed, start, stop):
+    # Worker entry point: key pairs for indices start..stop-1.
+    return [derive_key_pair(seed, index) for index in range(start, stop)]
+
+class KeyStore:
+    # Key pairs for nodes 0..n-1 derived from `seed`, optionally cached in `path`.
+    def __init__(self, seed, path=None, workers=None):
+        self.seed = seed
+        self.path = path
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.keys = self.load()
+
+    def load(self):
+        # Cached keys, or [] if there is no cache for this seed.
+        if self.path is None or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path) as f:
+                document = json.load(f)
+        except (OSError, ValueError):
+            print(f"[?] Ignoring unreadable keystore {self.path}")
+            return []
+        if document.get('version') != KEYSTORE_VERSION or document.get('seed') != self.seed:
+            return []
+        return [{'private': private, 'public': public} for private, public in document['keys']]
+
+    def save(self):
+        if self.path is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        document = {
+            'version': KEYSTORE_VERSION,
+            'seed': self.seed,
+            'keys': [[keys['private'], keys['public']] for keys in self.keys],
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(document, f)
+        os.replace(tmp_path, self.path)
+
+    def derive(self, start, stop):
+        count = stop - start
+        if count < PARALLEL_THRESHOLD or self.workers < 2:
+            return derive_range(self.seed, start, stop)
+        chunk = -(-count // (self.workers * 4))
+        bounds = [(i, min(i + chunk, stop)) for i in range(start, stop, chunk)]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(derive_range, self.seed, lo, hi) for lo, hi in bounds]
+            keys = []
+            for future in futures:
+                keys.extend(future.result())
+        return keys
+
+    def get(self, count):
+        # Key pairs for nodes 0..count-1, deriving (and caching) any not stored yet.
+        if len(self.keys) < count:
+            self.keys.extend(self.derive(len(self.keys), count))
+            self.save()
+        return self.keys[:count]
+
+if __name__ == '__main__':
+    pass
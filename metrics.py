@@ -0,0 +1,254 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Metrics are updated from the owning node's thread and read by exporters. Updates are
+# plain attribute writes so they stay cheap enough to leave enabled; readers may see a
+# value that is one update behind, which is fine for monitoring.
+
+class Counter:
+    # Monotonically increasing value.
+    kind = 'counter'
+
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+    def render(self, labels):
+        return [f"{self.name}{labels} {self.value}"]
+
+class Gauge:
+    # Value that can go up and down.
+    kind = 'gauge'
+
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def snapshot(self):
+        return self.value
+
+    def render(self, labels):
+        return [f"{self.name}{labels} {self.value}"]
+
+class Histogram:
+    # HDR-style log-linear histogram.
+    # Values are scaled to integers (microseconds for the default scale) and bucketed with
+    # SUB_BUCKET_BITS of mantissa per power of two, giving 3-6% relative precision
+    # at a fixed, small memory cost regardless of the number of observations.
+    kind = 'summary'
+    SUB_BUCKET_BITS = 5
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self, name, help_text="", scale=1e6):
+        self.name = name
+        self.help_text = help_text
+        self.scale = scale
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def bucket_index(value):
+        half = 1 << (Histogram.SUB_BUCKET_BITS - 1)
+        if value < 2 * half:
+            return value
+        exponent = value.bit_length() - Histogram.SUB_BUCKET_BITS
+        return exponent * half + (value >> exponent)
+
+    @staticmethod
+    def bucket_upper_bound(index):
+        # Largest integer value that maps to this bucket.
+        half = 1 << (Histogram.SUB_BUCKET_BITS - 1)
+        if index < 2 * half:
+            return index
+        exponent = index // half - 1
+        mantissa = index - exponent * half
+        return ((mantissa + 1) << exponent) - 1
+
+    def observe(self, value):
+        scaled = int(value * self.scale)
+        if scaled < 0:
+            scaled = 0
+        index = Histogram.bucket_index(scaled)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # Returns the upper bound of the bucket holding the q-th quantile.
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, count in sorted(self.buckets.items()):
+            seen += count
+            if seen >= target:
+                return min(Histogram.bucket_upper_bound(index) / self.scale, self.max)
+        return self.max
+
+    def snapshot(self):
+        record = {'count': self.count, 'sum': self.total, 'min': self.min, 'max': self.max}
+        for q in Histogram.QUANTILES:
+            record[f"p{int(q * 100)}"] = self.quantile(q)
+        return record
+
+    def render(self, labels):
+        inner = labels[1:-1]
+        lines = []
+        for q in Histogram.QUANTILES:
+            value = self.quantile(q)
+            quantile_labels = "{" + (inner + "," if inner else "") + f'quantile="{q}"' + "}"
+            lines.append(f"{self.name}{quantile_labels} {'NaN' if value is None else value}")
+        lines.append(f"{self.name}_sum{labels} {self.total}")
+        lines.append(f"{self.name}_count{labels} {self.count}")
+        return lines
+
+class MetricsRegistry:
+    # Named metrics belonging to one node.
+    def __init__(self):
+        self.metrics = {}
+
+    def _get(self, cls, name, help_text, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = cls(name, help_text, **kwargs)
+            self.metrics[name] = metric
+        return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text="", scale=1e6):
+        return self._get(Histogram, name, help_text, scale=scale)
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in list(self.metrics.items())}
+
+def render_prometheus(labelled_registries):
+    # Renders [(labels_dict, registry), ...] as Prometheus text exposition format.
+    by_name = {}
+    for labels, registry in labelled_registries:
+        label_text = "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}" if labels else ""
+        for name, metric in list(registry.metrics.items()):
+            by_name.setdefault(name, []).append((label_text, metric))
+
+    lines = []
+    for name in sorted(by_name):
+        first = by_name[name][0][1]
+        if first.help_text:
+            lines.append(f"# HELP {name} {first.help_text}")
+        lines.append(f"# TYPE {name} {first.kind}")
+        for label_text, metric in by_name[name]:
+            lines.extend(metric.render(label_text))
+    return "\n".join(lines) + "\n"
+
+def network_registries(network):
+    return [({'node': n.node_id}, n.metrics) for n in network.nodes]
+
+def network_snapshot(network):
+    return {'timestamp': time.time(), 'nodes': {n.node_id: n.metrics.snapshot() for n in network.nodes}}
+
+class MetricsServer:
+    # Serves every node's metrics on localhost: /metrics (Prometheus text) and /metrics.json.
+    def __init__(self, network, host="127.0.0.1", port=9100):
+        self.network = network
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        network = self.network
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body = render_prometheus(network_registries(network)).encode()
+                    content_type = "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body = json.dumps(network_snapshot(network)).encode()
+                    content_type = "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        # Port 0 picks a free port; report the real one
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+class JsonSnapshotWriter:
+    # Appends one JSON line with every node's metrics to `path` each `interval` seconds.
+    def __init__(self, network, path, interval=5.0):
+        self.network = network
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def write_snapshot(self):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(network_snapshot(self.network)) + "\n")
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.write_snapshot()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        # Always leave a final snapshot behind
+        self.write_snapshot()
+
+if __name__ == '__main__':
+    pass
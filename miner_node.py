@@ -1,33 +1,107 @@
-from collections import deque
-from threading import Lock, current_thread
+import json
+import os
+import threading
+from threading import Lock
 import time
 
 import helpers
+import address_codec
 import block_data
 import transaction_data
 import txn_output
 import txn_input
 import p2p_network
 from utxo_set import UtxoSet
+from persistent_utxo import PersistentUtxoSet
+from utxo_view import UtxoView
 from chain_manager import Ledger
 from pow_mechanism import ProofOfWork
+from metrics import MetricsRegistry
+from block_store import BlockStore
+from node_mailbox import Mailbox
+from seen_filter import SeenCache
+from wallet import Wallet
+import event_log
+import settings
+import spv_client
 
 class Miner:
     # Represents a miner node in the network.
-    def __init__(self):
-        self.keys = helpers.generate_key_pair()
+    # With store_dir set, the node keeps its keys, blocks and UTXO checkpoints on disk
+    # there and can resume() after a restart instead of starting from genesis.
+    # keys: a pre-provisioned key pair (see keystore.py); keys saved in store_dir win.
+    # network: the p2p_network.Network the node talks to (default: p2p_network.PeerNetwork);
+    # params: its settings.ChainParams (default: the network's, else the module settings).
+    def __init__(self, store_dir=None, keys=None, network=None, params=None):
+        self.network = p2p_network.PeerNetwork if network is None else network
+        if params is None:
+            params = self.network.params
+        self.params = settings.ChainParams() if params is None else params
+        self.keys = keys
+        self.block_store = None
+        stored_keys = None
+        if store_dir is not None:
+            self.block_store = BlockStore(store_dir)
+            stored_keys = Miner.load_keys(store_dir)
+            if stored_keys is not None:
+                self.keys = stored_keys
+        if self.keys is None:
+            self.keys = helpers.generate_key_pair()
+        if store_dir is not None and stored_keys is None:
+            Miner.save_keys(store_dir, self.keys)
         self.pub_key_hash = helpers.compute_hash160(self.keys['public'])
+        self.address = address_codec.encode_address(self.pub_key_hash)
+        # Short label used in logs and metrics
+        self.node_id = self.pub_key_hash[:8]
+        self.events = event_log.EVENTS
         
         self.waiting_txn_pool = []
+        # Guards light_clients; incoming messages go through the mailbox and its own lock
         self.lock = Lock()
-        self.message_queue = deque()
+
+        self.metrics = MetricsRegistry()
+        self.mailbox = Mailbox(self.metrics)
+        self.queue_depth = self.metrics.gauge("message_queue_depth", "Messages waiting when the queue was drained")
+        self.messages_processed = self.metrics.counter("messages_processed_total", "Messages taken off the queue")
+        self.mempool_size = self.metrics.gauge("mempool_size", "Transactions waiting to be mined")
+        self.hashes_computed = self.metrics.counter("hashes_total", "Block header hashes computed")
+        self.hashrate = self.metrics.gauge("hashrate", "Header hashes per second over the last mining slice")
+        self.blocks_mined = self.metrics.counter("blocks_mined_total", "Blocks found by this node")
+        self.stale_work = self.metrics.counter(
+            "stale_work_seconds_total", "Time from a new tip arriving to mining on top of it")
+        self.template_swaps = self.metrics.counter("template_swaps_total", "Block templates replaced mid-mining")
+        self.confirmation_latency = self.metrics.histogram(
+            "txn_confirmation_seconds", "Time from first seeing a transaction to its confirmation")
+        self.duplicates_dropped = self.metrics.counter(
+            "duplicate_messages_dropped_total", "Transactions and blocks dropped as already seen")
+        # txids already taken in; repeats are dropped before clone and validation
+        self.seen = SeenCache()
         
-        self.utxo_set = UtxoSet()
-        self.ledger = Ledger(self.utxo_set, self)
+        if self.params.UTXO_BACKEND == 'persistent':
+            self.utxo_set = PersistentUtxoSet()
+        else:
+            self.utxo_set = UtxoSet()
+        self.ledger = Ledger(self.utxo_set, self, self.block_store, params=self.params)
 
-        self.received_transaction_ids = []
+        # Signing key and the outpoints paid to this node
+        self.wallet = Wallet(self.keys)
+        # Timing data for confirmation latency: txid -> time the node first saw it,
+        # plus (txid, latency) for confirmed transactions this node created.
+        self.txn_first_seen = {}
+        self.created_txn_ids = set()
+        self.confirmation_log = []
+        # txids of confirmed transactions this node only saw inside a block, oldest first
+        # (bounded). If a reorg returns one to the pool, peers may not have it either.
+        self.block_only_txids = {}
+        self.block_only_limit = 10000
         self.pow_worker = None
+        # Ident of the thread running mine_continuously (what profiler.SamplingProfiler samples)
+        self.thread_id = None
+        # perf_counter() when the oldest unprocessed block message arrived, else None
+        self.block_waiting_since = None
         self.is_running = True
+        # Light clients (spv_client.LightClient) following this node, by locking script
+        self.light_clients = {}
 
     def __str__(self):
         return str(self.ledger)
@@ -37,72 +111,126 @@ class Miner:
         print(padding, f"[@] Private Key : {self.keys['private']}")
         print(padding, f"[@] Public Key : {self.keys['public']}")
         print(padding, f"[@] Pub Key Hash : {self.pub_key_hash}")
+        print(padding, f"[@] Address : {self.address}")
 
         print(padding, "[@] Ledger")
         self.ledger.display(padding + "    ")
 
+    @staticmethod
+    def load_keys(store_dir):
+        path = os.path.join(store_dir, "keys.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def save_keys(store_dir, keys):
+        with open(os.path.join(store_dir, "keys.json"), "w") as f:
+            json.dump(keys, f)
+
+    def resume(self):
+        # Restores chain and UTXO state from the block store. Returns False if it was empty.
+        if not self.ledger.restore_from_store():
+            return False
+        self.wallet.reset(self.utxo_set.find_outputs(self.pub_key_hash))
+        return True
+
+    def state_commitment(self):
+        return self.ledger.state_commitment()
+
+    def shutdown(self):
+        # Checkpoints and closes the block store (if any).
+        if self.block_store is not None:
+            self.ledger.write_checkpoint()
+            self.block_store.close()
+
     def mine_continuously(self):
         # Main mining loop.
+        self.thread_id = threading.get_ident()
         while self.is_running:
             if not self.waiting_txn_pool:
                 time.sleep(5)
                 self.process_message_queue()
                 continue
 
-            current_pool = self.waiting_txn_pool.copy()
-            self.waiting_txn_pool = []
-
-            coinbase_txn = transaction_data.Txn.create_coinbase_txn(self.keys)
-            self.current_block = block_data.MinedBlock([coinbase_txn] + [txn for txn in current_pool], self.ledger.last_block_hash)
+            coinbase_txn = transaction_data.Txn.create_coinbase_txn(self.keys, self.params.MINING_REWARD)
+            self.current_block = self.build_block_template(coinbase_txn)
             self.perform_proof_of_work()
 
+    def build_block_template(self, coinbase_txn):
+        # Block on the current tip with the valid transactions from the pool. Selected
+        # transactions stay in the pool until a block confirms them (see
+        # Ledger.refresh_transaction_pool), so losing the race to a peer keeps them for the
+        # next template; transactions left out are dropped.
+        current_pool = self.select_block_transactions(self.waiting_txn_pool)
+        self.waiting_txn_pool = current_pool
+        self.mempool_size.set(len(current_pool))
+        return block_data.MinedBlock([coinbase_txn] + current_pool, self.ledger.last_block_hash, params=self.params)
+
+    def select_block_transactions(self, pool):
+        # Keeps, in pool order, the transactions valid on top of the ones already selected.
+        # Children of unconfirmed parents go in the same block; conflicting or unfundable
+        # transactions are left out instead of getting the whole block rejected.
+        template_view = UtxoView(self.utxo_set)
+        selected = []
+        for txn in pool:
+            if self.ledger.validate_transaction(txn, template_view):
+                template_view.add_transaction(txn)
+                selected.append(txn)
+        return selected
+
     def receive_transaction_id(self, txn_data):
-        # Records a received transaction ID (for wallet tracking).
-        self.received_transaction_ids.append(txn_data)
+        # Records a received (txid, vout) (for wallet tracking).
+        self.wallet.receive(txn_data)
 
     def create_transaction(self, receiver_address, amount):
         # Creates and broadcasts a new transaction.
-        outputs = []
-        outputs.append(txn_output.TxnOutput(amount, receiver_address))
-        
-        input_txn_ids, total_amount = self.ledger.get_available_inputs(amount)
-        if (not input_txn_ids) or (total_amount < amount):
-            # Not enough funds
-            return False
-        
-        is_change_output_self = False
-        if total_amount > amount:
-            is_change_output_self = True
-            outputs.append(txn_output.TxnOutput(total_amount - amount, self.pub_key_hash))
+        return self.create_transactions([(receiver_address, amount)])[0]
 
-        inputs = []
-        for i in input_txn_ids:
-            signature_script = helpers.generate_signature_script(self.keys, i[0])
-            inputs.append(txn_input.TxnInput(i[0], i[1], signature_script))
+    def create_transactions(self, payments):
+        # One transaction per (receiver_address, amount), created in order and broadcast
+        # as one batch; returns whether each payment could be funded.
+        txns = self.wallet.build_payments(payments, self.ledger.mempool_view)
+        for txn, payment in zip(txns, payments):
+            if txn is not None:
+                self.record_created(txn, [payment])
+        self.broadcast_transactions([txn for txn in txns if txn is not None])
+        return [txn is not None for txn in txns]
 
-        new_txn = transaction_data.Txn(inputs, outputs)
-        
-        with self.lock:
-            self.message_queue.append(("txn", new_txn))
-
-        if is_change_output_self:
-            self.received_transaction_ids.append((new_txn.transaction_id, len(new_txn.outputs)-1))
+    def create_batch_payment(self, payments):
+        # One transaction paying every (receiver_address, amount) in payments.
+        txn = self.wallet.build_payment(payments, self.ledger.mempool_view)
+        if txn is None:
+            # Not enough funds
+            return False
+        self.record_created(txn, payments)
+        self.broadcast_transaction(txn)
+        return True
 
-        with self.lock:
-            # Notify receiver (simulation shortcut)
-            p2p_network.PeerNetwork.nodes[p2p_network.PeerNetwork.address_map[receiver_address]].receive_transaction_id((new_txn.transaction_id, 0))
+    def record_created(self, txn, payments):
+        # The wallet has already put txn into the mempool view, so the next payment
+        # picks other coins; it joins our pool here.
+        self.txn_first_seen[txn.transaction_id] = time.time()
+        self.seen.add(txn.transaction_id)
+        self.created_txn_ids.add(txn.transaction_id)
+        self.events.emit(event_log.INFO, self.node_id, 'txn_created', txn.transaction_id,
+                         sum(amount for _, amount in payments))
+        self.waiting_txn_pool.append(txn)
+        self.mempool_size.set(len(self.waiting_txn_pool))
 
-        with self.lock:
-            for n in p2p_network.PeerNetwork.nodes:
-                if n != self:
-                    n.message_queue.append(("txn", new_txn))
-        return True
+        for vout, (receiver_address, _) in enumerate(payments):
+            index = self.network.address_map.get(receiver_address)
+            if index is not None:
+                # Notify receiver (simulation shortcut); light clients learn from proofs instead
+                self.network.nodes[index].receive_transaction_id((txn.transaction_id, vout))
 
     @staticmethod
-    def generate_genesis_block(keys):
-        # Generates the genesis block.
-        coinbase_txn = transaction_data.Txn.create_coinbase_txn(keys)
-        genesis_block = block_data.MinedBlock.generate_genesis(coinbase_txn)
+    def generate_genesis_block(keys, params=None):
+        # Generates the genesis block (for the module settings unless params is given).
+        reward = None if params is None else params.MINING_REWARD
+        coinbase_txn = transaction_data.Txn.create_coinbase_txn(keys, reward)
+        genesis_block = block_data.MinedBlock.generate_genesis(coinbase_txn, params)
 
         genesis_block.previous_hash = "0"*64
         # Hardcoded hash for consistency in simulation
@@ -116,68 +244,202 @@ class Miner:
 
     def broadcast_transaction(self, txn):
         # Broadcasts a transaction to the network.
-        p2p_network.PeerNetwork.broadcast_transaction(txn, self)
+        self.network.broadcast_transaction(txn, self)
+
+    def broadcast_transactions(self, txns):
+        if txns:
+            self.network.broadcast_transactions(txns, self)
 
     def handle_incoming_transaction(self, txn):
         # Validates and adds a received transaction to the pool.
-        is_valid = self.ledger.validate_transaction(txn)
-        if not is_valid:
-            print(f"T: {current_thread().name} TXN Invalid")
+        self.txn_first_seen.setdefault(txn.transaction_id, time.time())
+        view = self.ledger.mempool_view
+        if not view.contains(txn.transaction_id):
+            if self.ledger.validate_transaction(txn):
+                view.add_transaction(txn)
+            else:
+                self.events.emit(event_log.WARNING, self.node_id, 'txn_invalid', txn.transaction_id)
         self.waiting_txn_pool.append(txn)
+        self.mempool_size.set(len(self.waiting_txn_pool))
 
     def perform_proof_of_work(self):
-        # Performs Proof of Work for the current block.
-        self.pow_worker = ProofOfWork(self.current_block)
+        # Performs Proof of Work for the current block. When a peer's block moves the tip,
+        # the worker is switched to a new template on it (same coinbase) instead of
+        # abandoning the attempt; mining stops only when nothing is left to include.
+        if self.pow_worker is None:
+            self.pow_worker = ProofOfWork(self.current_block)
+        else:
+            self.pow_worker.swap_template(self.current_block)
         nonce = 0
         while True:
+            slice_start = time.perf_counter()
             result = self.pow_worker.mine(nonce)
-            if isinstance(result, int):
-                # Mining interrupted or paused to check messages
-                nonce = result
-                self.process_message_queue()
-            else:
+            if not isinstance(result, int):
                 # Mining successful or stopped
                 break
+            # Paused to check messages
+            self.record_hashes(result - nonce, slice_start)
+            nonce = result
+            waiting_since = self.block_waiting_since
+            self.pow_worker.adapt(self.process_message_queue())
+            if self.current_block.previous_hash != self.ledger.last_block_hash:
+                if waiting_since is not None:
+                    self.stale_work.inc(time.perf_counter() - waiting_since)
+                if not self.waiting_txn_pool:
+                    return
+                self.current_block = self.build_block_template(self.current_block.transactions[0])
+                self.pow_worker.swap_template(self.current_block)
+                self.template_swaps.inc()
+                nonce = 0
 
         if result is None:
             return
 
+        self.record_hashes(result.nonce - nonce, slice_start)
+        self.blocks_mined.inc()
         self.current_block.nonce = result.nonce
         self.current_block.block_hash = result.block_hash
-        self.current_block.display()
-        print("T: ", current_thread().name, "[MINED] [BLOCK]")
+        self.events.emit(event_log.INFO, self.node_id, 'block_mined', result.block_hash,
+                         self.current_block.previous_hash, result.nonce, len(self.current_block.transactions))
         self.ledger.append_block(self.current_block)
-        p2p_network.PeerNetwork.broadcast_block(self.current_block, self)
+        self.network.broadcast_block(self.current_block, self)
+
+    def record_hashes(self, count, slice_start):
+        elapsed = time.perf_counter() - slice_start
+        self.hashes_computed.inc(count)
+        if elapsed > 0:
+            self.hashrate.set(count / elapsed)
 
     def process_message_queue(self):
-        # Processes messages from the queue.
-        while len(self.message_queue):
-            with self.lock:
-                msg_type, msg = self.message_queue.popleft()
-            
-            if msg_type == "txn":
-                print("T: ", current_thread().name, "[RECEIVED] [TXN]")
-                txn_copy = msg.clone()
-                self.handle_incoming_transaction(txn_copy)
-            elif msg_type == "block":
-                print("T: ", current_thread().name, "[RECEIVED] [BLOCK]")
-                block_copy = msg.clone()
-                self.handle_incoming_block(block_copy)
-            elif msg_type == "new_txn":
-                print("T: ", current_thread().name, "[CREATED] [TXN]")
-                receiver_address, amount = msg[0], msg[1]
-                self.create_transaction(receiver_address, amount)
+        # Processes messages from the mailbox, including any that arrive meanwhile;
+        # returns how many there were.
+        self.queue_depth.set(len(self.mailbox))
+        self.block_waiting_since = None
+        processed = 0
+        while True:
+            messages = self.mailbox.drain()
+            if not messages:
+                return processed
+            processed += len(messages)
+            self.messages_processed.inc(len(messages))
+            # Runs of payment requests are created and broadcast together
+            payments = []
+            for msg_type, msg in messages:
+                if msg_type == "new_txn":
+                    self.events.emit(event_log.DEBUG, self.node_id, 'message', msg_type)
+                    payments.append((msg[0], msg[1]))
+                    continue
+                if payments:
+                    self.create_transactions(payments)
+                    payments = []
+                self.handle_message(msg_type, msg)
+            if payments:
+                self.create_transactions(payments)
+
+    def handle_message(self, msg_type, msg):
+        if msg_type == "txn":
+            if self.seen.seen(msg.transaction_id):
+                self.duplicates_dropped.inc()
+                return
+            # Every transaction taken in stays in the pool, so later copies add nothing
+            self.seen.add(msg.transaction_id)
+            self.events.emit(event_log.INFO, self.node_id, 'txn_received', msg.transaction_id)
+            txn_copy = msg.clone()
+            self.handle_incoming_transaction(txn_copy)
+        elif msg_type == "block":
+            # Exact check: a Bloom false positive would lose a block (and its descendants)
+            # for good, as nothing asks for it again
+            if self.ledger.consensus.has_block(msg.block_hash):
+                self.duplicates_dropped.inc()
+                return
+            self.events.emit(event_log.INFO, self.node_id, 'block_received', msg.block_hash, msg.previous_hash)
+            block_copy = msg.clone()
+            self.handle_incoming_block(block_copy)
+        elif msg_type == "new_txn":
+            self.events.emit(event_log.DEBUG, self.node_id, 'message', msg_type)
+            receiver_address, amount = msg[0], msg[1]
+            self.create_transaction(receiver_address, amount)
+        elif msg_type == "new_payments":
+            # [(receiver_address, amount), ...] paid by one transaction
+            self.events.emit(event_log.DEBUG, self.node_id, 'message', msg_type)
+            self.create_batch_payment(msg)
 
     def send_message(self, message):
-        # Adds a message to the queue.
+        # Adds a message to the mailbox.
+        if message[0] == "block" and self.block_waiting_since is None:
+            self.block_waiting_since = time.perf_counter()
+        self.mailbox.put(message)
+
+    def send_messages(self, messages):
+        # Adds several messages to the mailbox under one lock acquisition.
+        if self.block_waiting_since is None and any(msg_type == "block" for msg_type, _ in messages):
+            self.block_waiting_since = time.perf_counter()
+        self.mailbox.put_many(messages)
+
+    def record_confirmations(self, block):
+        # Called when a block joins this node's main chain.
+        now = time.time()
+        for txn in block.transactions[1:]:
+            first_seen = self.txn_first_seen.pop(txn.transaction_id, None)
+            if first_seen is None:
+                if len(self.block_only_txids) >= self.block_only_limit:
+                    self.block_only_txids.pop(next(iter(self.block_only_txids)))
+                self.block_only_txids[txn.transaction_id] = True
+                continue
+            self.confirmation_latency.observe(now - first_seen)
+            if txn.transaction_id in self.created_txn_ids:
+                self.created_txn_ids.discard(txn.transaction_id)
+                self.confirmation_log.append((txn.transaction_id, now - first_seen))
+                self.events.emit(event_log.INFO, self.node_id, 'txn_confirmed', txn.transaction_id, now - first_seen)
+
+        self.wallet.forget_spent(block)
+        # Mining rewards become spendable once their block is on the main chain
+        coinbase = block.transactions[0]
+        if coinbase.outputs[0].locking_script == self.pub_key_hash:
+            self.receive_transaction_id((coinbase.transaction_id, 0))
+
+    def record_disconnections(self, blocks):
+        # Called with the blocks a reorg disconnected, once the UTXO set is back at the
+        # fork point: our outputs they spent are unspent again, and their rewards are gone.
+        for block in blocks:
+            coinbase = block.transactions[0]
+            if coinbase.outputs[0].locking_script == self.pub_key_hash:
+                self.wallet.outpoints.pop((coinbase.transaction_id, 0), None)
+            for txn in block.transactions[1:]:
+                for inp in txn.inputs:
+                    spent_txn = self.utxo_set.get_transaction(inp.transaction_id)
+                    vout = int(inp.output_index)
+                    if (spent_txn and self.utxo_set.has_output(inp.transaction_id, vout)
+                            and spent_txn.outputs[vout].locking_script == self.pub_key_hash):
+                        self.receive_transaction_id((inp.transaction_id, vout))
+
+    def relay_reinjected(self, txns):
+        # Called with the transactions a reorg returned to the pool. Only those this node
+        # never received loose are announced (in one batch): the others went through
+        # ordinary relay, and peers that follow the reorg put them back on their own.
+        missing = [txn for txn in txns if self.block_only_txids.pop(txn.transaction_id, None)]
+        if missing:
+            self.network.broadcast_transactions(missing, self)
+
+    def subscribe_light_client(self, client):
         with self.lock:
-            self.message_queue.append(message)
+            self.light_clients.setdefault(client.pub_key_hash, []).append(client)
+
+    def serve_light_clients(self, block, height):
+        # Announces a main-chain block to every light client: its header, plus Merkle
+        # proofs for the transactions that concern that client.
+        if not self.light_clients:
+            return
+        with self.lock:
+            subscribers = [(script, list(clients)) for script, clients in self.light_clients.items()]
+        header = block.header()
+        proofs = spv_client.block_proofs(block, height, self.light_clients, self.params.MERKLE_TREE_ARITY)
+        for script, clients in subscribers:
+            for client in clients:
+                client.send_message(("block", (header, height, proofs.get(script, []))))
 
     def handle_incoming_block(self, block):
         # Handles a received block.
         success = self.ledger.append_block(block)
         if not success:
-            print("[?] Block validation failed or not added")
-        else:
-            if self.pow_worker is not None:
-                self.pow_worker.stop_mining = True
\ No newline at end of file
+            self.events.emit(event_log.WARNING, self.node_id, 'block_rejected', block.block_hash)
\ No newline at end of file
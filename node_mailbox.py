@@ -0,0 +1,58 @@
+from threading import Lock
+
+from metrics import MetricsRegistry
+
+# Multi-producer, single-consumer mailbox for a node's incoming messages.
+#   put / put_many   one lock acquisition per call, however many messages it carries
+#   drain            swaps the whole pending list out in one step; the consumer then
+#                    works through it without touching the lock again
+# Nothing is called out to while the mailbox lock is held, so senders never nest it
+# inside another node's lock (or their own). Contention is counted by first trying the
+# lock without blocking.
+
+class Mailbox:
+    def __init__(self, metrics=None):
+        self.lock = Lock()
+        self.pending = []
+        if metrics is None:
+            metrics = MetricsRegistry()
+        self.delivered = metrics.counter("mailbox_messages_total", "Messages taken out of the mailbox")
+        self.contended = metrics.counter(
+            "mailbox_lock_contended_total", "Mailbox lock acquisitions that had to wait")
+        self.drain_size = metrics.histogram("mailbox_drain_size", "Messages taken per drain", scale=1)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def wait(self):
+        # Slow path of a lock acquisition that found the lock taken.
+        self.lock.acquire()
+        self.contended.inc()
+
+    def put(self, message):
+        if not self.lock.acquire(False):
+            self.wait()
+        self.pending.append(message)
+        self.lock.release()
+
+    def put_many(self, messages):
+        if not self.lock.acquire(False):
+            self.wait()
+        self.pending.extend(messages)
+        self.lock.release()
+
+    def drain(self):
+        # Every pending message, oldest first, leaving the mailbox empty.
+        if not self.pending:
+            return []
+        if not self.lock.acquire(False):
+            self.wait()
+        messages, self.pending = self.pending, []
+        self.lock.release()
+        # Counted here, by the single consumer, to keep puts short
+        self.delivered.inc(len(messages))
+        self.drain_size.observe(len(messages))
+        return messages
+
+if __name__ == '__main__':
+    pass
@@ -1,33 +1,66 @@
+import os
+
 import miner_node
+from keystore import KeyStore
 
-class PeerNetwork:
+class Network:
     # Simulates a P2P network with star topology.
-    nodes  = [] 
-    address_map = {} # pub_key_hash -> index in nodes
+    # Each Network holds its own nodes and chain settings (params: a settings.ChainParams,
+    # or None for the module settings), so several can run side by side in one process.
+    def __init__(self, params=None):
+        self.params = params
+        self.nodes = []
+        self.address_map = {} # pub_key_hash -> index in nodes
+        self.light_clients = [] # spv_client.LightClient wallets following the full nodes
 
-    def __init__(self):
-        pass
+    def reset(self, params=None):
+        # Drops every node and light client, keeping the network object itself.
+        self.__init__(params)
 
-    @staticmethod
-    def add_node(n):
-        PeerNetwork.nodes.append(n)
+    def add_node(self, n):
+        self.address_map[n.pub_key_hash] = len(self.nodes)
+        self.nodes.append(n)
 
-    @staticmethod
-    def initialize_nodes(num_nodes):
+    def initialize_nodes(self, num_nodes, store_root=None, key_seed=None, keystore_path=None):
+        # With store_root, node i persists its state under store_root/node<i>.
+        # With key_seed, node keys are derived deterministically (and cached in keystore_path,
+        # by default store_root/keystore.json) instead of drawn from OS randomness.
+        keys = [None] * num_nodes
+        if key_seed is not None:
+            if keystore_path is None and store_root is not None:
+                keystore_path = os.path.join(store_root, "keystore.json")
+            keys = KeyStore(key_seed, keystore_path).get(num_nodes)
         for i in range(num_nodes):
-            PeerNetwork.nodes.append(miner_node.Miner())
+            store_dir = None if store_root is None else os.path.join(store_root, f"node{i}")
+            self.nodes.append(miner_node.Miner(store_dir, keys[i], network=self, params=self.params))
 
-    @staticmethod
-    def broadcast_transaction(txn, src_node):
-        for n in PeerNetwork.nodes:
-            if n != src_node:
-                n.send_message(("txn", txn))
+    def state_commitments(self):
+        # node_id -> (tip hash, height, UTXO digest) for every node.
+        return {n.node_id: n.state_commitment() for n in self.nodes}
 
-    @staticmethod
-    def broadcast_block(block, src_node):
-        for n in PeerNetwork.nodes:
+    def converged(self):
+        # True when every node has the same tip and UTXO set (one comparison per node).
+        commitments = set(n.state_commitment() for n in self.nodes)
+        return len(commitments) <= 1
+
+    def broadcast_messages(self, messages, src_node):
+        # Delivers a batch of messages to every node but src_node, taking each
+        # recipient's mailbox lock once for the whole batch.
+        for n in self.nodes:
             if n != src_node:
-                n.send_message(("block", block))
+                n.send_messages(messages)
+
+    def broadcast_transaction(self, txn, src_node):
+        self.broadcast_messages((("txn", txn),), src_node)
+
+    def broadcast_transactions(self, txns, src_node):
+        self.broadcast_messages([("txn", txn) for txn in txns], src_node)
+
+    def broadcast_block(self, block, src_node):
+        self.broadcast_messages((("block", block),), src_node)
+
+# The process-wide network that nodes created without one join
+PeerNetwork = Network()
 
 if __name__ == '__main__':
-    pass
\ No newline at end of file
+    pass
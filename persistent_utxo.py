@@ -0,0 +1,222 @@
+from collections import OrderedDict
+import threading
+
+from utxo_set import UtxoSet, UtxoEntry
+from utxo_commitment import MuHash
+
+# Persistent UTXO backend: the set lives in a hash array mapped trie (HAMT) whose nodes are
+# never modified. An update copies only the nodes on the path to the changed entry and
+# shares everything else with the previous version, so keeping old versions is cheap:
+#   - reverting a block is switching back to the version from before it, and
+#   - nodes that apply the same block to the same version reuse one result (see
+#     VersionRegistry), so N nodes on the same tip hold the same root.
+# Txids are hashes, so their hex digits serve directly as the trie's hash bits.
+
+_DIGITS = {char: i for i, char in enumerate("0123456789abcdef")}
+_DIGITS.update({char.upper(): i for char, i in _DIGITS.items() if char.isalpha()})
+
+class HamtNode:
+    # bitmap bit d is set if a slot exists for digit d; items holds one entry per set bit,
+    # in digit order: either a child HamtNode or a (key, value) leaf.
+    __slots__ = ('bitmap', 'items')
+
+    def __init__(self, bitmap, items):
+        self.bitmap = bitmap
+        self.items = items
+
+EMPTY = HamtNode(0, ())
+
+def hamt_get(node, key):
+    level = 0
+    while True:
+        bit = 1 << _DIGITS[key[level]]
+        if not node.bitmap & bit:
+            return None
+        item = node.items[(node.bitmap & (bit - 1)).bit_count()]
+        if type(item) is HamtNode:
+            node = item
+            level += 1
+            continue
+        return item[1] if item[0] == key else None
+
+def hamt_set(node, key, value, level=0):
+    # New version of `node` with key -> value.
+    bit = 1 << _DIGITS[key[level]]
+    index = (node.bitmap & (bit - 1)).bit_count()
+    items = node.items
+    if not node.bitmap & bit:
+        return HamtNode(node.bitmap | bit, items[:index] + ((key, value),) + items[index:])
+    item = items[index]
+    if type(item) is HamtNode:
+        child = hamt_set(item, key, value, level + 1)
+    elif item[0] == key:
+        child = (key, value)
+    else:
+        # Two keys share this digit: push both one level down
+        child = hamt_set(hamt_set(EMPTY, item[0], item[1], level + 1), key, value, level + 1)
+    return HamtNode(node.bitmap, items[:index] + (child,) + items[index + 1:])
+
+def hamt_delete(node, key, level=0):
+    # New version of `node` without key (the same node if key is absent).
+    bit = 1 << _DIGITS[key[level]]
+    if not node.bitmap & bit:
+        return node
+    index = (node.bitmap & (bit - 1)).bit_count()
+    items = node.items
+    item = items[index]
+    if type(item) is HamtNode:
+        child = hamt_delete(item, key, level + 1)
+        if child is item:
+            return node
+        if len(child.items) == 1 and type(child.items[0]) is not HamtNode:
+            # A lone leaf moves back up, keeping paths as short as the keys require
+            child = child.items[0]
+        elif not child.items:
+            child = None
+    elif item[0] == key:
+        child = None
+    else:
+        return node
+    if child is None:
+        return HamtNode(node.bitmap & ~bit, items[:index] + items[index + 1:])
+    return HamtNode(node.bitmap, items[:index] + (child,) + items[index + 1:])
+
+def hamt_items(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for item in node.items:
+            if type(item) is HamtNode:
+                stack.append(item)
+            else:
+                yield item
+
+class UtxoVersion:
+    # An immutable state of a PersistentUtxoSet.
+    __slots__ = ('root', 'size', 'commitment')
+
+    def __init__(self, root, size, commitment):
+        self.root = root
+        self.size = size
+        self.commitment = commitment
+
+class VersionRegistry:
+    # (root, block) -> the version applying that block to the set with that HAMT root
+    # produces. Roots are compared by identity: nodes that reused a result hold the very
+    # same root. A block is identified by its hash and merkle root (the genesis hash is a
+    # fixed placeholder, so the hash alone does not pin down the transactions). Shared by
+    # every node in the process; the oldest results are forgotten once `limit` are held.
+    def __init__(self, limit=1024):
+        self.limit = limit
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+
+    def get(self, root, block):
+        with self.lock:
+            result = self.results.get((root, block.block_hash, block.merkle_tree_root))
+            if result is not None:
+                self.hits += 1
+            return result
+
+    def put(self, root, block, result):
+        with self.lock:
+            self.results[(root, block.block_hash, block.merkle_tree_root)] = result
+            while len(self.results) > self.limit:
+                self.results.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+SHARED_VERSIONS = VersionRegistry()
+
+class PersistentUtxoSet(UtxoSet):
+    # UtxoSet backed by a HAMT of txid -> UtxoEntry. Entries are replaced, never
+    # modified, since older versions may still reference them.
+    def __init__(self):
+        self.root = EMPTY
+        self.size = 0
+        self.commitment = MuHash()
+
+    def version(self):
+        return UtxoVersion(self.root, self.size, self.commitment.copy())
+
+    def checkout(self, version):
+        # Switches to a previously taken version.
+        self.root = version.root
+        self.size = version.size
+        self.commitment = version.commitment.copy()
+
+    def copy(self):
+        other = PersistentUtxoSet()
+        other.checkout(self.version())
+        return other
+
+    def add_transaction(self, txn):
+        previous = hamt_get(self.root, txn.transaction_id)
+        if previous is not None:
+            for vout in previous.vouts():
+                self.size -= 1
+                self.commitment.remove_outpoint(txn.transaction_id, vout)
+        self.size += len(txn.outputs)
+        for vout in range(len(txn.outputs)):
+            self.commitment.add_outpoint(txn.transaction_id, vout)
+        self.root = hamt_set(self.root, txn.transaction_id, UtxoEntry(txn, (1 << len(txn.outputs)) - 1))
+
+    def add_output(self, transaction_id, output_index, txn=None):
+        entry = hamt_get(self.root, transaction_id)
+        if entry is None:
+            if txn is None:
+                return
+            entry = UtxoEntry(txn, 0)
+        bit = 1 << int(output_index)
+        if entry.unspent & bit:
+            return
+        self.size += 1
+        self.commitment.add_outpoint(transaction_id, output_index)
+        self.root = hamt_set(self.root, transaction_id, UtxoEntry(entry.txn, entry.unspent | bit))
+
+    def has_output(self, transaction_id, output_index):
+        entry = hamt_get(self.root, transaction_id)
+        output_index = int(output_index)
+        return entry is not None and output_index >= 0 and bool(entry.unspent >> output_index & 1)
+
+    def get_transaction(self, transaction_id):
+        entry = hamt_get(self.root, transaction_id)
+        return False if entry is None else entry.txn
+
+    def remove_output(self, transaction_id, output_index):
+        # Same contract as UtxoSet.remove_output: the spent output's transaction, or None.
+        entry = hamt_get(self.root, transaction_id)
+        output_index = int(output_index)
+        if entry is None or output_index < 0 or not entry.unspent >> output_index & 1:
+            return None
+        self.size -= 1
+        self.commitment.remove_outpoint(transaction_id, output_index)
+        unspent = entry.unspent & ~(1 << output_index)
+        if unspent:
+            self.root = hamt_set(self.root, transaction_id, UtxoEntry(entry.txn, unspent))
+        else:
+            self.root = hamt_delete(self.root, transaction_id)
+        return entry.txn
+
+    def remove_transaction(self, txn):
+        entry = hamt_get(self.root, txn.transaction_id)
+        if entry is None:
+            return
+        for vout in entry.vouts():
+            self.size -= 1
+            self.commitment.remove_outpoint(txn.transaction_id, vout)
+        self.root = hamt_delete(self.root, txn.transaction_id)
+
+    def entries(self):
+        for _, entry in hamt_items(self.root):
+            yield entry.txn, entry.vouts()
+
+    def display(self):
+        for key, entry in hamt_items(self.root):
+            print(key, "->", entry)
+
+if __name__ == '__main__':
+    pass
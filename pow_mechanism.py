@@ -1,5 +1,20 @@
 import sys
+import time
 from helpers import compute_double_sha256
+import block_data
+
+# Mining runs in slices so the miner can check its message queue in between. A slice
+# lasts about `slice_seconds` rather than a fixed number of nonces: the worker sizes each
+# batch from the hash rate it just measured. adapt() shortens slices while messages keep
+# arriving (a new tip is acted on sooner) and lengthens them while the queue stays empty.
+MIN_SLICE_SECONDS = 0.001
+MAX_SLICE_SECONDS = 0.05
+INITIAL_BATCH = 1000
+
+def get_target(difficulty_bits):
+    # Target is a number that the block hash must be less than.
+    # We represent it as a string for comparison here, matching original logic.
+    return "0" * difficulty_bits + "1" + "0" * (64 - difficulty_bits)
 
 class MiningResult:
     # Stores the result of a successful mining attempt.
@@ -9,32 +24,53 @@ class MiningResult:
 
 class ProofOfWork:
     # Handles the Proof of Work algorithm.
-    def __init__(self, block):
+    def __init__(self, block, slice_seconds=0.01):
         self.stop_mining = False
+        self.slice_seconds = slice_seconds
+        self.batch = INITIAL_BATCH
+        self.swap_template(block)
+
+    def swap_template(self, block):
+        # Points the worker at another block template (e.g. on a new tip). The caller
+        # restarts from nonce 0; the calibrated batch size and slice length carry over.
         self.block = block
-        # Target is a number that the block hash must be less than.
-        # We represent it as a string for comparison here, matching original logic.
         # The target is determined by the difficulty bits.
-        self.target = "0" * block.difficulty_bits + "1" + "0" * (64 - block.difficulty_bits)
+        self.target = get_target(block.difficulty_bits)
+        self.header_prefix = block_data.header_prefix(block.previous_hash, block.merkle_tree_root,
+                                                      block.difficulty_bits)
 
     def mine(self, start_nonce):
         # Attempts to find a nonce that results in a hash lower than the target.
-        # Returns a MiningResult if successful, or the last checked nonce if interrupted.
-        for nonce in range(start_nonce + 1, sys.maxsize):
+        # Returns a MiningResult if successful, None if stopped, or the last checked nonce
+        # once the slice is used up.
+        slice_start = time.perf_counter()
+        prefix = self.header_prefix
+        target = self.target
+        end = min(start_nonce + self.batch, sys.maxsize - 1)
+        for nonce in range(start_nonce + 1, end + 1):
             if self.stop_mining:
-                return None 
-            
-            current_hash = self.calculate_block_hash(nonce)
-            if current_hash < self.target:
+                return None
+
+            current_hash = compute_double_sha256(prefix + block_data.serialize_nonce(nonce))
+            if current_hash < target:
                 return MiningResult(nonce, current_hash)
 
-            # Return progress every 1000 iterations to allow checking for new blocks
-            if nonce % 1000 == 0:
-                return nonce
+        elapsed = time.perf_counter() - slice_start
+        if elapsed > 0:
+            # Size the next batch to fill the slice at this rate, growing at most 4x a slice
+            self.batch = max(1, min(self.batch * 4, int(self.batch * self.slice_seconds / elapsed)))
+        return end
+
+    def adapt(self, messages):
+        # Called after each pause with the number of messages that were waiting.
+        if messages:
+            self.slice_seconds = max(MIN_SLICE_SECONDS, self.slice_seconds / 2)
+        else:
+            self.slice_seconds = min(MAX_SLICE_SECONDS, self.slice_seconds * 1.25)
 
     def calculate_block_hash(self, nonce):
         # Calculates the hash of the block header with the given nonce.
         return compute_double_sha256(self.block.serialize_header(nonce))
 
 if __name__ == '__main__':
-    pass
\ No newline at end of file
+    pass
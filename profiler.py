@@ -0,0 +1,176 @@
+import os
+import sys
+import threading
+import time
+
+# Sampling profiler for node threads. A background thread wakes every `interval` seconds,
+# reads the current stack of each attached node's thread (sys._current_frames) and
+# charges it with:
+#   wall  the time since the previous sample, whether the thread ran or waited
+#   cpu   the CPU time the thread used since the previous sample
+# Each stack is filed under its node and the simulator region it is in (the innermost
+# frame listed in REGIONS; 'other' outside them). Node threads themselves record
+# nothing, so a node that is not attached, or a profiler that is not running, costs
+# nothing. Nodes can be attached and detached while the profiler runs.
+# write_collapsed() produces "frame;frame;...;frame weight" lines (weights in
+# microseconds), the input format of flamegraph.pl, inferno and speedscope.
+
+# (module, function) -> region
+REGIONS = {
+    ('pow_mechanism', 'mine'): 'mine',
+    ('chain_manager', 'validate_block'): 'validate_block',
+    ('chain_manager', 'check_block'): 'validate_block',
+    ('miner_node', 'process_message_queue'): 'process_message_queue',
+    ('chain_manager', 'handle_reorg'): 'handle_reorg',
+}
+MAX_DEPTH = 64
+
+_LABELS = {}
+
+def frame_label(code):
+    # (module, "module:qualified name") for a code object, cached per code object.
+    label = _LABELS.get(code)
+    if label is None:
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        label = (module, f"{module}:{getattr(code, 'co_qualname', code.co_name)}")
+        _LABELS[code] = label
+    return label
+
+def thread_cpu_clock(thread_id):
+    # Clock id measuring one thread's CPU time, or None where unsupported.
+    try:
+        return time.pthread_getcpuclockid(thread_id)
+    except (AttributeError, OSError, OverflowError):
+        return None
+
+class SamplingProfiler:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.nodes = {}
+        self.lock = threading.Lock()
+        # stack string -> [wall seconds, cpu seconds]
+        self.stacks = {}
+        # node_id -> region -> [wall seconds, cpu seconds]
+        self.regions = {}
+        self.samples = 0
+        # thread id -> (cpu clock, last cpu reading)
+        self.cpu_clocks = {}
+        self.thread = None
+        self.running = False
+
+    def attach(self, node):
+        # Starts sampling node's mining thread (node.thread_id, once it has started).
+        with self.lock:
+            self.nodes[node.node_id] = node
+
+    def detach(self, node):
+        with self.lock:
+            self.nodes.pop(node.node_id, None)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def reset(self):
+        with self.lock:
+            self.stacks = {}
+            self.regions = {}
+            self.samples = 0
+
+    def run(self):
+        previous = time.perf_counter()
+        while self.running:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            self.sample(now - previous)
+            previous = now
+
+    def sample(self, wall):
+        frames = sys._current_frames()
+        with self.lock:
+            for node_id, node in self.nodes.items():
+                thread_id = getattr(node, 'thread_id', None)
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                self.record(node_id, frame, wall, self.cpu_delta(thread_id))
+            self.samples += 1
+
+    def cpu_delta(self, thread_id):
+        clock, last = self.cpu_clocks.get(thread_id, (None, None))
+        if clock is None:
+            clock = thread_cpu_clock(thread_id)
+            if clock is None:
+                return 0.0
+        try:
+            reading = time.clock_gettime(clock)
+        except OSError:
+            # The thread has exited
+            self.cpu_clocks.pop(thread_id, None)
+            return 0.0
+        self.cpu_clocks[thread_id] = (clock, reading)
+        return 0.0 if last is None else reading - last
+
+    def record(self, node_id, frame, wall, cpu):
+        labels = []
+        region = None
+        while frame is not None and len(labels) < MAX_DEPTH:
+            module, label = frame_label(frame.f_code)
+            if region is None:
+                region = REGIONS.get((module, frame.f_code.co_name))
+            labels.append(label)
+            frame = frame.f_back
+        region = region or 'other'
+        labels.append(region)
+        labels.append(f"node {node_id}")
+        stack = ";".join(reversed(labels))
+        totals = self.stacks.setdefault(stack, [0.0, 0.0])
+        totals[0] += wall
+        totals[1] += cpu
+        totals = self.regions.setdefault(node_id, {}).setdefault(region, [0.0, 0.0])
+        totals[0] += wall
+        totals[1] += cpu
+
+    def collapsed(self, kind='wall'):
+        # stack -> weight in microseconds; kind is 'wall' or 'cpu'.
+        index = 0 if kind == 'wall' else 1
+        with self.lock:
+            return {stack: int(totals[index] * 1e6) for stack, totals in self.stacks.items()
+                    if totals[index] > 0}
+
+    def write_collapsed(self, path, kind='wall'):
+        with open(path, 'w') as f:
+            for stack, weight in sorted(self.collapsed(kind).items()):
+                f.write(f"{stack} {weight}\n")
+
+    def write_flamegraph_files(self, prefix):
+        # <prefix>.wall.folded and <prefix>.cpu.folded; returns their paths.
+        paths = []
+        for kind in ('wall', 'cpu'):
+            path = f"{prefix}.{kind}.folded"
+            self.write_collapsed(path, kind)
+            paths.append(path)
+        return paths
+
+    def region_summary(self):
+        # node_id -> region -> {'wall': seconds, 'cpu': seconds}
+        with self.lock:
+            return {node_id: {region: {'wall': totals[0], 'cpu': totals[1]}
+                              for region, totals in regions.items()}
+                    for node_id, regions in self.regions.items()}
+
+    def display(self):
+        for node_id, regions in sorted(self.region_summary().items()):
+            for region, totals in sorted(regions.items(), key=lambda item: -item[1]['wall']):
+                print(f"[#] {node_id} {region:<22} wall {totals['wall']:8.3f}s cpu {totals['cpu']:8.3f}s")
+
+if __name__ == '__main__':
+    pass
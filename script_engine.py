@@ -1,35 +1,299 @@
-import helpers
+from functools import lru_cache
+import hashlib
+
+import address_codec
 from ecdsa import SigningKey, SECP256k1, VerifyingKey
 
+# Stack-based script execution.
+# Locking scripts come in two encodings:
+#   - a bare 20-byte public key hash (40 hex characters): the simulator's original P2PKH
+#     form, unlocked by <64-byte signature><64-byte public key> with no opcodes
+#   - serialized scripts (hex) built from the opcodes below, Bitcoin style
+# compile_script() parses a locking script once (cached per script) and classifies it.
+# P2PKH and bare m-of-n multisig scripts are checked by dedicated fast paths; any other
+# script runs through the general interpreter. Unlocking scripts must be push-only.
+# Signatures are raw 64-byte ECDSA (r || s) over the message, public keys raw 64-byte points.
+
+OP_0 = 0x00
+OP_PUSHDATA1 = 0x4c
+OP_PUSHDATA2 = 0x4d
+OP_1NEGATE = 0x4f
+OP_1 = 0x51
+OP_16 = 0x60
+OP_VERIFY = 0x69
+OP_RETURN = 0x6a
+OP_DROP = 0x75
+OP_DUP = 0x76
+OP_EQUAL = 0x87
+OP_EQUALVERIFY = 0x88
+OP_SHA256 = 0xa8
+OP_HASH160 = 0xa9
+OP_CHECKSIG = 0xac
+OP_CHECKSIGVERIFY = 0xad
+OP_CHECKMULTISIG = 0xae
+OP_CHECKMULTISIGVERIFY = 0xaf
+
+MAX_MULTISIG_KEYS = 16
+
+LEGACY_P2PKH = 'legacy_p2pkh'
+P2PKH = 'p2pkh'
+MULTISIG = 'multisig'
+NONSTANDARD = 'nonstandard'
+INVALID = 'invalid'
+
+def parse_script(data):
+    # Script bytes -> tuple of operations: bytes for data pushes (OP_0 pushes b''),
+    # ints for every other opcode. Raises ValueError on a truncated push.
+    ops = []
+    i = 0
+    end = len(data)
+    while i < end:
+        op = data[i]
+        i += 1
+        if op > OP_PUSHDATA2:
+            ops.append(op)
+            continue
+        if op == OP_PUSHDATA1:
+            size = data[i] if i < end else -1
+            i += 1
+        elif op == OP_PUSHDATA2:
+            size = int.from_bytes(data[i:i + 2], "little") if i + 2 <= end else -1
+            i += 2
+        else:
+            size = op
+        if size < 0 or i + size > end:
+            raise ValueError("Script push runs past the end of the script")
+        ops.append(data[i:i + size])
+        i += size
+    return tuple(ops)
+
+def push(data):
+    # Serialized push of `data` (bytes).
+    if len(data) < OP_PUSHDATA1:
+        return bytes([len(data)]) + data
+    if len(data) <= 0xff:
+        return bytes([OP_PUSHDATA1, len(data)]) + data
+    return bytes([OP_PUSHDATA2]) + len(data).to_bytes(2, "little") + data
+
+def build_script(items):
+    # Hex script from a list of opcodes (ints) and data pushes (bytes).
+    return b"".join(push(item) if isinstance(item, bytes) else bytes([item]) for item in items).hex()
+
+def p2pkh_script(pub_key_hash):
+    # OP_DUP OP_HASH160 <pub_key_hash> OP_EQUALVERIFY OP_CHECKSIG
+    return build_script([OP_DUP, OP_HASH160, bytes.fromhex(pub_key_hash), OP_EQUALVERIFY, OP_CHECKSIG])
+
+def multisig_script(required, public_keys):
+    # OP_m <key 1> ... <key n> OP_n OP_CHECKMULTISIG, keys as hex.
+    if not 1 <= required <= len(public_keys) <= MAX_MULTISIG_KEYS:
+        raise ValueError(f"Cannot build a {required}-of-{len(public_keys)} multisig script")
+    return build_script([OP_1 + required - 1] + [bytes.fromhex(key) for key in public_keys]
+                        + [OP_1 + len(public_keys) - 1, OP_CHECKMULTISIG])
+
+def small_int(op):
+    # Value of OP_1..OP_16, else None.
+    if type(op) is int and OP_1 <= op <= OP_16:
+        return op - OP_1 + 1
+    return None
+
+class CompiledScript:
+    # A parsed locking script and the template it matched. For P2PKH, pub_key_hash is the
+    # 20-byte hash; for multisig, `required` of `public_keys` must sign.
+    __slots__ = ('kind', 'ops', 'pub_key_hash', 'required', 'public_keys')
+
+    def __init__(self, kind, ops=(), pub_key_hash=None, required=0, public_keys=()):
+        self.kind = kind
+        self.ops = ops
+        self.pub_key_hash = pub_key_hash
+        self.required = required
+        self.public_keys = public_keys
+
+@lru_cache(maxsize=65536)
+def compile_script(locking_script):
+    # Locking scripts repeat across every output paid to the same owner, so each is
+    # parsed and classified once.
+    try:
+        data = bytes.fromhex(locking_script)
+        if len(data) == 20:
+            return CompiledScript(LEGACY_P2PKH, pub_key_hash=data)
+        ops = parse_script(data)
+    except ValueError:
+        return CompiledScript(INVALID)
+
+    if (len(ops) == 5 and ops[0] == OP_DUP and ops[1] == OP_HASH160 and type(ops[2]) is bytes
+            and len(ops[2]) == 20 and ops[3] == OP_EQUALVERIFY and ops[4] == OP_CHECKSIG):
+        return CompiledScript(P2PKH, ops, pub_key_hash=ops[2])
+    if len(ops) >= 4 and ops[-1] == OP_CHECKMULTISIG:
+        required, count = small_int(ops[0]), small_int(ops[-2])
+        keys = ops[1:-2]
+        if (required is not None and count == len(keys) and required <= count
+                and all(type(key) is bytes for key in keys)):
+            return CompiledScript(MULTISIG, ops, required=required, public_keys=keys)
+    return CompiledScript(NONSTANDARD, ops)
+
+@lru_cache(maxsize=4096)
+def verifying_key(public_key):
+    return VerifyingKey.from_string(public_key, curve=SECP256k1)
+
+def check_signature(signature, public_key, message):
+    try:
+        return verifying_key(public_key).verify(signature, message)
+    except Exception:
+        return False
+
+def check_multisig(signatures, public_keys, message):
+    # Signatures must match distinct keys in key order, as OP_CHECKMULTISIG requires.
+    k = 0
+    for i, signature in enumerate(signatures):
+        while True:
+            if len(public_keys) - k < len(signatures) - i:
+                return False
+            k += 1
+            if check_signature(signature, public_keys[k - 1], message):
+                break
+    return True
+
+def encode_num(value):
+    # Minimal little-endian sign-magnitude encoding of a script number.
+    if value == 0:
+        return b""
+    magnitude = abs(value)
+    data = bytearray()
+    while magnitude:
+        data.append(magnitude & 0xff)
+        magnitude >>= 8
+    if data[-1] & 0x80:
+        data.append(0x80 if value < 0 else 0)
+    elif value < 0:
+        data[-1] |= 0x80
+    return bytes(data)
+
+def decode_num(data):
+    if not data:
+        return 0
+    value = int.from_bytes(data, "little")
+    if data[-1] & 0x80:
+        return -(value & ~(0x80 << (8 * (len(data) - 1))))
+    return value
+
+def is_true(data):
+    # Any nonzero byte, except a lone sign bit ("negative zero").
+    return any(data[:-1]) or (bool(data) and data[-1] & 0x7f != 0)
+
+def is_push_only(ops):
+    return all(type(op) is bytes or op == OP_1NEGATE or small_int(op) is not None for op in ops)
+
+def execute(ops, stack, message):
+    # Runs `ops` on `stack`; False as soon as the script fails.
+    for op in ops:
+        if type(op) is bytes:
+            stack.append(op)
+        elif OP_1 <= op <= OP_16:
+            stack.append(encode_num(op - OP_1 + 1))
+        elif op == OP_1NEGATE:
+            stack.append(encode_num(-1))
+        elif op == OP_DUP:
+            stack.append(stack[-1])
+        elif op == OP_DROP:
+            stack.pop()
+        elif op == OP_HASH160:
+            stack.append(address_codec.hash160(stack.pop()))
+        elif op == OP_SHA256:
+            stack.append(hashlib.sha256(stack.pop()).digest())
+        elif op == OP_EQUAL or op == OP_EQUALVERIFY:
+            equal = stack.pop() == stack.pop()
+            if op == OP_EQUALVERIFY:
+                if not equal:
+                    return False
+            else:
+                stack.append(b"\x01" if equal else b"")
+        elif op == OP_VERIFY:
+            if not is_true(stack.pop()):
+                return False
+        elif op == OP_CHECKSIG or op == OP_CHECKSIGVERIFY:
+            public_key = stack.pop()
+            valid = check_signature(stack.pop(), public_key, message)
+            if op == OP_CHECKSIGVERIFY:
+                if not valid:
+                    return False
+            else:
+                stack.append(b"\x01" if valid else b"")
+        elif op == OP_CHECKMULTISIG or op == OP_CHECKMULTISIGVERIFY:
+            count = decode_num(stack.pop())
+            if not 0 <= count <= MAX_MULTISIG_KEYS:
+                return False
+            public_keys = [stack.pop() for _ in range(count)][::-1]
+            required = decode_num(stack.pop())
+            if not 0 <= required <= count:
+                return False
+            signatures = [stack.pop() for _ in range(required)][::-1]
+            # The extra element OP_CHECKMULTISIG consumes (an off-by-one kept from Bitcoin)
+            stack.pop()
+            valid = check_multisig(signatures, public_keys, message)
+            if op == OP_CHECKMULTISIGVERIFY:
+                if not valid:
+                    return False
+            else:
+                stack.append(b"\x01" if valid else b"")
+        else:
+            # OP_RETURN and opcodes this engine does not implement
+            return False
+    return True
+
 class ScriptEngine:
     # Handles script execution and signature verification.
-    
+
     @staticmethod
-    def execute_p2pkh(script_signature, public_key_script, message):
-        # Verifies a Pay-to-Public-Key-Hash script.
-        
-        # Bitcoin version:
-        #     out: scriptPubKey: OP_DUP OP_HASH160 <pubKeyHash> OP_EQUALVERIFY OP_CHECKSIG
-        #     inp: scriptSig: <digital-signature> <pubKey>
+    def verify(unlocking_script, locking_script, message):
+        # True if unlocking_script (bytes) satisfies locking_script (hex) for message (str).
+        compiled = compile_script(locking_script)
+        message = str.encode(message)
+        if compiled.kind == LEGACY_P2PKH:
+            # <signature><public key> at fixed offsets
+            public_key = unlocking_script[64:]
+            if address_codec.hash160(public_key) != compiled.pub_key_hash:
+                return False
+            return check_signature(unlocking_script[:64], public_key, message)
+        if compiled.kind == INVALID:
+            return False
 
-        # Extract signature and public key from scriptSig
-        # Assuming fixed length for simplicity as per original code, though real Bitcoin uses length prefixes
-        signature_hex = script_signature[:128]
-        public_key_hex = script_signature[128:]
-        
-        # Verify public key hash matches the scriptPubKey
-        pub_key_hash = helpers.compute_hash160(public_key_hex)
-        if not (pub_key_hash.strip() == public_key_script.strip()):
+        try:
+            unlocking_ops = parse_script(unlocking_script)
+        except ValueError:
+            return False
+        if not is_push_only(unlocking_ops):
             return False
+        if compiled.kind == P2PKH and len(unlocking_ops) == 2 and type(unlocking_ops[1]) is bytes:
+            # <signature> <public key>
+            if address_codec.hash160(unlocking_ops[1]) != compiled.pub_key_hash:
+                return False
+            return check_signature(unlocking_ops[0], unlocking_ops[1], message)
+        if (compiled.kind == MULTISIG and len(unlocking_ops) == compiled.required + 1
+                and all(type(op) is bytes for op in unlocking_ops)):
+            # <dummy> <signature 1> ... <signature m>
+            return check_multisig(unlocking_ops[1:], compiled.public_keys, message)
+        return ScriptEngine.interpret(unlocking_ops, compiled.ops, message)
 
-        # Verify digital signature
-        message_bytes = str.encode(message)
-        verifying_key = VerifyingKey.from_string(bytearray.fromhex(public_key_hex), curve=SECP256k1)
-        
+    @staticmethod
+    def interpret(unlocking_ops, locking_ops, message):
+        # General path: unlocking then locking script on one stack; the top must be true.
+        stack = []
         try:
-            return verifying_key.verify(bytearray.fromhex(signature_hex), message_bytes)
-        except Exception:
+            if not execute(unlocking_ops, stack, message) or not execute(locking_ops, stack, message):
+                return False
+        except IndexError:
+            # Popped an empty stack
             return False
+        return bool(stack) and is_true(stack[-1])
+
+    @staticmethod
+    def execute_p2pkh(script_signature, public_key_script, message):
+        # Verifies a Pay-to-Public-Key-Hash script given as hex.
+
+        # Bitcoin version:
+        #     out: scriptPubKey: OP_DUP OP_HASH160 <pubKeyHash> OP_EQUALVERIFY OP_CHECKSIG
+        #     inp: scriptSig: <digital-signature> <pubKey>
+        return ScriptEngine.verify(bytes.fromhex(script_signature), public_key_script.strip(), message)
 
     @staticmethod
     def create_digital_signature(message, private_key_hex):
@@ -38,4 +302,4 @@ class ScriptEngine:
         # private_key_hex: hex string
         signing_key = SigningKey.from_string(bytearray.fromhex(private_key_hex), curve=SECP256k1)
         signature = signing_key.sign(str.encode(message))
-        return bytearray(signature).hex()
\ No newline at end of file
+        return bytearray(signature).hex()
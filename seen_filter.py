@@ -0,0 +1,111 @@
+import hashlib
+import math
+import os
+
+# "Already seen" cache for relayed transactions.
+# A node asks seen() before cloning and validating a transaction, and add()s the txids
+# it has taken in, so copies that arrive again (direct pushes, re-broadcasts, repeated
+# relays) are dropped for the price of a few bit lookups. Blocks are not filtered here:
+# a false positive would lose one for good, and the block tree answers exactly.
+#   - recent: an exact, bounded set of the newest hashes; duplicates mostly arrive
+#     right behind the original, so most lookups end here
+#   - a rolling Bloom filter remembering at least `capacity` hashes in a fixed amount of
+#     memory. It has no false negatives for anything that young; a hash never added is
+#     reported as seen with probability about fp_rate (and that copy is dropped).
+# The Bloom filter keeps two generations, each sized for `capacity` hashes; when the
+# current one fills it becomes the previous one and the old previous one is cleared.
+
+SEEN_CAPACITY = 20000
+SEEN_FP_RATE = 1e-6
+RECENT_SIZE = 1024
+
+class BloomFilter:
+    # Plain Bloom filter for `capacity` items at false-positive rate fp_rate.
+    def __init__(self, capacity, fp_rate):
+        if capacity < 1 or not 0 < fp_rate < 1:
+            raise ValueError("Bloom filter needs capacity >= 1 and 0 < fp_rate < 1")
+        self.num_bits = max(8, math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def clear(self):
+        self.bits = bytearray(len(self.bits))
+        self.count = 0
+
+    def positions(self, h1, h2):
+        # Double hashing: k positions from two 64-bit hashes
+        m = self.num_bits
+        return [(h1 + i * h2) % m for i in range(self.num_hashes)]
+
+    def add(self, h1, h2):
+        bits = self.bits
+        for p in self.positions(h1, h2):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def contains(self, h1, h2):
+        bits = self.bits
+        for p in self.positions(h1, h2):
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+class RollingBloomFilter:
+    # Remembers at least the last `capacity` items (at most twice that) with a
+    # false-positive rate of about fp_rate over both generations.
+    def __init__(self, capacity=SEEN_CAPACITY, fp_rate=SEEN_FP_RATE):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self.current = BloomFilter(capacity, fp_rate / 2)
+        self.previous = BloomFilter(capacity, fp_rate / 2)
+        # Per-filter key, so which hashes collide differs from node to node
+        self.key = os.urandom(16)
+
+    @property
+    def memory_bytes(self):
+        return len(self.current.bits) + len(self.previous.bits)
+
+    def hash_pair(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16, key=self.key).digest()
+        # Nonzero step, so the k positions do not all coincide
+        return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+    def add(self, item):
+        if self.current.count >= self.capacity:
+            self.current, self.previous = self.previous, self.current
+            self.current.clear()
+        self.current.add(*self.hash_pair(item))
+
+    def contains(self, item):
+        h1, h2 = self.hash_pair(item)
+        return self.current.contains(h1, h2) or self.previous.contains(h1, h2)
+
+class SeenCache:
+    # Per-node record of the txids it has taken in.
+    def __init__(self, capacity=SEEN_CAPACITY, fp_rate=SEEN_FP_RATE, recent_size=RECENT_SIZE):
+        self.filter = RollingBloomFilter(capacity, fp_rate)
+        self.recent = {} # hash -> True, oldest first
+        self.recent_size = recent_size
+
+    @property
+    def memory_bytes(self):
+        return self.filter.memory_bytes
+
+    def seen(self, item):
+        return item in self.recent or self.filter.contains(item)
+
+    def add(self, item):
+        if item in self.recent:
+            return
+        if len(self.recent) >= self.recent_size:
+            self.recent.pop(next(iter(self.recent)))
+        self.recent[item] = True
+        self.filter.add(item)
+
+    def add_many(self, items):
+        for item in items:
+            self.add(item)
+
+if __name__ == '__main__':
+    pass
@@ -8,3 +8,34 @@ MINING_REWARD = 50
 
 # Arity of the Merkle Tree
 MERKLE_TREE_ARITY = 2
+
+# Pruning mode: keep transaction bodies only for the newest PRUNE_DEPTH main-chain blocks
+# (the reorg window) and drop abandoned side branches. None keeps every block.
+PRUNE_DEPTH = None
+
+# UTXO set backend: 'trie' (mutable, one per node) or 'persistent' (structurally shared
+# HAMT versions; nodes on the same tip share one set, and reorgs switch versions)
+UTXO_BACKEND = 'trie'
+
+class ChainParams:
+    # One network's copy of the settings above. Nodes, ledgers and blocks read these
+    # instead of the module globals, so networks with different settings can coexist in
+    # one process. Values not given are taken from the module globals at creation.
+    NAMES = ('BITS', 'MINING_REWARD', 'MERKLE_TREE_ARITY', 'PRUNE_DEPTH', 'UTXO_BACKEND')
+
+    def __init__(self, **values):
+        unknown = set(values) - set(ChainParams.NAMES)
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        for name in ChainParams.NAMES:
+            setattr(self, name, values.get(name, globals()[name]))
+
+    def __repr__(self):
+        return f"ChainParams({', '.join(f'{k}={v!r}' for k, v in self.as_dict().items())})"
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in ChainParams.NAMES}
+
+    def replace(self, **values):
+        # A copy with some values changed.
+        return ChainParams(**dict(self.as_dict(), **values))
@@ -0,0 +1,349 @@
+import gzip
+import json
+import os
+import random
+import struct
+import time
+
+import codec
+import settings
+from p2p_network import PeerNetwork
+from persistent_utxo import PersistentUtxoSet, hamt_get
+import miner_node
+import spv_client
+
+# Whole-network snapshot: every node's block tree, UTXO set, undo data, mempool, mailbox
+# and wallet state, the light clients, the chain settings and RNG state, in one file.
+# Restoring it in a fresh process rebuilds the nodes directly (no block is validated or
+# replayed), so an experiment can start from a late stage of a scenario.
+#
+# Layout: magic, u32 length + JSON (settings, RNG state, per-node state with table
+# references), then four tables of length-prefixed codec records:
+#   blocks    every distinct block of any node's tree or mailbox, stored once
+#   txns      mempool / mailbox transactions and spent or unspent ones not in a block
+#   utxo      distinct UTXO sets (nodes on the same tip share one record)
+#   undo      spent outputs per block, the same for every node that connected it
+# Transactions inside UTXO and undo records are references: 2*i for txns[i], 2*k+1 for
+# the k-th transaction of the blocks table (blocks in order, transactions in order).
+# A path ending in .gz is gzip-compressed.
+#
+# Restored nodes share block and transaction objects (nothing mutates them after
+# creation; received messages are cloned on arrival) and keep state in memory only:
+# block stores, metrics and the event log start empty, and each node's seen cache is
+# refilled from its mempool. Light clients are re-attached
+# to their full node and resync from it.
+
+MAGIC = b"SIMSNAP1"
+_JSON_LENGTH = struct.Struct("<I")
+
+def _open(path, mode):
+    return gzip.open(path, mode) if path.endswith(".gz") else open(path, mode)
+
+def rng_state(rng):
+    version, internal, gauss_next = rng.getstate()
+    return [version, list(internal), gauss_next]
+
+def set_rng_state(rng, state):
+    version, internal, gauss_next = state
+    rng.setstate((version, tuple(internal), gauss_next))
+
+class SnapshotWriter:
+    # Collects the deduplicated tables while node state is walked.
+    def __init__(self):
+        self.blocks = []
+        self.block_keys = {}
+        # txid -> reference for transactions inside stored blocks
+        self.block_txn_refs = {}
+        self.block_txn_count = 0
+        self.txns = []
+        self.txn_index = {}
+        self.utxo_sets = []
+        self.utxo_keys = {}
+        self.undo = {}
+
+    def add_block(self, block):
+        # Index of `block` in the blocks table. Pruned (header-only) copies of a block
+        # are stored separately from full ones.
+        key = (block.block_hash, block.merkle_tree_root, len(block.transactions))
+        index = self.block_keys.get(key)
+        if index is None:
+            index = len(self.blocks)
+            self.block_keys[key] = index
+            self.blocks.append(codec.encode_block(block))
+            for txn in block.transactions:
+                self.block_txn_refs.setdefault(txn.transaction_id, 2 * self.block_txn_count + 1)
+                self.block_txn_count += 1
+        return index
+
+    def add_txn(self, txn):
+        # Index of `txn` in the txns table.
+        index = self.txn_index.get(txn.transaction_id)
+        if index is None:
+            index = len(self.txns)
+            self.txn_index[txn.transaction_id] = index
+            self.txns.append(codec.encode_txn(txn))
+        return index
+
+    def txn_ref(self, txn):
+        ref = self.block_txn_refs.get(txn.transaction_id)
+        if ref is None:
+            ref = 2 * self.add_txn(txn)
+        return ref
+
+    def add_utxo_set(self, key, entries):
+        index = self.utxo_keys.get(key)
+        if index is None:
+            parts = []
+            count = 0
+            for txn, vouts in entries:
+                codec.write_varint(parts, self.txn_ref(txn))
+                codec.write_varint(parts, len(vouts))
+                for vout in vouts:
+                    codec.write_varint(parts, vout)
+                count += 1
+            index = len(self.utxo_sets)
+            self.utxo_keys[key] = index
+            self.utxo_sets.append(_count_prefixed(count, parts))
+        return index
+
+    def add_undo(self, block_index, spent):
+        if block_index not in self.undo:
+            parts = []
+            for txn, vout in spent:
+                codec.write_varint(parts, self.txn_ref(txn))
+                codec.write_varint(parts, int(vout))
+            self.undo[block_index] = _count_prefixed(len(spent), parts)
+
+def _count_prefixed(count, parts):
+    head = []
+    codec.write_varint(head, count)
+    return b"".join(head + parts)
+
+def _write_table(f, records):
+    head = []
+    codec.write_varint(head, len(records))
+    f.write(b"".join(head))
+    for record in records:
+        head = []
+        codec.write_varint(head, len(record))
+        f.write(b"".join(head))
+        f.write(record)
+
+def _read_table(data, offset):
+    count, offset = codec.read_varint(data, offset)
+    records = []
+    for _ in range(count):
+        length, offset = codec.read_varint(data, offset)
+        records.append(data[offset:offset + length])
+        offset += length
+    return records, offset
+
+def spent_outputs(ledger, block):
+    # [(txn, vout), ...] the block spent. Persistent-backend undo data is the version
+    # before the block; the spent transactions are read back out of it.
+    undo = ledger.undo_data.get(block.block_hash)
+    if isinstance(undo, list):
+        return undo
+    spent = []
+    for txn in block.transactions[1:]:
+        for inp in txn.inputs:
+            entry = hamt_get(undo.root, inp.transaction_id)
+            if entry is not None:
+                spent.append((entry.txn, inp.output_index))
+    return spent
+
+def node_state(writer, miner, now):
+    ledger = miner.ledger
+    consensus = ledger.consensus
+    with ledger.lock:
+        tree = [writer.add_block(block) for block in consensus.tree_blocks()]
+        head = consensus.longest_chain_head
+        tip_hash, _, digest = ledger.state_commitment()
+        utxo = writer.add_utxo_set((tip_hash, digest), ledger.utxo_set.entries())
+        undo = []
+        for block_hash in ledger.undo_data:
+            node = consensus.get_node(block_hash)
+            if node is None:
+                continue
+            index = writer.add_block(node.block)
+            writer.add_undo(index, spent_outputs(ledger, node.block))
+            undo.append(index)
+        pool = [writer.add_txn(txn) for txn in miner.waiting_txn_pool]
+
+    queue = []
+    for msg_type, msg in list(miner.mailbox.pending):
+        if msg_type == "txn":
+            queue.append([msg_type, writer.add_txn(msg)])
+        elif msg_type == "block":
+            queue.append([msg_type, writer.add_block(msg)])
+        else:
+            queue.append([msg_type, list(msg)])
+
+    return {
+        'keys': miner.keys,
+        'last_block_hash': ledger.last_block_hash,
+        'tree': tree,
+        'head': None if head is None else head.block.block_hash,
+        'second_longest_head_height': consensus.second_longest_head_height,
+        'utxo': utxo,
+        'undo': undo,
+        'pool': pool,
+        'queue': queue,
+        'received_transaction_ids': [list(outpoint) for outpoint in miner.wallet.outpoints],
+        # Ages rather than timestamps, so confirmation latencies stay meaningful
+        'txn_age': {txid: now - seen for txid, seen in miner.txn_first_seen.items()},
+        'created_txn_ids': sorted(miner.created_txn_ids),
+        'confirmation_log': [list(entry) for entry in miner.confirmation_log],
+        'block_only_txids': list(miner.block_only_txids),
+    }
+
+def save(path, network=PeerNetwork, rngs=None):
+    # Writes the network's state to `path`. Nodes should be paused (or the network
+    # stopped) so the state is consistent. rngs: {name: random.Random} saved along with
+    # the global random module state. Returns the file size in bytes.
+    now = time.time()
+    writer = SnapshotWriter()
+    nodes = [node_state(writer, miner, now) for miner in network.nodes]
+    node_index = {miner: i for i, miner in enumerate(network.nodes)}
+    light_clients = [{'keys': client.keys, 'max_headers': client.max_headers,
+                      'full_node': node_index.get(client.full_node)}
+                     for client in network.light_clients]
+    params = network.params
+    if params is None:
+        params = network.nodes[0].params if network.nodes else settings.ChainParams()
+    header = {
+        'settings': params.as_dict(),
+        'random': rng_state(random),
+        'rngs': {name: rng_state(rng) for name, rng in (rngs or {}).items()},
+        'nodes': nodes,
+        'light_clients': light_clients,
+        'undo': sorted(writer.undo),
+    }
+    encoded = json.dumps(header, separators=(",", ":")).encode()
+    with _open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_JSON_LENGTH.pack(len(encoded)))
+        f.write(encoded)
+        _write_table(f, writer.blocks)
+        _write_table(f, writer.txns)
+        _write_table(f, writer.utxo_sets)
+        _write_table(f, [writer.undo[index] for index in header['undo']])
+    return os.path.getsize(path)
+
+class SnapshotReader:
+    def __init__(self, blocks, txns, params):
+        self.blocks = [codec.decode_block(record, params=params) for record in blocks]
+        self.txns = [codec.decode_txn(record) for record in txns]
+        self.block_txns = [txn for block in self.blocks for txn in block.transactions]
+
+    def txn(self, ref):
+        return self.block_txns[ref >> 1] if ref & 1 else self.txns[ref >> 1]
+
+    def outputs(self, record):
+        # Decodes a utxo (txn, [vouts]) or undo (txn, vout) record list.
+        count, offset = codec.read_varint(record, 0)
+        items = []
+        for _ in range(count):
+            ref, offset = codec.read_varint(record, offset)
+            value, offset = codec.read_varint(record, offset)
+            items.append((self.txn(ref), value))
+        return items
+
+    def utxo_entries(self, record):
+        count, offset = codec.read_varint(record, 0)
+        entries = []
+        for _ in range(count):
+            ref, offset = codec.read_varint(record, offset)
+            num_vouts, offset = codec.read_varint(record, offset)
+            vouts = []
+            for _ in range(num_vouts):
+                vout, offset = codec.read_varint(record, offset)
+                vouts.append(vout)
+            entries.append((self.txn(ref), vouts))
+        return entries
+
+def load(path, network=PeerNetwork, rngs=None):
+    # Replaces the network's nodes and light clients with those saved in `path`, running
+    # with the saved chain settings, and restores RNG state (rngs: {name: random.Random}
+    # to restore into).
+    # Returns the restored nodes; start them with simulation.start_miners.
+    with _open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError(f"{path} is not a simulation snapshot")
+    offset = len(MAGIC)
+    (length, ) = _JSON_LENGTH.unpack_from(data, offset)
+    offset += _JSON_LENGTH.size
+    header = json.loads(data[offset:offset + length])
+    offset += length
+    data = memoryview(data)
+    blocks, offset = _read_table(data, offset)
+    txns, offset = _read_table(data, offset)
+    utxo_sets, offset = _read_table(data, offset)
+    undo_records, offset = _read_table(data, offset)
+
+    set_rng_state(random, header['random'])
+    for name, state in header['rngs'].items():
+        if rngs is not None and name in rngs:
+            set_rng_state(rngs[name], state)
+
+    network.reset(settings.ChainParams(**header['settings']))
+    reader = SnapshotReader(blocks, txns, network.params)
+    undo = {index: reader.outputs(undo_records[i]) for i, index in enumerate(header['undo'])}
+    now = time.time()
+    # utxo record index -> a restored set (persistent sets are copied, sharing structure)
+    loaded_sets = {}
+    for i, state in enumerate(header['nodes']):
+        miner = miner_node.Miner(keys=state['keys'], network=network)
+        restore_node(miner, state, reader, undo, utxo_sets, loaded_sets, now)
+        network.address_map[miner.pub_key_hash] = i
+        network.nodes.append(miner)
+
+    for state in header['light_clients']:
+        client = spv_client.LightClient(state['keys'], state['max_headers'])
+        if state['full_node'] is not None:
+            client.connect(network.nodes[state['full_node']])
+        network.light_clients.append(client)
+    return network.nodes
+
+def restore_node(miner, state, reader, undo, utxo_sets, loaded_sets, now):
+    ledger = miner.ledger
+    ledger.consensus.load_tree([reader.blocks[i] for i in state['tree']], state['head'],
+                               state['second_longest_head_height'])
+    ledger.last_block_hash = state['last_block_hash']
+
+    shared = loaded_sets.get(state['utxo'])
+    if shared is not None and isinstance(shared, PersistentUtxoSet):
+        ledger.utxo_set.checkout(shared.version())
+    else:
+        ledger.utxo_set.load_entries(reader.utxo_entries(utxo_sets[state['utxo']]))
+        loaded_sets[state['utxo']] = ledger.utxo_set
+    for index in state['undo']:
+        ledger.undo_data[reader.blocks[index].block_hash] = list(undo[index])
+
+    miner.waiting_txn_pool = [reader.txns[i] for i in state['pool']]
+    ledger.mempool_view.rebuild(miner.waiting_txn_pool)
+    messages = []
+    for msg_type, value in state['queue']:
+        if msg_type == "txn":
+            messages.append((msg_type, reader.txns[value]))
+        elif msg_type == "block":
+            messages.append((msg_type, reader.blocks[value]))
+        else:
+            messages.append((msg_type, tuple(value)))
+    if messages:
+        miner.send_messages(messages)
+
+    miner.wallet.reset(tuple(outpoint) for outpoint in state['received_transaction_ids'])
+    miner.txn_first_seen = {txid: now - age for txid, age in state['txn_age'].items()}
+    miner.created_txn_ids = set(state['created_txn_ids'])
+    miner.confirmation_log = [tuple(entry) for entry in state['confirmation_log']]
+    miner.block_only_txids = dict.fromkeys(state['block_only_txids'], True)
+    # The seen cache is not saved; it is rebuilt from what the node has taken in
+    miner.seen.add_many(miner.txn_first_seen)
+    miner.seen.add_many(txn.transaction_id for txn in miner.waiting_txn_pool)
+    miner.mempool_size.set(len(miner.waiting_txn_pool))
+    ledger.update_chain_gauges()
+
+if __name__ == '__main__':
+    pass
@@ -5,58 +5,134 @@ import sys
 import settings
 from p2p_network import PeerNetwork
 import miner_node
+import event_log
+import chain_sync
+import spv_client
+import profiler
+from keystore import KeyStore
+import helpers
+from workload import WorkloadGenerator
 
 def start_miner_thread(miner):
     miner.mine_continuously()
 
-def main():
-    PeerNetwork.initialize_nodes(num_nodes=3)
-    genesis_block = miner_node.Miner.generate_genesis_block(PeerNetwork.nodes[0].keys)
-    genesis_block.display()
-    
+def setup_network(num_nodes, store_root=None, key_seed=None, keystore_path=None,
+                  network=PeerNetwork, params=None):
+    # Creates the nodes and distributes a shared genesis block to all of them.
+    # With store_root, nodes that find saved state there resume from it instead.
+    # With key_seed, node keys (and so addresses) are the same on every run.
+    # network is emptied first and then runs with params (None: the module settings).
+    network.reset(params)
+    network.initialize_nodes(num_nodes=num_nodes, store_root=store_root,
+                             key_seed=key_seed, keystore_path=keystore_path)
+
+    resumed = [miner.resume() if store_root is not None else False for miner in network.nodes]
+    genesis_block = None
+    for i, miner in enumerate(network.nodes):
+        if resumed[i]:
+            genesis_block = miner.ledger.consensus.root.block
+            break
+    if genesis_block is None:
+        genesis_block = miner_node.Miner.generate_genesis_block(network.nodes[0].keys, params)
+
     # Simulate receiving the genesis transaction
-    PeerNetwork.nodes[0].receive_transaction_id((genesis_block.transactions[0].transaction_id, 0))
+    if not resumed[0]:
+        network.nodes[0].receive_transaction_id((genesis_block.transactions[0].transaction_id, 0))
 
     # Distribute genesis block to all nodes
-    for i, miner in enumerate(PeerNetwork.nodes):
-        PeerNetwork.address_map[miner.pub_key_hash] = i
+    for i, miner in enumerate(network.nodes):
+        network.address_map[miner.pub_key_hash] = i
+        if resumed[i]:
+            continue
         success = miner.store_genesis_block(genesis_block.clone())
         if not success:
-            print("[*] Failed to add genesis block") 
+            print("[*] Failed to add genesis block")
 
-    for miner in PeerNetwork.nodes:
-        miner.display()
+    return genesis_block
 
+def join_late_node(store_dir=None, snapshot_height=None, network=PeerNetwork):
+    # Adds a node to a running network and catches it up with headers-first sync.
+    # Returns (miner, thread) with the node already mining.
+    miner = miner_node.Miner(store_dir, network=network)
+    stats = chain_sync.join_network(miner, network, snapshot_height)
+    print(f"[*] Node {miner.node_id} synced {stats['blocks']} blocks to height {stats.get('height')} "
+          f"in {stats.get('elapsed', 0.0):.3f}s")
+    return miner, start_miners([miner])[0]
+
+def add_light_clients(count, key_seed=None, max_headers=None, network=PeerNetwork):
+    # Attaches `count` light clients to the network, spread over the full nodes.
+    # With key_seed their keys are derived (from a seed distinct from the nodes').
+    if key_seed is not None:
+        keys = KeyStore(f"{key_seed}/light").get(count)
+    else:
+        keys = [helpers.generate_key_pair() for _ in range(count)]
+    clients = []
+    for i in range(count):
+        client = spv_client.LightClient(keys[i], max_headers)
+        client.connect(network.nodes[i % len(network.nodes)])
+        clients.append(client)
+    network.light_clients.extend(clients)
+    return clients
+
+def start_miners(nodes):
+    # Starts one mining thread per node.
     threads = []
-    for i in range(len(PeerNetwork.nodes)):
-        threads.append(threading.Thread(target=start_miner_thread, args=(PeerNetwork.nodes[i], )))
+    for miner in nodes:
+        threads.append(threading.Thread(target=start_miner_thread, args=(miner, )))
 
     for t in threads:
         t.start()
+    return threads
+
+def stop_miners(nodes, threads, timeout=None):
+    # Signals every node to stop, waits for the mining threads to exit and saves node state.
+    for miner in nodes:
+        miner.is_running = False
+        if miner.pow_worker is not None:
+            miner.pow_worker.stop_mining = True
+
+    for t in threads:
+        t.join(timeout)
 
-    # Simulate transactions
-    lock = threading.Lock()
-
-    def create_simulation_txn(from_index, to_index, amount):
-        print("[****************------ CREATING-TXN-----************]")
-        
-        # Directly injecting message to simulate user action
-        PeerNetwork.nodes[from_index].send_message(
-            ("new_txn", (PeerNetwork.nodes[to_index].pub_key_hash, amount))
-        )
-        
-        print("[#] From: ", PeerNetwork.nodes[from_index].pub_key_hash)
-        print("[#] To: ", PeerNetwork.nodes[to_index].pub_key_hash)
-        print("[+] Amount: ", amount)
-
-    with lock:
-        create_simulation_txn(0, 1, 10)
-        create_simulation_txn(0, 2, 10)
-    
-    time.sleep(10)
-    with lock:
-        create_simulation_txn(1, 2, 5)
-        create_simulation_txn(2, 0, 5)
+    for miner in nodes:
+        miner.shutdown()
+
+def start_profiling(nodes=None, interval=0.01):
+    # Starts a sampling profiler over the given nodes' mining threads (default: all).
+    # More nodes can be attached, or some detached, while it runs.
+    sampler = profiler.SamplingProfiler(interval)
+    for miner in (PeerNetwork.nodes if nodes is None else nodes):
+        sampler.attach(miner)
+    return sampler.start()
+
+def stop_profiling(sampler, prefix=None):
+    # Stops the profiler, prints time per node and region and, with prefix, writes
+    # collapsed stacks for flamegraph tools to <prefix>.wall.folded / <prefix>.cpu.folded.
+    sampler.stop()
+    sampler.display()
+    if prefix is not None:
+        for path in sampler.write_flamegraph_files(prefix):
+            print(f"[#] Collapsed stacks written to {path}")
+
+def main():
+    genesis_block = setup_network(num_nodes=3)
+    genesis_block.display()
+
+    for miner in PeerNetwork.nodes:
+        miner.display()
+
+    # Node activity is logged through the event log and echoed by a background writer
+    trace = event_log.TraceWriter(echo=True).start()
+    threads = start_miners(PeerNetwork.nodes)
+
+    # Simulate transactions: (seconds from start, from node, to node, amount)
+    workload = WorkloadGenerator.from_schedule([
+        (0, 0, 1, 10),
+        (0, 0, 2, 10),
+        (10, 1, 2, 5),
+        (10, 2, 0, 5),
+    ], verbose=True)
+    workload.run()
 
     time.sleep(20)
 
@@ -68,8 +144,13 @@ def main():
         miner.display()
         print(miner)
 
+    for node_id, (tip, height, digest) in PeerNetwork.state_commitments().items():
+        print(f"[#] Node {node_id}: height {height} tip {tip} utxo {digest}")
+    print(f"[#] Nodes converged: {PeerNetwork.converged()}")
+
     for t in threads:
         t.join()
+    trace.stop()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,316 @@
+from functools import lru_cache
+
+import helpers
+import address_codec
+import transaction_data
+import txn_input
+import txn_output
+import event_log
+import script_engine
+from node_mailbox import Mailbox
+
+# Simplified payment verification: a light client keeps block headers only and learns
+# about its own transactions from a full node, which sends each one with the Merkle
+# branch tying it to a header the client has checked. No UTXO set, no block bodies and
+# no script checks, so a client costs a small fraction of a Miner.
+
+class MerkleProof:
+    # A transaction and the branch linking it to the merkle root of block `block_hash`.
+    __slots__ = ('block_hash', 'height', 'txn', 'branch')
+
+    def __init__(self, block_hash, height, txn, branch):
+        self.block_hash = block_hash
+        self.height = height
+        self.txn = txn
+        self.branch = branch
+
+    def verify(self, header):
+        if header.block_hash != self.block_hash:
+            return False
+        # The id is recomputed: the one supplied with the transaction proves nothing
+        # about the inputs and outputs actually sent
+        transaction_id = self.txn.calculate_id()
+        if transaction_id != self.txn.transaction_id:
+            return False
+        return helpers.verify_merkle_branch(transaction_id, self.branch, header.merkle_tree_root)
+
+# Output forms a single key can spend (and a light client can hold)
+SINGLE_KEY = (script_engine.LEGACY_P2PKH, script_engine.P2PKH)
+
+@lru_cache(maxsize=65536)
+def output_owners(locking_script):
+    # Public key hashes (hex) that can spend, or sign for, an output: the one hash of a
+    # P2PKH output in either encoding, or every key's hash of a multisig output.
+    compiled = script_engine.compile_script(locking_script)
+    if compiled.kind in SINGLE_KEY:
+        return (compiled.pub_key_hash.hex(), )
+    if compiled.kind == script_engine.MULTISIG:
+        return tuple(address_codec.hash160(key).hex() for key in compiled.public_keys)
+    return ()
+
+def input_owner(unlocking_script):
+    # Public key hash (hex) of the key an unlocking script (bytes) carries, else None.
+    # A legacy P2PKH spend is a bare signature and key at fixed offsets; a P2PKH script
+    # spend pushes <signature> <public key>. Multisig spends carry signatures only, so
+    # they are not attributed.
+    if len(unlocking_script) == 128:
+        return address_codec.hash160(unlocking_script[64:]).hex()
+    try:
+        ops = script_engine.parse_script(unlocking_script)
+    except ValueError:
+        return None
+    if len(ops) == 2 and type(ops[0]) is bytes and type(ops[1]) is bytes and len(ops[1]) == 64:
+        return address_codec.hash160(ops[1]).hex()
+    return None
+
+def transaction_scripts(txn, is_coinbase=False):
+    # Public key hashes a transaction touches: owners of the outputs it pays and of the
+    # keys that sign its inputs.
+    scripts = set()
+    for out in txn.outputs:
+        scripts.update(output_owners(out.locking_script))
+    if not is_coinbase:
+        for inp in txn.inputs:
+            owner = input_owner(inp.script)
+            if owner is not None:
+                scripts.add(owner)
+    return scripts
+
+def block_proofs(block, height, scripts, arity):
+    # script -> [MerkleProof, ...] (in block order) for each of `scripts` the block touches,
+    # with branches for a merkle tree of the given arity.
+    matches = {}
+    for index, txn in enumerate(block.transactions):
+        for script in transaction_scripts(txn, index == 0):
+            if script in scripts:
+                matches.setdefault(script, []).append(index)
+    if not matches:
+        return {}
+    levels = helpers.merkle_levels([txn.transaction_id for txn in block.transactions], arity)
+    proofs = {}
+    for script, indices in matches.items():
+        proofs[script] = [MerkleProof(block.block_hash, height, block.transactions[i],
+                                      helpers.merkle_branch(levels, i, arity))
+                          for i in indices]
+    return proofs
+
+class LightClient:
+    # Header-only wallet attached to one full node, whose network and chain settings it
+    # uses. With max_headers set, only the newest max_headers headers are kept (enough to
+    # follow reorgs near the tip).
+    def __init__(self, keys, max_headers=None):
+        self.keys = keys
+        self.pub_key_hash = helpers.compute_hash160(keys['public'])
+        self.address = address_codec.encode_address(self.pub_key_hash)
+        self.node_id = self.pub_key_hash[:8]
+        self.events = event_log.EVENTS
+        self.max_headers = max_headers
+        self.full_node = None
+
+        # Main-chain headers; headers[i] is at height base_height + i
+        self.headers = []
+        self.base_height = 0
+        # Confirmed transactions that concern us: [(height, txn), ...] in chain order
+        self.history = []
+        self.history_txids = set()
+        # (txid, vout) -> amount of our confirmed unspent outputs
+        self.utxos = {}
+        # Outpoints spent by payments we sent that are not confirmed yet, and the change
+        # outputs of those payments ((txid, vout) -> amount), which we may spend already
+        self.pending_spends = set()
+        self.pending_change = {}
+        # Those of our outpoints locked by a P2PKH script rather than the bare hash
+        self.script_outputs = set()
+        self.mailbox = Mailbox()
+
+    def tip_height(self):
+        return self.base_height + len(self.headers) - 1
+
+    def header_at(self, height):
+        index = height - self.base_height
+        if 0 <= index < len(self.headers):
+            return self.headers[index]
+        return None
+
+    def spendable(self):
+        # (outpoint, amount) pairs not committed to a payment we sent: confirmed outputs
+        # first, then change from our unconfirmed payments.
+        for outputs in (self.utxos, self.pending_change):
+            for outpoint, amount in list(outputs.items()):
+                if outpoint not in self.pending_spends:
+                    yield outpoint, amount
+
+    def balance(self):
+        self.process_message_queue()
+        return sum(amount for _, amount in self.spendable())
+
+    def connect(self, full_node):
+        # Syncs headers and past transactions from a full node, then subscribes to new blocks.
+        self.full_node = full_node
+        self.resync()
+        full_node.subscribe_light_client(self)
+
+    def resync(self, start_height=0):
+        # Re-reads the header chain from the full node starting at start_height (0: all of
+        # it) and the proofs for every block that replaced one of ours.
+        ledger = self.full_node.ledger
+        fork_height = start_height
+        if self.headers and start_height > self.base_height:
+            # The branch may have replaced headers below start_height too
+            fork_height = min(start_height, self.find_fork_height(ledger.get_headers(self.base_height)))
+        headers = ledger.get_headers(fork_height)
+        if not self.accept_headers(headers, fork_height):
+            self.events.emit(event_log.WARNING, self.node_id, 'headers_rejected', self.full_node.node_id)
+            return False
+        for proof in ledger.find_proofs(self.pub_key_hash, fork_height):
+            self.apply_proof(proof)
+        self.trim_headers()
+        return True
+
+    def find_fork_height(self, peer_headers):
+        # Height of the first header (from base_height) where the peer's chain differs from ours.
+        for i, header in enumerate(self.headers):
+            if i >= len(peer_headers) or peer_headers[i].block_hash != header.block_hash:
+                return self.base_height + i
+        return self.base_height + len(self.headers)
+
+    def accept_headers(self, headers, start_height):
+        # Replaces our chain from start_height with `headers`, which must link to our header
+        # below start_height and carry valid proof of work (the first header is trusted
+        # when we have nothing below it, i.e. genesis).
+        previous = self.header_at(start_height - 1)
+        bits = self.full_node.params.BITS
+        for header in headers:
+            if previous is not None:
+                if header.previous_hash != previous.block_hash:
+                    return False
+                if header.difficulty_bits < bits or not header.check_proof_of_work():
+                    return False
+            previous = header
+        self.rollback(start_height)
+        if not self.headers:
+            self.base_height = start_height
+        self.headers.extend(headers)
+        return True
+
+    def trim_headers(self):
+        # Drops headers beyond max_headers, once any proofs against them are applied.
+        if self.max_headers is not None and len(self.headers) > self.max_headers:
+            drop = len(self.headers) - self.max_headers
+            del self.headers[:drop]
+            self.base_height += drop
+
+    def rollback(self, height):
+        # Forgets headers and confirmed transactions at `height` and above.
+        if height <= self.tip_height():
+            del self.headers[max(0, height - self.base_height):]
+        if self.history and self.history[-1][0] >= height:
+            self.history = [(h, txn) for h, txn in self.history if h < height]
+            self.history_txids = {txn.transaction_id for _, txn in self.history}
+            self.utxos = {}
+            self.script_outputs = set()
+            for _, txn in self.history:
+                self.apply_transaction(txn)
+
+    def apply_proof(self, proof):
+        # Records a proven transaction of ours. Returns False if the proof does not check
+        # out against our header at its height.
+        header = self.header_at(proof.height)
+        if header is None or not proof.verify(header):
+            self.events.emit(event_log.WARNING, self.node_id, 'proof_rejected', proof.txn.transaction_id)
+            return False
+        if proof.txn.transaction_id in self.history_txids:
+            return True
+        self.history.append((proof.height, proof.txn))
+        self.history_txids.add(proof.txn.transaction_id)
+        self.apply_transaction(proof.txn)
+        return True
+
+    def apply_transaction(self, txn):
+        for inp in txn.inputs:
+            outpoint = (inp.transaction_id, int(inp.output_index))
+            self.utxos.pop(outpoint, None)
+            self.script_outputs.discard(outpoint)
+            self.pending_spends.discard(outpoint)
+        for vout, out in enumerate(txn.outputs):
+            compiled = script_engine.compile_script(out.locking_script)
+            # Multisig outputs show up in our history but are not ours alone to spend
+            if compiled.kind not in SINGLE_KEY or compiled.pub_key_hash.hex() != self.pub_key_hash:
+                continue
+            outpoint = (txn.transaction_id, vout)
+            self.utxos[outpoint] = out.amount
+            if compiled.kind == script_engine.P2PKH:
+                self.script_outputs.add(outpoint)
+            self.pending_change.pop(outpoint, None)
+
+    def send_message(self, message):
+        self.mailbox.put(message)
+
+    def process_message_queue(self):
+        # Handles ("block", (header, height, proofs)) announcements from the full node.
+        while True:
+            messages = self.mailbox.drain()
+            if not messages:
+                return
+            for msg_type, msg in messages:
+                if msg_type == "block":
+                    self.handle_block(*msg)
+
+    def handle_block(self, header, height, proofs):
+        known = self.header_at(height)
+        if known is not None and known.block_hash == header.block_hash:
+            # Already have it, e.g. from a resync while this announcement was queued
+            for proof in proofs:
+                self.apply_proof(proof)
+            return
+        previous = self.header_at(height - 1)
+        if height != self.tip_height() + 1 or previous is None or header.previous_hash != previous.block_hash:
+            # A reorg (or a gap): ask the full node where its chain now runs
+            self.resync(min(height, self.tip_height() + 1))
+            return
+        if not self.accept_headers([header], height):
+            self.events.emit(event_log.WARNING, self.node_id, 'block_rejected', header.block_hash)
+            return
+        for proof in proofs:
+            self.apply_proof(proof)
+        self.trim_headers()
+
+    def unlocking_script(self, txid, vout):
+        if (txid, vout) in self.script_outputs:
+            return helpers.generate_push_signature_script(self.keys, txid)
+        return helpers.generate_signature_script(self.keys, txid)
+
+    def create_transaction(self, receiver_address, amount):
+        # Pays `amount` from our spendable outputs, broadcasting to every full node.
+        self.process_message_queue()
+        inputs = []
+        total_amount = 0
+        for outpoint, value in self.spendable():
+            if total_amount >= amount:
+                break
+            inputs.append(outpoint)
+            total_amount += value
+        if not inputs or total_amount < amount:
+            return False
+
+        outputs = [txn_output.TxnOutput(amount, receiver_address)]
+        if total_amount > amount:
+            outputs.append(txn_output.TxnOutput(total_amount - amount, self.pub_key_hash))
+        signed_inputs = [txn_input.TxnInput(txid, vout, self.unlocking_script(txid, vout))
+                         for txid, vout in inputs]
+        new_txn = transaction_data.Txn(signed_inputs, outputs)
+        self.pending_spends.update(inputs)
+        if total_amount > amount:
+            self.pending_change[(new_txn.transaction_id, 1)] = total_amount - amount
+        self.events.emit(event_log.INFO, self.node_id, 'txn_created', new_txn.transaction_id, amount)
+
+        network = self.full_node.network
+        index = network.address_map.get(receiver_address)
+        if index is not None:
+            # Notify a full-node receiver (simulation shortcut, as Miner does)
+            network.nodes[index].receive_transaction_id((new_txn.transaction_id, 0))
+        network.broadcast_transaction(new_txn, None)
+        return True
+
+if __name__ == '__main__':
+    pass
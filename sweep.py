@@ -0,0 +1,111 @@
+import argparse
+import contextlib
+import csv
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import time
+
+# Parameter sweeps: runs workload.run_workload once per point of a grid of node counts,
+# merkle tree arities, difficulties and workloads, on a pool of worker processes, and
+# merges the reports into one table. Every point gets a fresh process (and its own
+# p2p_network.Network and settings.ChainParams), so runs cannot leak state into each
+# other; node output is discarded. Points are seeded from `seed` and their grid index,
+# so a sweep is repeatable however its points are scheduled.
+
+GRID = ('nodes', 'arity', 'bits', 'arrival', 'rate', 'repeat')
+COLUMNS = ('confirmed_tps', 'latency_p50', 'latency_p90', 'latency_p99', 'backlog_mean',
+           'converged_fraction', 'elapsed')
+
+def grid_points(nodes, arities, bits, arrivals, rates, repeats=1):
+    # One dict per combination, in grid order.
+    return [dict(zip(GRID, values)) for values in
+            itertools.product(nodes, arities, bits, arrivals, rates, range(repeats))]
+
+def run_point(task):
+    # Worker: (index, point, shared workload options) -> table row.
+    index, point, options = task
+    from p2p_network import Network
+    import workload
+
+    start = time.perf_counter()
+    seed = options.get('seed')
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = workload.run_workload(
+            point['nodes'], arity=point['arity'], bits=point['bits'], network=Network(),
+            arrival=point['arrival'], rate=point['rate'],
+            seed=None if seed is None else seed + index,
+            **{k: v for k, v in options.items() if k != 'seed'})
+    row = dict(point, index=index)
+    row.update(result)
+    row['elapsed'] = time.perf_counter() - start
+    return row
+
+def run_sweep(points, workers=None, **options):
+    # Runs every point (see grid_points) and returns the rows in grid order.
+    # options go to every run_workload call (duration, settle, seed, ...).
+    tasks = [(index, point, options) for index, point in enumerate(points)]
+    rows = []
+    with multiprocessing.Pool(workers or os.cpu_count(), maxtasksperchild=1) as pool:
+        for row in pool.imap_unordered(run_point, tasks):
+            print(f"[#] {format_point(row)} done in {row['elapsed']:.1f}s")
+            rows.append(row)
+    return sorted(rows, key=lambda row: row['index'])
+
+def format_point(row):
+    return " ".join(f"{name}={row[name]}" for name in GRID)
+
+def format_value(value):
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return "-" if value is None else str(value)
+
+def display(rows):
+    header = GRID + COLUMNS
+    cells = [[format_value(row.get(name)) for name in header] for row in rows]
+    widths = [max([len(name)] + [len(line[i]) for line in cells]) for i, name in enumerate(header)]
+    print("  ".join(name.rjust(width) for name, width in zip(header, widths)))
+    for line in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(line, widths)))
+
+def write_rows(path, rows):
+    # JSON list of rows, or CSV when the path ends in .csv.
+    with open(path, "w", newline="") as f:
+        if path.endswith(".csv"):
+            fields = list(GRID) + sorted({key for row in rows for key in row} - set(GRID))
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+        else:
+            json.dump(rows, f, indent=2)
+
+def main():
+    import settings
+    from workload import ARRIVALS
+
+    parser = argparse.ArgumentParser(description="Run a grid of workloads in parallel and merge the results.")
+    parser.add_argument("--nodes", type=int, nargs='+', default=[3])
+    parser.add_argument("--arity", type=int, nargs='+', default=[settings.MERKLE_TREE_ARITY])
+    parser.add_argument("--bits", type=int, nargs='+', default=[settings.BITS])
+    parser.add_argument("--arrival", choices=ARRIVALS, nargs='+', default=['poisson'])
+    parser.add_argument("--rate", type=float, nargs='+', default=[1.0])
+    parser.add_argument("--repeat", type=int, default=1, help="runs per grid point")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--settle", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("-o", "--output", help="write the merged table here (JSON, or CSV for .csv)")
+    args = parser.parse_args()
+
+    points = grid_points(args.nodes, args.arity, args.bits, args.arrival, args.rate, args.repeat)
+    print(f"[#] {len(points)} runs on {args.workers or os.cpu_count()} workers")
+    rows = run_sweep(points, args.workers, duration=args.duration, settle=args.settle, seed=args.seed)
+    display(rows)
+    if args.output is not None:
+        write_rows(args.output, rows)
+        print(f"[#] Results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,8 @@ import time
 
 from p2p_network import PeerNetwork
 import miner_node
+import event_log
+from workload import WorkloadGenerator
 
 def start_miner_thread(miner):
     miner.mine_continuously()
@@ -27,28 +29,18 @@ def main():
     for i in range(len(PeerNetwork.nodes)):
         threads.append(threading.Thread(target=start_miner_thread, args=(PeerNetwork.nodes[i], )))
 
+    trace = event_log.TraceWriter(echo=True).start()
     for t in threads:
         t.start()
 
-    lock = threading.Lock()
-
-    def create_simulation_txn(from_index, to_index, amount):
-        print("[****************------ CREATING-TXN-----************]")
-        PeerNetwork.nodes[from_index].send_message(
-            ("new_txn", (PeerNetwork.nodes[to_index].pub_key_hash, amount))
-        )
-        print("[#] From: ", PeerNetwork.nodes[from_index].pub_key_hash)
-        print("[#] To: ", PeerNetwork.nodes[to_index].pub_key_hash)
-        print("[+] Amount: ", amount)
-
-    with lock:
-        create_simulation_txn(0, 1, 10)
-        create_simulation_txn(0, 2, 10)
-    
-    time.sleep(20)
-    with lock:
-        create_simulation_txn(1, 2, 5)
-        create_simulation_txn(2, 0, 5)
+    # (seconds from start, from node, to node, amount)
+    workload = WorkloadGenerator.from_schedule([
+        (0, 0, 1, 10),
+        (0, 0, 2, 10),
+        (20, 1, 2, 5),
+        (20, 2, 0, 5),
+    ], verbose=True)
+    workload.run()
 
     time.sleep(50)
 
@@ -56,6 +48,7 @@ def main():
     for miner in PeerNetwork.nodes:
         miner.display()
         print(miner)
+    trace.flush()
 
 if __name__ == '__main__':
     main()
@@ -5,11 +5,13 @@ import sys
 import settings
 from p2p_network import PeerNetwork
 import miner_node
+import event_log
+from workload import WorkloadGenerator
 
 def start_miner_thread(miner):
     miner.mine_continuously()
 
-def main():
+def main(params=None):
     # Expecting number of nodes as first argument (after arity which is handled in __main__)
     # But original code used sys.argv[1] for num_nodes in main(), but also sys.argv[1] for arity in __main__?
     # Original code:
@@ -17,7 +19,7 @@ def main():
     #     arity = int(sys.argv[1])
     #     config.arity = arity
     #     main()
-    # def main():
+    # def main(params=None):
     #     Network.create_nodes(num_nodes=int(sys.argv[1]))
     
     # This implies sys.argv[1] is used for BOTH arity and num_nodes? Or maybe the user meant to pass two args?
@@ -29,8 +31,9 @@ def main():
     except IndexError:
         num_nodes = 3
 
+    PeerNetwork.reset(params)
     PeerNetwork.initialize_nodes(num_nodes=num_nodes)
-    genesis_block = miner_node.Miner.generate_genesis_block(PeerNetwork.nodes[0].keys)
+    genesis_block = miner_node.Miner.generate_genesis_block(PeerNetwork.nodes[0].keys, params)
     genesis_block.display()
     
     PeerNetwork.nodes[0].receive_transaction_id((genesis_block.transactions[0].transaction_id, 0))
@@ -48,31 +51,24 @@ def main():
     for i in range(len(PeerNetwork.nodes)):
         threads.append(threading.Thread(target=start_miner_thread, args=(PeerNetwork.nodes[i], )))
 
+    trace = event_log.TraceWriter(echo=True).start()
     for t in threads:
         t.start()
 
-    lock = threading.Lock()
-
-    def create_simulation_txn(from_index, to_index, amount):
-        print("[****************------ CREATING-TXN-----************]")
-        PeerNetwork.nodes[from_index].send_message(
-            ("new_txn", (PeerNetwork.nodes[to_index].pub_key_hash, amount))
-        )
-        print("[#] From: ", PeerNetwork.nodes[from_index].pub_key_hash)
-        print("[#] To: ", PeerNetwork.nodes[to_index].pub_key_hash)
-        print("[+] Amount: ", amount)
-
-    with lock:
-        create_simulation_txn(0, 1, 2)
-        create_simulation_txn(0, 2, 10)
-        create_simulation_txn(0, 3, 2)
-        create_simulation_txn(0, 1, 2)
-        create_simulation_txn(0, 4, 10)
-        create_simulation_txn(0, 2, 2)
-        create_simulation_txn(0, 0, 2)
-        create_simulation_txn(0, 2, 2)
-        create_simulation_txn(0, 2, 2)
-        create_simulation_txn(0, 3, 2)
+    # (seconds from start, from node, to node, amount); use workload.py for load tests
+    workload = WorkloadGenerator.from_schedule([
+        (0, 0, 1, 2),
+        (0, 0, 2, 10),
+        (0, 0, 3, 2),
+        (0, 0, 1, 2),
+        (0, 0, 4, 10),
+        (0, 0, 2, 2),
+        (0, 0, 0, 2),
+        (0, 0, 2, 2),
+        (0, 0, 2, 2),
+        (0, 0, 3, 2),
+    ], verbose=True)
+    workload.run()
 
     time.sleep(20)
 
@@ -84,10 +80,12 @@ def main():
 
     for t in threads:
         t.join()
+    trace.stop()
 
 if __name__ == '__main__':
+    params = None
     if len(sys.argv) > 1:
-        arity = int(sys.argv[1])
-        settings.MERKLE_TREE_ARITY = arity
-        print(f"Merkle Tree Arity set to: {settings.MERKLE_TREE_ARITY}")
-    main()
+        # Scoped to this run's network; the module settings stay untouched
+        params = settings.ChainParams(MERKLE_TREE_ARITY=int(sys.argv[1]))
+        print(f"Merkle Tree Arity set to: {params.MERKLE_TREE_ARITY}")
+    main(params)
@@ -0,0 +1,309 @@
+import argparse
+import gzip
+import json
+import os
+
+import numpy as np
+
+from event_log import EVENT_FIELDS
+
+# Columnar analysis of event traces (see event_log.TraceWriter). A trace is parsed once
+# into parallel NumPy arrays, one row per event, with strings interned to integer codes:
+#   t       float64  timestamp
+#   node    int32    index into names['node']
+#   event   int16    index into names['event']
+#   hash    int64    index into names['hash'] (block hash or txid), -1 if none
+#   prev    int64    index into names['hash'] of the parent block, -1 if none
+#   size    int64    transactions in a block, or reorg depth; -1 if none
+#   value   float64  latency / amount / seconds, NaN if none
+#   height  int64    block height, -1 if none
+# Parsed traces can be saved as .npz, which loads again in milliseconds.
+
+HASH_FIELDS = ('hash', 'txid', 'tip')
+SIZE_FIELDS = ('txns', 'depth', 'blocks')
+VALUE_FIELDS = ('latency', 'amount', 'seconds')
+
+def field_plan(event, record):
+    # Which record fields feed the hash/size/value columns for this event type.
+    names = EVENT_FIELDS.get(event) or tuple(record)
+    def pick(candidates):
+        for field in candidates:
+            if field in names:
+                return field
+        return None
+    return (pick(HASH_FIELDS), pick(SIZE_FIELDS), pick(VALUE_FIELDS),
+            'prev_hash' in names, 'height' in names)
+
+class TraceColumns:
+    # Parallel per-event arrays plus the string tables their codes index into.
+    def __init__(self, columns, names):
+        self.columns = columns
+        self.names = names
+        self.codes = {kind: {name: i for i, name in enumerate(values)} for kind, values in names.items()}
+
+    def __len__(self):
+        return len(self.columns['t'])
+
+    def __getattr__(self, name):
+        columns = self.__dict__.get('columns')
+        if columns is not None and name in columns:
+            return columns[name]
+        raise AttributeError(name)
+
+    def event_mask(self, event):
+        code = self.codes['event'].get(event)
+        if code is None:
+            return np.zeros(len(self), dtype=bool)
+        return self.columns['event'] == code
+
+    @staticmethod
+    def from_records(records):
+        # Builds columns from an iterable of trace dicts (JSON lines already decoded).
+        tables = {'node': {}, 'event': {name: i for i, name in enumerate(EVENT_FIELDS)}, 'hash': {}}
+        node_table, event_table, hash_table = tables['node'], tables['event'], tables['hash']
+        plans = {}
+
+        t, node, event, hashes, prev, size, value, height = [], [], [], [], [], [], [], []
+        for record in records:
+            name = record['event']
+            plan = plans.get(name)
+            if plan is None:
+                plan = plans[name] = field_plan(name, record)
+            hash_field, size_field, value_field, has_prev, has_height = plan
+
+            t.append(record['t'])
+            code = node_table.get(record['node'])
+            if code is None:
+                code = node_table[record['node']] = len(node_table)
+            node.append(code)
+            code = event_table.get(name)
+            if code is None:
+                code = event_table[name] = len(event_table)
+            event.append(code)
+            if hash_field is None:
+                hashes.append(-1)
+            else:
+                key = record[hash_field]
+                code = hash_table.get(key)
+                if code is None:
+                    code = hash_table[key] = len(hash_table)
+                hashes.append(code)
+            if has_prev:
+                key = record['prev_hash']
+                code = hash_table.get(key)
+                if code is None:
+                    code = hash_table[key] = len(hash_table)
+                prev.append(code)
+            else:
+                prev.append(-1)
+            size.append(-1 if size_field is None else record[size_field])
+            value.append(np.nan if value_field is None else record[value_field])
+            height.append(record['height'] if has_height else -1)
+
+        columns = {
+            't': np.array(t, dtype=np.float64),
+            'node': np.array(node, dtype=np.int32),
+            'event': np.array(event, dtype=np.int16),
+            'hash': np.array(hashes, dtype=np.int64),
+            'prev': np.array(prev, dtype=np.int64),
+            'size': np.array(size, dtype=np.int64),
+            'value': np.array(value, dtype=np.float64),
+            'height': np.array(height, dtype=np.int64),
+        }
+        order = np.argsort(columns['t'], kind='stable')
+        columns = {name: column[order] for name, column in columns.items()}
+        names = {kind: list(table) for kind, table in tables.items()}
+        return TraceColumns(columns, names)
+
+    @staticmethod
+    def load(path, cache=True):
+        # Reads a JSONL trace (plain or .gz) or a saved .npz. With cache, the parsed columns
+        # are kept in <path>.npz and reused while it is newer than the trace.
+        if path.endswith(".npz"):
+            with np.load(path) as data:
+                columns = {name[4:]: data[name] for name in data.files if name.startswith("col_")}
+                names = {name[6:]: data[name].tolist() for name in data.files if name.startswith("names_")}
+            return TraceColumns(columns, names)
+
+        cache_path = path + ".npz"
+        if cache and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+            return TraceColumns.load(cache_path)
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt") as f:
+            columns = TraceColumns.from_records(json.loads(line) for line in f if line.strip())
+        if cache:
+            columns.save(cache_path, compress=False)
+        return columns
+
+    def save(self, path, results=None, compress=True):
+        # Writes the columns, string tables and (optionally) analysis results to .npz.
+        arrays = {f"col_{name}": column for name, column in self.columns.items()}
+        for kind, values in self.names.items():
+            arrays[f"names_{kind}"] = np.array(values, dtype=str)
+        for name, result in (results or {}).items():
+            arrays[f"result_{name}"] = np.asarray(result)
+        (np.savez_compressed if compress else np.savez)(path, **arrays)
+
+def first_time(columns, event):
+    # Per hash code: timestamp of the first `event` naming it (NaN if none).
+    origin = np.full(len(columns.names['hash']), np.nan)
+    mask = columns.event_mask(event)
+    np.fmin.at(origin, columns.hash[mask], columns.t[mask])
+    return origin
+
+def propagation_delays(columns, kind='block'):
+    # Returns (delay per receipt, delay until the last receipt per item) for blocks
+    # (block_mined -> block_received) or transactions (txn_created -> txn_received).
+    origin_event, receive_event = ('block_mined', 'block_received') if kind == 'block' else ('txn_created', 'txn_received')
+    origin = first_time(columns, origin_event)
+    mask = columns.event_mask(receive_event)
+    hashes = columns.hash[mask]
+    delays = columns.t[mask] - origin[hashes]
+    known = ~np.isnan(delays)
+    delays, hashes = delays[known], hashes[known]
+
+    slowest = np.full(len(origin), -np.inf)
+    np.maximum.at(slowest, hashes, delays)
+    return delays, slowest[np.isfinite(slowest)]
+
+def block_heights(parent):
+    # Distance of every block from its oldest known ancestor, by pointer jumping:
+    # O(n log n) array operations instead of walking each chain.
+    height = (parent >= 0).astype(np.int64)
+    ancestor = parent.copy()
+    active = ancestor >= 0
+    while active.any():
+        jump = ancestor[active]
+        new_height = height.copy()
+        new_height[active] += height[jump]
+        ancestor[active] = ancestor[jump]
+        height = new_height
+        active = ancestor >= 0
+    return height
+
+def block_tree(columns):
+    # Returns (parent code per hash code, mask of hash codes that are mined blocks).
+    parent = np.full(len(columns.names['hash']), -1, dtype=np.int64)
+    mined = np.zeros(len(parent), dtype=bool)
+    for event in ('block_received', 'block_mined'):
+        mask = columns.event_mask(event)
+        parent[columns.hash[mask]] = columns.prev[mask]
+    mined[columns.hash[columns.event_mask('block_mined')]] = True
+    return parent, mined
+
+def stale_blocks(columns):
+    # Returns (mined blocks, mined blocks off the final longest chain).
+    parent, mined = block_tree(columns)
+    if not mined.any():
+        return 0, 0
+    height = block_heights(parent)
+    mined_time = first_time(columns, 'block_mined')
+    # Longest chain tip; among equal heights the first one mined wins
+    candidates = np.flatnonzero(mined)
+    tip = candidates[np.lexsort((mined_time[candidates], -height[candidates]))[0]]
+
+    on_chain = np.zeros(len(parent), dtype=bool)
+    node = tip
+    while node >= 0 and not on_chain[node]:
+        on_chain[node] = True
+        node = parent[node]
+    total = int(mined.sum())
+    return total, int((mined & ~on_chain).sum())
+
+def fork_depths(columns):
+    # Histogram of reorg depths: counts[d] = reorgs that disconnected d blocks.
+    depths = columns.size[columns.event_mask('reorg')]
+    return np.bincount(depths[depths >= 0]) if len(depths) else np.zeros(1, dtype=np.int64)
+
+def confirmation_latencies(columns):
+    return columns.value[columns.event_mask('txn_confirmed')]
+
+def throughput(columns, bin_seconds=1.0):
+    # Returns (bin start offsets, confirmed txns/s, blocks mined/s) over the trace.
+    if not len(columns):
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    start = columns.t[0]
+    edges = np.arange(0.0, columns.t[-1] - start + bin_seconds, bin_seconds)
+    if len(edges) < 2:
+        edges = np.array([0.0, bin_seconds])
+    confirmed, _ = np.histogram(columns.t[columns.event_mask('txn_confirmed')] - start, edges)
+    blocks, _ = np.histogram(columns.t[columns.event_mask('block_mined')] - start, edges)
+    return edges[:-1], confirmed / bin_seconds, blocks / bin_seconds
+
+def distribution(values):
+    # Count, mean and percentiles of a 1-D array (NaN-free).
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return {'count': 0}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {'count': int(len(values)), 'mean': float(values.mean()), 'p50': float(p50),
+            'p90': float(p90), 'p99': float(p99), 'max': float(values.max())}
+
+def analyse(columns, bin_seconds=1.0):
+    # Runs every analysis. Returns (summary dict of scalars, dict of result arrays).
+    block_delays, block_full = propagation_delays(columns, 'block')
+    txn_delays, txn_full = propagation_delays(columns, 'txn')
+    mined, stale = stale_blocks(columns)
+    depths = fork_depths(columns)
+    latencies = confirmation_latencies(columns)
+    bins, confirmed_tps, blocks_per_second = throughput(columns, bin_seconds)
+
+    duration = float(columns.t[-1] - columns.t[0]) if len(columns) else 0.0
+    summary = {
+        'events': len(columns),
+        'nodes': len(columns.names['node']),
+        'duration': duration,
+        'blocks_mined': mined,
+        'stale_blocks': stale,
+        'stale_rate': stale / mined if mined else 0.0,
+        'reorgs': int(depths[1:].sum()),
+        'max_fork_depth': int(len(depths) - 1),
+        'confirmed_tps': float(len(latencies) / duration) if duration else 0.0,
+    }
+    for prefix, values in (('block_propagation', block_delays), ('block_full_propagation', block_full),
+                           ('txn_propagation', txn_delays), ('confirmation_latency', latencies)):
+        for key, number in distribution(values).items():
+            summary[f"{prefix}_{key}"] = number
+
+    results = {
+        'block_propagation': block_delays,
+        'block_full_propagation': block_full,
+        'txn_propagation': txn_delays,
+        'confirmation_latency': latencies,
+        'fork_depths': depths,
+        'throughput': np.column_stack([bins, confirmed_tps, blocks_per_second]),
+    }
+    return summary, results
+
+def export_csv(directory, summary, results):
+    # One CSV per result array plus summary.csv.
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "summary.csv"), "w") as f:
+        f.write("metric,value\n")
+        for key, value in summary.items():
+            f.write(f"{key},{value}\n")
+    headers = {'fork_depths': "reorgs", 'throughput': "t,confirmed_tps,blocks_per_second"}
+    for name, values in results.items():
+        np.savetxt(os.path.join(directory, f"{name}.csv"), values, delimiter=",",
+                   header=headers.get(name, "seconds"), comments="")
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorised analytics over simulator event traces.")
+    parser.add_argument("trace", help="JSONL trace (optionally .gz) or a .npz saved with --npz")
+    parser.add_argument("--bin", type=float, default=1.0, help="throughput bin width in seconds")
+    parser.add_argument("--npz", help="save columns and results to this .npz file")
+    parser.add_argument("--csv", help="write result arrays as CSV files into this directory")
+    parser.add_argument("--no-cache", action="store_true", help="do not read or write <trace>.npz")
+    args = parser.parse_args()
+
+    columns = TraceColumns.load(args.trace, cache=not args.no_cache)
+    summary, results = analyse(columns, args.bin)
+    for key, value in summary.items():
+        print(f"[#] {key}: {value}")
+    if args.npz:
+        columns.save(args.npz, results)
+    if args.csv:
+        export_csv(args.csv, summary, results)
+
+if __name__ == '__main__':
+    main()
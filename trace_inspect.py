@@ -0,0 +1,86 @@
+import argparse
+import gzip
+import json
+import time
+from collections import Counter
+
+def load_trace(path):
+    # Reads a JSONL trace written by event_log.TraceWriter (plain or .gz).
+    opener = gzip.open if path.endswith(".gz") else open
+    records = []
+    with opener(path, "rt") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+    records.sort(key=lambda r: r['t'])
+    return records
+
+def build_timelines(records, node_prefix=None, events=None):
+    # Groups records into {node: [record, ...]} in timestamp order.
+    timelines = {}
+    for record in records:
+        if node_prefix and not str(record['node']).startswith(node_prefix):
+            continue
+        if events and record['event'] not in events:
+            continue
+        timelines.setdefault(record['node'], []).append(record)
+    return timelines
+
+def replay(records, handler, speed=None):
+    # Feeds records to handler(record) in timestamp order.
+    # With speed set, waits between records so the trace plays back at `speed` x real time.
+    if not records:
+        return
+    start_trace = records[0]['t']
+    start_wall = time.time()
+    for record in records:
+        if speed:
+            delay = (record['t'] - start_trace) / speed - (time.time() - start_wall)
+            if delay > 0:
+                time.sleep(delay)
+        handler(record)
+
+def describe(record, origin):
+    details = " ".join(f"{k}={v}" for k, v in record.items() if k not in ('t', 'level', 'node', 'event'))
+    return f"+{record['t'] - origin:10.3f}s  {record['level']:<7} {record['event']:<16} {details}"
+
+def print_summary(timelines):
+    for node, records in sorted(timelines.items()):
+        counts = Counter(r['event'] for r in records)
+        span = records[-1]['t'] - records[0]['t']
+        print(f"[#] Node {node}: {len(records)} events over {span:.3f}s")
+        for event, count in sorted(counts.items()):
+            print(f"      {event:<16} {count}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a simulator event trace.")
+    parser.add_argument("trace", help="JSONL trace file (optionally .gz)")
+    parser.add_argument("--node", help="only nodes whose id starts with this")
+    parser.add_argument("--event", nargs='+', help="only these event types")
+    parser.add_argument("--summary", action="store_true", help="print per-node event counts only")
+    parser.add_argument("--replay", type=float, metavar="SPEED",
+                        help="play the merged timeline back at SPEED x real time")
+    args = parser.parse_args()
+
+    records = load_trace(args.trace)
+    if not records:
+        print("[?] Empty trace")
+        return
+    origin = records[0]['t']
+    timelines = build_timelines(records, args.node, args.event)
+
+    if args.summary:
+        print_summary(timelines)
+    elif args.replay:
+        merged = sorted((r for rs in timelines.values() for r in rs), key=lambda r: r['t'])
+        replay(merged, lambda r: print(f"T: {r['node']} " + describe(r, origin)), args.replay)
+    else:
+        for node, node_records in sorted(timelines.items()):
+            print(f"##########---------- Node {node} ----------##########")
+            for record in node_records:
+                print(describe(record, origin))
+            print()
+
+if __name__ == '__main__':
+    main()
@@ -5,10 +5,15 @@ import settings
 
 class Txn:
     # Represents a transaction in the blockchain.
-    def __init__(self, inputs, outputs):
+    __slots__ = ('inputs', 'outputs', 'transaction_id')
+
+    def __init__(self, inputs, outputs, transaction_id=None):
         self.inputs = inputs
         self.outputs = outputs
-        self.transaction_id = self.calculate_id()
+        # A known id (e.g. read back from storage) skips re-hashing
+        if transaction_id is None:
+            transaction_id = self.calculate_id()
+        self.transaction_id = transaction_id
 
     def calculate_id(self):
         # Calculates the transaction ID by hashing the serialized data.
@@ -39,7 +44,8 @@ class Txn:
         # Creates a deep copy of the transaction.
         input_copies = [inp.clone() for inp in self.inputs]
         output_copies = [out.clone() for out in self.outputs]
-        return Txn(input_copies, output_copies)
+        # Same contents, same id: no need to hash them again
+        return Txn(input_copies, output_copies, self.transaction_id)
 
     def display(self, padding=""):
         # Prints the transaction details.
@@ -53,15 +59,15 @@ class Txn:
 
 
     @staticmethod
-    def create_coinbase_txn(keys):
-        # Creates a coinbase transaction (mining reward).
+    def create_coinbase_txn(keys, reward=None):
+        # Creates a coinbase transaction (mining reward; settings.MINING_REWARD by default).
         # Coinbase input has no previous transaction, so we use dummy values
         signature_script = generate_signature_script(keys, "I am inevitable")
         # '0'*64 is the null hash, -1 is the index
         inp = TxnInput('0'*64, -1, signature_script)
 
         locking_script = generate_pub_key_script(keys['public'])
-        out = TxnOutput(settings.MINING_REWARD, locking_script)
+        out = TxnOutput(settings.MINING_REWARD if reward is None else reward, locking_script)
 
         txn = Txn([inp], [out])
         return txn
@@ -2,10 +2,20 @@ from helpers import invert_bytes
 
 class TxnInput:
     # Represents an input in a transaction.
+    # The unlocking script (signature + public key) is held as raw bytes, half the size of
+    # its hex form; it is only read when verifying or serializing the input.
+    __slots__ = ('transaction_id', 'output_index', 'script')
+
     def __init__(self, transaction_id, output_index, unlocking_script):
         self.transaction_id = transaction_id
         self.output_index = output_index
-        self.unlocking_script = unlocking_script
+        if isinstance(unlocking_script, str):
+            unlocking_script = bytes.fromhex(unlocking_script)
+        self.script = unlocking_script
+
+    @property
+    def unlocking_script(self):
+        return self.script.hex()
 
     def serialize(self):
         # Serializes the transaction input data.
@@ -18,7 +28,7 @@ class TxnInput:
             vout_hex = '0' * (8 - len(vout_hex)) + vout_hex
         
         reversed_vout = invert_bytes(vout_hex)
-        script_size = hex(len(self.unlocking_script) // 2)[2:]
+        script_size = hex(len(self.script))[2:]
         
         # Ensure script size is properly formatted if needed (though hex() usually suffices for simple length)
         # Original code didn't pad script_size, but it's safer to ensure it's valid hex if needed.
@@ -28,7 +38,7 @@ class TxnInput:
 
     def clone(self):
         # Creates a copy of the input.
-        return TxnInput(self.transaction_id, self.output_index, self.unlocking_script)
+        return TxnInput(self.transaction_id, self.output_index, self.script)
     
     def display(self, padding=""):
         # Prints the input details.
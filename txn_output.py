@@ -1,10 +1,16 @@
+import sys
+
 from helpers import invert_bytes
 
 class TxnOutput:
     # Represents an output in a transaction.
+    __slots__ = ('amount', 'locking_script')
+
     def __init__(self, amount, locking_script):
         self.amount = amount
-        self.locking_script = locking_script
+        # Locking scripts repeat across every output paid to the same address, so equal
+        # scripts share one string. There is one per address, so the table stays small.
+        self.locking_script = sys.intern(locking_script)
 
     def serialize(self):
         # Serializes the transaction output data.
@@ -0,0 +1,47 @@
+from hashlib import sha256
+
+# MuHash-style set accumulator: every element is hashed to a number mod a prime and the
+# set's commitment is the product of its elements. Adding or removing one element is a
+# single modular multiplication (removals go into a separate denominator, so no inverse
+# is needed until the digest is read) and the result does not depend on update order,
+# so two nodes holding the same UTXO set always produce the same digest.
+
+PRIME = 2 ** 256 - 189  # largest prime below 2**256
+
+def _outpoint_element(transaction_id, output_index):
+    # An outpoint identifies the output completely, since the txid commits to its contents.
+    # A hash below 2**256 is nonzero mod PRIME except with negligible probability.
+    return int.from_bytes(sha256(f"{transaction_id}:{int(output_index)}".encode()).digest(), "big")
+
+class MuHash:
+    def __init__(self):
+        self.numerator = 1
+        self.denominator = 1
+        self.cached_digest = None
+
+    def add_outpoint(self, transaction_id, output_index):
+        self.numerator = self.numerator * _outpoint_element(transaction_id, output_index) % PRIME
+        self.cached_digest = None
+
+    def remove_outpoint(self, transaction_id, output_index):
+        self.denominator = self.denominator * _outpoint_element(transaction_id, output_index) % PRIME
+        self.cached_digest = None
+
+    def digest(self):
+        # 32-byte hex commitment to the current set.
+        if self.cached_digest is None:
+            # One modular inverse per read; later reads reuse the folded value
+            self.numerator = self.numerator * pow(self.denominator, -1, PRIME) % PRIME
+            self.denominator = 1
+            self.cached_digest = self.numerator.to_bytes(32, "big").hex()
+        return self.cached_digest
+
+    def copy(self):
+        other = MuHash()
+        other.numerator = self.numerator
+        other.denominator = self.denominator
+        other.cached_digest = self.cached_digest
+        return other
+
+if __name__ == '__main__':
+    pass
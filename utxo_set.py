@@ -1,5 +1,32 @@
+from utxo_commitment import MuHash
+
+class UtxoEntry:
+    # A stored transaction and a bitmask of its unspent outputs (bit i set: vout i unspent).
+    __slots__ = ('txn', 'unspent')
+
+    def __init__(self, txn, unspent):
+        self.txn = txn
+        self.unspent = unspent
+
+    def vouts(self):
+        # Unspent output indices, ascending.
+        vouts = []
+        unspent = self.unspent
+        vout = 0
+        while unspent:
+            if unspent & 1:
+                vouts.append(vout)
+            unspent >>= 1
+            vout += 1
+        return vouts
+
+    def __repr__(self):
+        return f"{{'vout': {self.vouts()}, 'txn': {self.txn!r}}}"
+
 class UtxoNode:
     # Node for the UTXO Trie.
+    __slots__ = ('children', 'end_list')
+
     def __init__(self):
         self.children = {}
         self.end_list = {}
@@ -12,6 +39,10 @@ class UtxoSet:
     def __init__(self, depth=2):
         self.depth = depth
         self.root_node = UtxoNode()
+        # Number of unspent outputs currently held
+        self.size = 0
+        # Order-independent digest of the unspent outpoints, updated on every change
+        self.commitment = MuHash()
 
     def add_transaction(self, txn, node=None, index=0):
         # Adds a transaction to the UTXO set.
@@ -20,10 +51,15 @@ class UtxoSet:
 
         if index == self.depth:
             # Store transaction and all its outputs as unspent initially
-            node.end_list[txn.transaction_id] = {
-                'vout': [x for x in range(len(txn.outputs))],
-                'txn': txn
-            }
+            previous = node.end_list.get(txn.transaction_id)
+            if previous is not None:
+                for vout in previous.vouts():
+                    self.size -= 1
+                    self.commitment.remove_outpoint(txn.transaction_id, vout)
+            self.size += len(txn.outputs)
+            for vout in range(len(txn.outputs)):
+                self.commitment.add_outpoint(txn.transaction_id, vout)
+            node.end_list[txn.transaction_id] = UtxoEntry(txn, (1 << len(txn.outputs)) - 1)
             return
 
         char = txn.transaction_id[index]
@@ -32,21 +68,30 @@ class UtxoSet:
 
         self.add_transaction(txn, node.children[char], index+1)
 
-    def add_output(self, transaction_id, output_index, node=None, index=0):
-        # Adds a specific output back to the UTXO set (e.g., during reorg).
+    def add_output(self, transaction_id, output_index, txn=None, node=None, index=0):
+        # Adds a specific output back to the UTXO set (e.g., during reorg). If every
+        # output of the transaction had been spent its entry is gone, and is re-created
+        # from `txn` (the block's undo data).
         if index == 0:
             node = self.root_node
 
         if index == self.depth:
-            if transaction_id in node.end_list:
-                node.end_list[transaction_id]['vout'].append(output_index)
+            entry = node.end_list.get(transaction_id)
+            if entry is None and txn is not None:
+                entry = node.end_list[transaction_id] = UtxoEntry(txn, 0)
+            if entry is not None:
+                bit = 1 << int(output_index)
+                if not entry.unspent & bit:
+                    entry.unspent |= bit
+                    self.size += 1
+                    self.commitment.add_outpoint(transaction_id, output_index)
             return
 
         char = transaction_id[index]
         if char not in node.children:
             node.children[char] = UtxoNode()
 
-        self.add_output(transaction_id, output_index, node.children[char], index+1)
+        self.add_output(transaction_id, output_index, txn, node.children[char], index+1)
 
     def has_output(self, transaction_id, output_index, node=None, index=0):
         # Checks if a specific output exists in the UTXO set.
@@ -54,10 +99,9 @@ class UtxoSet:
             node = self.root_node
 
         if index == self.depth:
-            if transaction_id in node.end_list:
-                if output_index in node.end_list[transaction_id]['vout']:
-                    return True
-            return False
+            entry = node.end_list.get(transaction_id)
+            output_index = int(output_index)
+            return entry is not None and output_index >= 0 and bool(entry.unspent >> output_index & 1)
 
         char = transaction_id[index]
         if char not in node.children:
@@ -72,7 +116,7 @@ class UtxoSet:
 
         if index == self.depth:
             if transaction_id in node.end_list:
-                return node.end_list[transaction_id]['txn']
+                return node.end_list[transaction_id].txn
             return False
 
         char = transaction_id[index]
@@ -82,21 +126,29 @@ class UtxoSet:
         return self.get_transaction(transaction_id, node.children[char], index+1)
 
     def remove_output(self, transaction_id, output_index, node=None, index=0):
-        # Removes a specific output from the UTXO set (marks as spent).
+        # Removes a specific output from the UTXO set (marks as spent). Returns the
+        # transaction it belonged to, or None if the output was not unspent. A transaction
+        # whose last output is spent is dropped, so the set does not grow with history.
         if index == 0:
             node = self.root_node
 
         if index == self.depth:
-            if transaction_id in node.end_list:
-                if output_index in node.end_list[transaction_id]['vout']:
-                    node.end_list[transaction_id]['vout'].remove(output_index)
-            return
+            entry = node.end_list.get(transaction_id)
+            output_index = int(output_index)
+            if entry is not None and output_index >= 0 and entry.unspent >> output_index & 1:
+                entry.unspent &= ~(1 << output_index)
+                self.size -= 1
+                self.commitment.remove_outpoint(transaction_id, output_index)
+                if not entry.unspent:
+                    del node.end_list[transaction_id]
+                return entry.txn
+            return None
 
         char = transaction_id[index]
         if char not in node.children:
-            return
+            return None
 
-        self.remove_output(transaction_id, output_index, node.children[char], index+1)
+        return self.remove_output(transaction_id, output_index, node.children[char], index+1)
 
     def remove_transaction(self, txn, node=None, index=0):
         # Removes an entire transaction from the UTXO set.
@@ -104,7 +156,10 @@ class UtxoSet:
             node = self.root_node
         if index == self.depth:
             if txn.transaction_id in node.end_list:
-                node.end_list.pop(txn.transaction_id, None)
+                entry = node.end_list.pop(txn.transaction_id)
+                for vout in entry.vouts():
+                    self.size -= 1
+                    self.commitment.remove_outpoint(txn.transaction_id, vout)
             return
         
         char = txn.transaction_id[index]
@@ -113,6 +168,45 @@ class UtxoSet:
 
         self.remove_transaction(txn, node.children[char], index+1)
 
+    def entries(self, node=None, index=0):
+        # Yields (txn, unspent vouts) for every stored transaction.
+        if index == 0:
+            node = self.root_node
+
+        if index == self.depth:
+            for entry in list(node.end_list.values()):
+                yield entry.txn, entry.vouts()
+            return
+
+        for key in list(node.children):
+            yield from self.entries(node.children[key], index+1)
+
+    def load_entries(self, entries):
+        # Bulk-loads (txn, unspent vouts) pairs, e.g. from a checkpoint.
+        for txn, vouts in entries:
+            self.add_transaction(txn)
+            for vout in range(len(txn.outputs)):
+                if vout not in vouts:
+                    self.remove_output(txn.transaction_id, vout)
+
+    def copy(self):
+        other = UtxoSet(self.depth)
+        other.load_entries(self.entries())
+        return other
+
+    def digest(self):
+        # Commitment to the set's unspent outputs; equal sets give equal digests.
+        return self.commitment.digest()
+
+    def find_outputs(self, locking_script):
+        # Returns [(txnid, vout), ...] of unspent outputs locked to the given script.
+        found = []
+        for txn, vouts in self.entries():
+            for vout in vouts:
+                if txn.outputs[vout].locking_script == locking_script:
+                    found.append((txn.transaction_id, vout))
+        return found
+
     def display(self, node=None, index=0):
         # Prints the UTXO set content.
         if index == 0:
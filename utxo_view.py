@@ -0,0 +1,69 @@
+class UtxoView:
+    # Read-through layer over a UtxoSet holding the effect of unconfirmed transactions:
+    # outputs they create and outputs they spend. Nothing is copied from the base set, so
+    # a view is cheap to build (per block template, per block being validated) and the
+    # node's mempool view can simply be rebuilt when its pool changes.
+    def __init__(self, base):
+        self.base = base
+        # txid -> transaction created in this layer
+        self.created = {}
+        # (txid, vout) -> txid of the layer transaction spending it
+        self.spent = {}
+
+    def __len__(self):
+        return len(self.created)
+
+    def contains(self, transaction_id):
+        return transaction_id in self.created
+
+    def has_output(self, transaction_id, output_index):
+        output_index = int(output_index)
+        if (transaction_id, output_index) in self.spent:
+            return False
+        txn = self.created.get(transaction_id)
+        if txn is not None:
+            return 0 <= output_index < len(txn.outputs)
+        return self.base.has_output(transaction_id, output_index)
+
+    def get_transaction(self, transaction_id):
+        txn = self.created.get(transaction_id)
+        if txn is not None:
+            return txn
+        return self.base.get_transaction(transaction_id)
+
+    def get_output(self, transaction_id, output_index):
+        # The unspent TxnOutput, or None if it is missing or already spent.
+        if not self.has_output(transaction_id, output_index):
+            return None
+        return self.get_transaction(transaction_id).outputs[int(output_index)]
+
+    def add_transaction(self, txn):
+        # Applies an unconfirmed transaction: spends its inputs and adds its outputs.
+        for inp in txn.inputs:
+            self.spent[(inp.transaction_id, int(inp.output_index))] = txn.transaction_id
+        self.created[txn.transaction_id] = txn
+
+    def remove_transaction(self, txn):
+        if self.created.pop(txn.transaction_id, None) is None:
+            return
+        for inp in txn.inputs:
+            outpoint = (inp.transaction_id, int(inp.output_index))
+            if self.spent.get(outpoint) == txn.transaction_id:
+                del self.spent[outpoint]
+
+    def clear(self):
+        self.created = {}
+        self.spent = {}
+
+    def rebuild(self, pool):
+        # Re-applies the pool (in order) on top of the current base set, leaving out
+        # transactions whose inputs are no longer available, e.g. after a block spent them.
+        self.clear()
+        for txn in pool:
+            if txn.transaction_id in self.created:
+                continue
+            if all(self.has_output(inp.transaction_id, inp.output_index) for inp in txn.inputs):
+                self.add_transaction(txn)
+
+if __name__ == '__main__':
+    pass
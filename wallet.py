@@ -0,0 +1,89 @@
+from ecdsa import SigningKey, SECP256k1
+
+import helpers
+import transaction_data
+import txn_input
+import txn_output
+
+class Wallet:
+    # The spending side of one key pair: the private key, parsed once into a SigningKey,
+    # and the outpoints paid to it (confirmed or still in the mempool), oldest first.
+    # Payments are built against a mempool view (utxo_view.UtxoView): an outpoint is
+    # spendable while the view has it, and each transaction built goes into the view at
+    # once, so later payments (in the same batch or not) never select its inputs again
+    # and can spend its change. Outpoints are kept until a main-chain block spends them
+    # (forget_spent): if a payment leaves the pool unconfirmed, its inputs are spendable
+    # again.
+    def __init__(self, keys):
+        self.keys = keys
+        self.signing_key = SigningKey.from_string(bytes.fromhex(keys['private']), curve=SECP256k1)
+        self.pub_key_hash = helpers.compute_hash160(keys['public'])
+        self.outpoints = {} # (txid, vout) -> True
+
+    def __len__(self):
+        return len(self.outpoints)
+
+    def receive(self, outpoint):
+        self.outpoints.setdefault(outpoint, True)
+
+    def reset(self, outpoints):
+        # Replaces the tracked outpoints, e.g. with the UTXO set's after a resync.
+        self.outpoints = dict.fromkeys(outpoints, True)
+
+    def forget_spent(self, block):
+        # Drops the outpoints a newly connected main-chain block spent.
+        for txn in block.transactions[1:]:
+            for inp in txn.inputs:
+                self.outpoints.pop((inp.transaction_id, int(inp.output_index)), None)
+
+    def sign(self, message):
+        # Unlocking script for an input signing `message` (a string): signature + public key,
+        # as helpers.generate_signature_script builds it.
+        return self.signing_key.sign(message.encode()).hex() + self.keys['public']
+
+    def select_inputs(self, amount, view):
+        # Oldest spendable outpoints adding up to at least amount -> (outpoints, total).
+        selected = []
+        total = 0
+        for txid, vout in self.outpoints:
+            if total >= amount:
+                break
+            if view.has_output(txid, vout):
+                total += view.get_transaction(txid).outputs[vout].amount
+                selected.append((txid, vout))
+        return selected, total
+
+    def build_payment(self, payments, view):
+        # One transaction paying every (address, amount) in payments, in order, with any
+        # change back to us as the last output. None if the funds do not cover it.
+        amount = sum(value for _, value in payments)
+        selected, total = self.select_inputs(amount, view)
+        if not selected or total < amount:
+            return None
+
+        outputs = [txn_output.TxnOutput(value, address) for address, value in payments]
+        if total > amount:
+            outputs.append(txn_output.TxnOutput(total - amount, self.pub_key_hash))
+        # An input signs the id of the transaction it spends from, so inputs spending
+        # outputs of the same transaction share one signature
+        scripts = {}
+        inputs = []
+        for txid, vout in selected:
+            script = scripts.get(txid)
+            if script is None:
+                script = scripts[txid] = self.sign(txid)
+            inputs.append(txn_input.TxnInput(txid, vout, script))
+        txn = transaction_data.Txn(inputs, outputs)
+
+        if total > amount:
+            self.outpoints[(txn.transaction_id, len(outputs) - 1)] = True
+        view.add_transaction(txn)
+        return txn
+
+    def build_payments(self, payments, view):
+        # One transaction per (address, amount), in order; None for each payment the
+        # funds left by the ones before it do not cover.
+        return [self.build_payment([payment], view) for payment in payments]
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,324 @@
+import argparse
+import math
+import random
+import threading
+import time
+
+import settings
+import metrics
+import event_log
+from p2p_network import PeerNetwork
+
+ARRIVALS = ('poisson', 'bursty', 'replay')
+AMOUNTS = ('constant', 'uniform', 'exponential')
+
+class WorkloadGenerator:
+    # Drives Miner.create_transaction by injecting "new_txn" messages on a schedule.
+    #
+    # arrival: 'poisson' (exponential gaps at `rate` txns/sec), 'bursty' (groups of
+    #          `burst_size` txns with idle gaps keeping the same mean rate) or 'replay'
+    #          (schedule read from `replay_file`).
+    # num_wallets: how many nodes take part (default: every node).
+    # fan_out: distinct payees per payer; fan_in: distinct payers per payee.
+    #          Both default to a complete graph between the participating wallets.
+    # amount: 'constant', 'uniform' (1..2*mean_amount-1) or 'exponential' around mean_amount.
+    def __init__(self, network=PeerNetwork, arrival='poisson', rate=1.0, duration=30.0,
+                 num_wallets=None, fan_in=None, fan_out=None, amount='uniform', mean_amount=2,
+                 burst_size=10, replay_file=None, seed=None, sample_interval=0.5, verbose=False):
+        if arrival not in ARRIVALS:
+            raise ValueError(f"Unknown arrival process: {arrival}")
+        if amount not in AMOUNTS:
+            raise ValueError(f"Unknown amount distribution: {amount}")
+        if num_wallets is not None and num_wallets < 2:
+            raise ValueError(f"A workload needs at least 2 wallets, got {num_wallets}")
+
+        self.network = network
+        self.arrival = arrival
+        self.rate = rate
+        self.duration = duration
+        self.num_wallets = num_wallets
+        self.fan_in = fan_in
+        self.fan_out = fan_out
+        self.amount = amount
+        self.mean_amount = mean_amount
+        self.burst_size = burst_size
+        self.replay_file = replay_file
+        self.sample_interval = sample_interval
+        self.verbose = verbose
+        self.rng = random.Random(seed)
+
+        self.fixed_schedule = None
+        self.injected = 0
+        self.backlog_samples = []
+        # Whether all nodes agreed on tip and UTXO set, at each sample
+        self.convergence_samples = []
+        self.started_at = None
+        self.finished_at = None
+
+    @staticmethod
+    def from_schedule(schedule, network=PeerNetwork, verbose=False):
+        # Builds a generator replaying a fixed list of (offset, from_index, to_index, amount).
+        generator = WorkloadGenerator(network, arrival='replay', verbose=verbose)
+        generator.fixed_schedule = sorted(schedule)
+        return generator
+
+    @staticmethod
+    def load_schedule(path):
+        # Reads "offset from_index to_index amount" lines (whitespace or comma separated).
+        schedule = []
+        with open(path) as f:
+            for line in f:
+                line = line.split('#', 1)[0].replace(',', ' ').strip()
+                if not line:
+                    continue
+                offset, from_index, to_index, amount = line.split()
+                schedule.append((float(offset), int(from_index), int(to_index), int(amount)))
+        return sorted(schedule)
+
+    def payment_graph(self):
+        # Returns {payer_index: [payee_index, ...]} over the participating wallets.
+        num_nodes = len(self.network.nodes)
+        num_wallets = self.num_wallets or num_nodes
+        if not 2 <= num_wallets <= num_nodes:
+            raise ValueError(f"Need 2 <= wallets <= {num_nodes} nodes, got {num_wallets}")
+        wallets = list(range(num_wallets))
+        if self.fan_in is None and self.fan_out is None:
+            return {w: [x for x in wallets if x != w] for w in wallets}
+
+        fan_in = self.fan_in or 1
+        fan_out = self.fan_out or 1
+        # Split wallets so that payers * fan_out ~= payees * fan_in
+        num_payers = max(1, min(num_wallets - 1, round(num_wallets * fan_in / (fan_in + fan_out))))
+        payers = wallets[:num_payers]
+        payees = wallets[num_payers:]
+        graph = {}
+        for i, payer in enumerate(payers):
+            graph[payer] = [payees[(i * fan_out + j) % len(payees)] for j in range(min(fan_out, len(payees)))]
+        return graph
+
+    def draw_amount(self):
+        if self.amount == 'constant':
+            return self.mean_amount
+        if self.amount == 'uniform':
+            return self.rng.randint(1, max(1, 2 * self.mean_amount - 1))
+        return max(1, int(round(self.rng.expovariate(1.0 / self.mean_amount))))
+
+    def arrival_times(self):
+        # Yields injection offsets (seconds from start) up to the configured duration.
+        offset = 0.0
+        if self.arrival == 'poisson':
+            while True:
+                offset += self.rng.expovariate(self.rate)
+                if offset >= self.duration:
+                    return
+                yield offset
+        else:
+            # Bursts arrive as a Poisson process at rate / burst_size
+            while True:
+                offset += self.rng.expovariate(self.rate / self.burst_size)
+                if offset >= self.duration:
+                    return
+                for _ in range(self.burst_size):
+                    yield offset
+
+    def schedule(self):
+        # Returns the sorted list of (offset, from_index, to_index, amount) to inject.
+        if self.fixed_schedule is not None:
+            return self.fixed_schedule
+        if self.arrival == 'replay':
+            return WorkloadGenerator.load_schedule(self.replay_file)
+
+        graph = self.payment_graph()
+        payers = sorted(graph)
+        schedule = []
+        for offset in self.arrival_times():
+            payer = self.rng.choice(payers)
+            schedule.append((offset, payer, self.rng.choice(graph[payer]), self.draw_amount()))
+        return schedule
+
+    def inject(self, from_index, to_index, amount):
+        # Asks node `from_index` to pay node `to_index`.
+        nodes = self.network.nodes
+        nodes[from_index].send_message(("new_txn", (nodes[to_index].pub_key_hash, amount)))
+        self.injected += 1
+
+        if self.verbose:
+            print("[****************------ CREATING-TXN-----************]")
+            print("[#] From: ", nodes[from_index].pub_key_hash)
+            print("[#] To: ", nodes[to_index].pub_key_hash)
+            print("[+] Amount: ", amount)
+
+    def pool_backlog(self):
+        # Transactions waiting in node pools, averaged over nodes.
+        nodes = self.network.nodes
+        return sum(len(n.waiting_txn_pool) for n in nodes) / max(1, len(nodes))
+
+    def _sample_backlog(self, stop):
+        while not stop.wait(self.sample_interval):
+            self.backlog_samples.append((time.time() - self.started_at, self.pool_backlog()))
+            self.convergence_samples.append(self.network.converged())
+
+    def run(self):
+        # Injects the whole schedule in real time; returns when the last message is sent.
+        schedule = self.schedule()
+        self.started_at = time.time()
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample_backlog, args=(stop, ), daemon=True)
+        sampler.start()
+
+        for offset, from_index, to_index, amount in schedule:
+            delay = offset - (time.time() - self.started_at)
+            if delay > 0:
+                time.sleep(delay)
+            self.inject(from_index, to_index, amount)
+
+        stop.set()
+        sampler.join()
+        self.finished_at = time.time()
+
+    def report(self, elapsed=None):
+        # Summarises throughput, confirmation latency and pool backlog for the run so far.
+        if elapsed is None:
+            elapsed = time.time() - self.started_at
+        nodes = self.network.nodes
+        latencies = sorted(lat for n in nodes for (_, lat) in n.confirmation_log)
+        created = len(latencies) + sum(len(n.created_txn_ids) for n in nodes)
+
+        backlog = [b for (_, b) in self.backlog_samples]
+        window = (self.finished_at or time.time()) - self.started_at
+        return {
+            'offered_tps': self.injected / window if window > 0 else 0.0,
+            'injected': self.injected,
+            'created': created,
+            'confirmed': len(latencies),
+            'confirmed_tps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p90': percentile(latencies, 90),
+            'latency_p99': percentile(latencies, 99),
+            'backlog_mean': sum(backlog) / len(backlog) if backlog else 0.0,
+            'backlog_max': max(backlog) if backlog else 0.0,
+            'backlog_final': self.pool_backlog(),
+            'converged_fraction': (sum(self.convergence_samples) / len(self.convergence_samples)
+                                   if self.convergence_samples else None),
+            'converged': self.network.converged(),
+        }
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list (None when empty).
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def chain_params(arity=None, bits=None, prune_depth=None, utxo_backend=None):
+    # settings.ChainParams with the given values, the module settings for the rest.
+    values = {'MERKLE_TREE_ARITY': arity, 'BITS': bits, 'PRUNE_DEPTH': prune_depth,
+              'UTXO_BACKEND': utxo_backend}
+    return settings.ChainParams(**{name: value for name, value in values.items() if value is not None})
+
+def run_workload(num_nodes, arity=None, settle=10.0, metrics_port=None, metrics_json=None,
+                 trace=None, store_root=None, key_seed=None, keystore_path=None, prune_depth=None,
+                 utxo_backend=None, profile=None, load_snapshot=None, save_snapshot=None,
+                 bits=None, network=PeerNetwork, **workload_options):
+    # Stands up a fresh network (or restores the one saved in load_snapshot), runs one
+    # workload against it and returns the report. save_snapshot saves the final network.
+    import simulation
+    import sim_snapshot
+
+    if load_snapshot is not None:
+        # The snapshot's chain settings replace arity, bits, prune_depth and utxo_backend
+        sim_snapshot.load(load_snapshot, network)
+    else:
+        params = chain_params(arity, bits, prune_depth, utxo_backend)
+        simulation.setup_network(num_nodes, store_root, key_seed, keystore_path, network, params)
+    threads = simulation.start_miners(network.nodes)
+    sampler = simulation.start_profiling(network.nodes) if profile is not None else None
+
+    exporters = []
+    if trace is not None:
+        exporters.append(event_log.TraceWriter(path=trace).start())
+    if metrics_port is not None:
+        server = metrics.MetricsServer(network, port=metrics_port).start()
+        print(f"[#] Metrics at http://{server.host}:{server.port}/metrics")
+        exporters.append(server)
+    if metrics_json is not None:
+        exporters.append(metrics.JsonSnapshotWriter(network, metrics_json).start())
+
+    generator = WorkloadGenerator(network, **workload_options)
+    generator.run()
+    # Give in-flight transactions a chance to confirm before measuring
+    time.sleep(settle)
+    result = generator.report(time.time() - generator.started_at)
+
+    if sampler is not None:
+        simulation.stop_profiling(sampler, profile)
+    simulation.stop_miners(network.nodes, threads, timeout=10)
+    for exporter in exporters:
+        exporter.stop()
+    if save_snapshot is not None:
+        size = sim_snapshot.save(save_snapshot, network)
+        print(f"[#] Network snapshot ({size} bytes) written to {save_snapshot}")
+    return result
+
+def find_saturation(num_nodes, rates, arity=None, tolerance=0.8, **workload_options):
+    # Increases the offered rate until fewer than `tolerance` of the injected payments confirm.
+    results = []
+    for rate in rates:
+        result = run_workload(num_nodes, arity, rate=rate, **workload_options)
+        result['rate'] = rate
+        results.append(result)
+        if result['confirmed'] < tolerance * result['injected']:
+            return rate, results
+    return None, results
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test a simulated network.")
+    parser.add_argument("--nodes", type=int, default=5)
+    parser.add_argument("--arity", type=int, default=settings.MERKLE_TREE_ARITY)
+    parser.add_argument("--bits", type=int, help="difficulty (default: settings.BITS)")
+    parser.add_argument("--rate", type=float, nargs='+', default=[1.0],
+                        help="offered txns/sec; several values search for the saturation point")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--settle", type=float, default=10.0)
+    parser.add_argument("--arrival", choices=ARRIVALS, default='poisson')
+    parser.add_argument("--burst-size", type=int, default=10)
+    parser.add_argument("--replay-file")
+    parser.add_argument("--wallets", type=int)
+    parser.add_argument("--fan-in", type=int)
+    parser.add_argument("--fan-out", type=int)
+    parser.add_argument("--amount", choices=AMOUNTS, default='uniform')
+    parser.add_argument("--mean-amount", type=int, default=2)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on localhost")
+    parser.add_argument("--metrics-json", help="append periodic JSON metric snapshots to this file")
+    parser.add_argument("--trace", help="write the event trace (JSONL, .gz to compress) to this file")
+    parser.add_argument("--store", help="persist node state here and resume from it on the next run")
+    parser.add_argument("--key-seed", help="derive node keys from this seed for reproducible addresses")
+    parser.add_argument("--keystore", help="cache derived keys in this file (default: <store>/keystore.json)")
+    parser.add_argument("--prune-depth", type=int,
+                        help="keep block bodies only for this many main-chain blocks below the tip")
+    parser.add_argument("--utxo-backend", choices=('trie', 'persistent'),
+                        help="UTXO set backend (default: settings.UTXO_BACKEND)")
+    parser.add_argument("--profile", metavar="PREFIX",
+                        help="sample node threads and write <PREFIX>.wall.folded / .cpu.folded")
+    parser.add_argument("--load-snapshot", help="start from the network saved in this snapshot file")
+    parser.add_argument("--save-snapshot", help="save the network to this snapshot file (.gz to compress) at the end")
+    args = parser.parse_args()
+
+    options = dict(arrival=args.arrival, duration=args.duration, settle=args.settle,
+                   burst_size=args.burst_size, replay_file=args.replay_file,
+                   num_wallets=args.wallets, fan_in=args.fan_in, fan_out=args.fan_out,
+                   amount=args.amount, mean_amount=args.mean_amount, seed=args.seed,
+                   metrics_port=args.metrics_port, metrics_json=args.metrics_json, trace=args.trace,
+                   store_root=args.store, key_seed=args.key_seed, keystore_path=args.keystore,
+                   prune_depth=args.prune_depth, utxo_backend=args.utxo_backend, profile=args.profile,
+                   load_snapshot=args.load_snapshot, save_snapshot=args.save_snapshot, bits=args.bits)
+    saturation, results = find_saturation(args.nodes, args.rate, args.arity, **options)
+
+    for result in results:
+        print(f"[#] rate={result['rate']}: " + ", ".join(f"{k}={v}" for k, v in result.items() if k != 'rate'))
+    if len(args.rate) > 1:
+        print(f"[#] Saturation point: {saturation if saturation is not None else 'not reached'}")
+
+if __name__ == '__main__':
+    main()